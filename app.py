@@ -1,26 +1,32 @@
-from flask import Flask, render_template, request, jsonify, redirect, url_for, send_file, send_from_directory
+import time
+_import_started = time.perf_counter()
+
+from flask import Flask, render_template, request, jsonify, redirect, url_for, send_file, send_from_directory, Response
 import os
 import cv2
 import numpy as np
 import json
 import base64
-from PIL import Image
-import io
-import google.generativeai as genai
 from datetime import datetime
 import sqlite3
 import logging
-from functools import lru_cache
+import threading
+from functools import lru_cache, wraps
 from werkzeug.utils import secure_filename
-from ultralytics import YOLO
-import torch
-import torchvision
 from dotenv import load_dotenv
 from utils.calibration import calibrator
 from utils.measurement_detector import MeasurementDetector
-from utils.rcnn_measurement_system import RCNNMeasurementSystem
+from utils.inference_service import InferenceClient
+from utils.startup import StartupProfiler
+from utils import readiness
+from utils.readiness import ModelReadiness
+from utils.stream_session import StreamManager
+from utils.container_geometry import container_key
+from utils.upload_store import UploadStore
+from utils.model_store import MODEL_PATH, MODEL_URL, ModelStore
+from utils.admission import InferenceGate, Saturated, configure_threads, thread_budget
+from utils import metrics as pipeline_metrics
 import requests
-import gdown
 
 # Import our database modules
 from database.ingredients_db import get_all_ingredients, get_ingredient_by_name, get_all_measurements, get_measurement_by_name, init_ingredients_db
@@ -34,71 +40,241 @@ load_dotenv()
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
+# Heavy dependencies (torch, torchvision, google.generativeai, gdown) are
+# imported lazily when the models are first built, so importing this module
+# stays fast and the health check can answer immediately
+startup_profiler = StartupProfiler(budget_seconds=float(os.getenv('STARTUP_BUDGET_SECONDS', '5')),
+                                   started=_import_started)
+startup_profiler.record('imports', time.perf_counter() - _import_started)
+
 app = Flask(__name__)
 app.config['UPLOAD_FOLDER'] = 'static/uploads'
 app.config['MAX_CONTENT_LENGTH'] = 16 * 1024 * 1024  # 16MB max file size
+# Measurement frames are processed in memory; set PERSIST_UPLOADS=true to also
+# keep the uploaded images and their debug renderings in the upload folder
+app.config['PERSIST_UPLOADS'] = os.getenv('PERSIST_UPLOADS', 'false').lower() in ('1', 'true', 'yes')
 
-# Ensure upload directory exists
-os.makedirs(app.config['UPLOAD_FOLDER'], exist_ok=True)
+# Uploads are stored under their content hash; the sweeper bounds the folder
+# (uploads and debug renderings) by age and total size
+upload_store = UploadStore(app.config['UPLOAD_FOLDER'],
+                           max_age_seconds=float(os.getenv('UPLOAD_MAX_AGE_HOURS', '72')) * 3600,
+                           max_bytes=int(float(os.getenv('UPLOAD_MAX_MB', '1024')) * 1024 * 1024),
+                           sweep_interval=float(os.getenv('UPLOAD_SWEEP_SECONDS', '600')))
+upload_store.start_sweeper()
 os.makedirs('static/images/ingredients', exist_ok=True)
 os.makedirs('static/images/recipes', exist_ok=True)
 
-# Initialize Gemini Pro Vision
+# Gemini Pro Vision API key; the client itself is created on first use
 GOOGLE_API_KEY = os.getenv('GOOGLE_API_KEY')
 if not GOOGLE_API_KEY:
     raise ValueError("GOOGLE_API_KEY environment variable is not set")
 
-# Configure Gemini API with the API key
-genai.configure(api_key=GOOGLE_API_KEY)
 
-# Initialize models
-model = genai.GenerativeModel('models/gemini-1.5-pro')
-chat_model = genai.GenerativeModel('models/gemini-1.5-pro')
+# When INFERENCE_SERVICE_ADDRESS is set the RCNN model lives in the shared
+# inference service (utils/inference_service.py) instead of every web worker
+INFERENCE_SERVICE_ADDRESS = os.getenv('INFERENCE_SERVICE_ADDRESS')
 
-# Initialize RCNN measurement system
-try:
-    checkpoint_path = os.path.join('models', 'checkpoint.pth')
-    if not os.path.exists(checkpoint_path):
-        logger.warning(f"No checkpoint found at {checkpoint_path}. Using default model.")
-        rcnn_measurement = RCNNMeasurementSystem()
-    else:
-        logger.info(f"Loading checkpoint from {checkpoint_path}")
-        rcnn_measurement = RCNNMeasurementSystem(checkpoint_path)
-except Exception as e:
-    logger.error(f"Error initializing RCNN: {e}")
-    logger.info("Initializing RCNN with default model")
-    rcnn_measurement = RCNNMeasurementSystem()
+# Measurement implementation: rcnn, legacy_rcnn, resnet, contour or cascade
+# (see utils/measurement_engine.py)
+MEASUREMENT_ENGINE = os.getenv('MEASUREMENT_ENGINE', 'rcnn')
 
-# Initialize YOLOv8 model
-yolo_model = YOLO('yolov8n.pt')
+# Admission control: per web worker at most INFERENCE_CONCURRENCY requests
+# run the model at once (default: the RCNN micro-batch size so batches can
+# still fill), INFERENCE_QUEUE more wait up to INFERENCE_QUEUE_TIMEOUT seconds
+# and anything beyond that gets a fast 503 with Retry-After
+INFERENCE_CONCURRENCY = int(os.getenv('INFERENCE_CONCURRENCY', os.getenv('RCNN_MAX_BATCH_SIZE', '4')))
+inference_gate = InferenceGate(max_concurrent=INFERENCE_CONCURRENCY,
+                               max_queue=int(os.getenv('INFERENCE_QUEUE', '4')),
+                               queue_timeout=float(os.getenv('INFERENCE_QUEUE_TIMEOUT', '5')))
+
+# Models are built lazily on first use, or by the background warm-up thread
+_gemini_model = None
+_rcnn_measurement = None
+_gemini_lock = threading.Lock()
+_rcnn_lock = threading.Lock()
+model_readiness = ModelReadiness()
 
 # Initialize measurement detector
 measurement_detector = MeasurementDetector()
 
+# Live measurement sessions fed with webcam frames (see /api/stream)
+stream_manager = StreamManager(max_sessions=int(os.getenv('STREAM_MAX_SESSIONS', '4')),
+                               idle_timeout=float(os.getenv('STREAM_IDLE_SECONDS', '60')))
+
 # Cache for frequently accessed data
 @lru_cache(maxsize=100)
 def get_cached_ingredients():
     return [ingredient['name'] for ingredient in get_all_ingredients()]
 
-# Model download configuration
-MODEL_PATH = 'models/checkpoint.pth'
-MODEL_URL = 'https://drive.google.com/uc?id=1VaB9qmln89nWr74fhceatvvaTqUQMgqU'
+def parse_flag(value):
+    """Parse an optional boolean request field; None when it was not sent"""
+    if value is None or value == '':
+        return None
+    if isinstance(value, bool):
+        return value
+    return str(value).lower() in ('1', 'true', 'yes', 'on')
+
+def add_weight(result, ingredient_type):
+    """Add weights from the ingredient's density to a measurement result.
+
+    Multi-object results get a weight per container and a total.
+    """
+    with pipeline_metrics.stage('ingredient_lookup'):
+        ingredient_data = get_ingredient_by_name(ingredient_type)
+    if not ingredient_data or 'base_density' not in ingredient_data:
+        return result
+    density = float(ingredient_data['base_density'])
+    
+    if 'containers' in result:
+        weights = np.array([c['volume_ml'] for c in result['containers']]) * density
+        for container, weight in zip(result['containers'], weights):
+            container['weight_g'] = f"{weight:.1f}g"
+        result['total_weight_g'] = f"{weights.sum():.1f}g"
+    else:
+        volume_ml = float(result['volume'].replace('ml', ''))
+        result['weight_g'] = f"{volume_ml * density:.1f}g"
+    return result
+
+def request_image(field='image'):
+    """Encoded image bytes and request parameters, whichever way the image was sent.
+
+    Accepts a raw ``image/*`` body (parameters in the query string), a
+    multipart upload (parameters in the form) or the original JSON body
+    with a base64 data URL. The binary paths skip base64 entirely and hand
+    the bytes straight to cv2.imdecode. Returns ``(image_bytes, params)``
+    with image_bytes None when no image was sent; raises ValueError for a
+    malformed data URL.
+    """
+    if request.mimetype.startswith('image/'):
+        with pipeline_metrics.stage('upload.read'):
+            return request.get_data(cache=False) or None, request.args
+    if request.mimetype == 'multipart/form-data':
+        with pipeline_metrics.stage('upload.parse'):
+            upload = request.files.get(field)
+        with pipeline_metrics.stage('upload.read'):
+            return (upload.read() or None) if upload else None, request.form
+    
+    data = request.get_json(silent=True) or {}
+    if not data.get(field):
+        return None, data
+    try:
+        encoded = data[field].split(',')[1]
+    except (IndexError, AttributeError):
+        raise ValueError("Invalid image data format")
+    try:
+        with pipeline_metrics.stage('base64_decode'):
+            return base64.b64decode(encoded), data
+    except Exception as e:
+        logger.error(f"Error decoding image: {str(e)}")
+        raise ValueError("Invalid image data")
+
+def busy_response(error):
+    """503 for a request the inference gate turned away"""
+    response = jsonify({
+        'success': False,
+        'message': 'The measurement service is busy, please try again shortly',
+        'retry_after': error.retry_after
+    })
+    response.status_code = 503
+    response.headers['Retry-After'] = str(error.retry_after)
+    return response
+
+def inference_threads():
+    """Torch/OpenCV threads per forward pass for this web worker.
+
+    TORCH_THREADS overrides; otherwise the CPUs are split between the
+    WEB_CONCURRENCY workers and the forward passes each runs at once (one
+    when requests are micro-batched, INFERENCE_CONCURRENCY otherwise).
+    """
+    if os.getenv('TORCH_THREADS'):
+        return int(os.getenv('TORCH_THREADS'))
+    batched = MEASUREMENT_ENGINE in ('rcnn', 'cascade') and int(os.getenv('RCNN_MAX_BATCH_SIZE', '4')) > 1
+    return thread_budget(workers=int(os.getenv('WEB_CONCURRENCY', '1')),
+                         parallel_forwards=1 if batched else INFERENCE_CONCURRENCY)
+
+def timed_endpoint(name):
+    """Time a measurement endpoint and the pipeline stages it runs.
+
+    Durations always go into the stage histograms; the response also gets a
+    ``timings`` field (ms per stage) when the request sets timings=true.
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            with pipeline_metrics.collect_timings() as timings:
+                with pipeline_metrics.stage(f'request.{name}'):
+                    response = app.make_response(view(*args, **kwargs))
+            
+            requested = request.values.get('timings')
+            if requested is None and request.is_json:
+                requested = (request.get_json(silent=True) or {}).get('timings')
+            if parse_flag(requested) and response.is_json:
+                body = response.get_json()
+                if isinstance(body, dict):
+                    body['timings'] = timings
+                    response.set_data(json.dumps(body))
+            return response
+        return wrapper
+    return decorator
 
 def download_model():
-    if not os.path.exists(MODEL_PATH):
-        print("Model not found. Downloading...")
-        os.makedirs(os.path.dirname(MODEL_PATH), exist_ok=True)
-        
+    """Download the checkpoint if missing, verify it and convert it for mmap loading"""
+    ModelStore(os.path.dirname(MODEL_PATH)).fetch(MODEL_PATH, MODEL_URL, sha256=os.getenv('MODEL_SHA256'))
+
+def get_gemini_model():
+    """Return the shared Gemini model, configuring the client on first use"""
+    global _gemini_model
+    if _gemini_model is None:
+        with _gemini_lock:
+            if _gemini_model is None:
+                with startup_profiler.phase('gemini_init'):
+                    import google.generativeai as genai
+                    genai.configure(api_key=GOOGLE_API_KEY)
+                    _gemini_model = genai.GenerativeModel('models/gemini-1.5-pro')
+    return _gemini_model
+
+def get_rcnn_measurement():
+    """Return the measurement engine, downloading, loading and warming it up on first use"""
+    global _rcnn_measurement
+    if _rcnn_measurement is None:
+        with _rcnn_lock:
+            if _rcnn_measurement is None:
+                if INFERENCE_SERVICE_ADDRESS:
+                    logger.info(f"Using shared inference service at {INFERENCE_SERVICE_ADDRESS}")
+                    with model_readiness.stage(readiness.LOADING):
+                        system = InferenceClient(INFERENCE_SERVICE_ADDRESS)
+                else:
+                    if not os.path.exists(MODEL_PATH):
+                        with model_readiness.stage(readiness.DOWNLOADING), startup_profiler.phase('model_download'):
+                            download_model()
+                    with model_readiness.stage(readiness.LOADING), startup_profiler.phase('rcnn_load'):
+                        configure_threads(inference_threads())
+                        from utils.measurement_engine import create_engine, engine_options_from_env
+                        # The engine comes from MEASUREMENT_ENGINE; batching and the
+                        # inference backend from RCNN_* environment variables
+                        system = create_engine(MEASUREMENT_ENGINE, MODEL_PATH,
+                                               **engine_options_from_env(MEASUREMENT_ENGINE))
+                with model_readiness.stage(readiness.WARMING_UP), startup_profiler.phase('rcnn_warmup'):
+                    system.warm_up()
+                model_readiness.transition(readiness.READY)
+                _rcnn_measurement = system
+    return _rcnn_measurement
+
+def warm_up_models():
+    """Build all models in the background so the first requests don't pay for it"""
+    for name, getter in (('Gemini', get_gemini_model), ('RCNN', get_rcnn_measurement)):
         try:
-            # Download using gdown
-            gdown.download(MODEL_URL, MODEL_PATH, quiet=False)
-            print("Model downloaded successfully!")
+            getter()
         except Exception as e:
-            print(f"Error downloading model: {e}")
-            raise
+            logger.error(f"Error warming up {name} model: {e}")
+    startup_profiler.report('Model warm-up')
 
-# Download model if not present
-download_model()
+startup_profiler.report('App import')
+# Without the warm-up thread models load on the first measurement request and
+# /health/ready reports ready straight away so traffic can trigger the load
+WARMUP_ON_START = os.getenv('WARMUP_ON_START', 'true').lower() in ('1', 'true', 'yes')
+if WARMUP_ON_START:
+    threading.Thread(target=warm_up_models, name='model-warmup', daemon=True).start()
 
 @app.route('/')
 def index():
@@ -114,11 +290,11 @@ def index():
 def health_check():
     """Health check endpoint"""
     try:
-        # Check if model exists
-        model_exists = os.path.exists('models/checkpoint.pth')
+        model_state = model_readiness.snapshot()
         return jsonify({
             'status': 'healthy',
-            'model_loaded': model_exists,
+            'model_loaded': model_state['ready'],
+            'model_state': model_state['state'],
             'timestamp': datetime.now().isoformat()
         })
     except Exception as e:
@@ -129,6 +305,26 @@ def health_check():
             'timestamp': datetime.now().isoformat()
         }), 500
 
+@app.route('/health/live')
+def liveness_check():
+    """Liveness probe: the process is up and serving requests"""
+    return jsonify({
+        'status': 'alive',
+        'timestamp': datetime.now().isoformat()
+    })
+
+@app.route('/health/ready')
+def readiness_check():
+    """Readiness probe: only report ready once the model is loaded and warmed up"""
+    model_state = model_readiness.snapshot()
+    ready = model_state['ready'] or not WARMUP_ON_START
+    return jsonify({
+        'status': 'ready' if ready else 'not_ready',
+        'model': model_state,
+        'startup': startup_profiler.summary(),
+        'timestamp': datetime.now().isoformat()
+    }), 200 if ready else 503
+
 @app.route('/measure')
 def measure():
     ingredients = get_cached_ingredients()
@@ -218,9 +414,13 @@ def get_ingredient_details_api():
     return jsonify({"error": "Ingredient not found"}), 404
 
 @app.route('/api/upload_photo', methods=['POST'])
+@timed_endpoint('upload_photo')
 def upload_photo():
     try:
-        if 'photo' not in request.files:
+        # Werkzeug parses the multipart body (and spools it) on first access
+        with pipeline_metrics.stage('upload.parse'):
+            has_photo = 'photo' in request.files
+        if not has_photo:
             return jsonify({
                 'success': False,
                 'message': 'No photo uploaded'
@@ -243,36 +443,42 @@ def upload_photo():
                 'message': 'Missing container or ingredient type'
             })
             
-        # Save the uploaded file
-        filename = secure_filename(photo.filename)
-        timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
-        filename = f"{timestamp}_{filename}"
-        filepath = os.path.join(app.config['UPLOAD_FOLDER'], filename)
-        photo.save(filepath)
+        # Read the upload into memory; it is only written to disk when enabled
+        with pipeline_metrics.stage('upload.read'):
+            image_bytes = photo.read()
+        filename = None
+        if app.config['PERSIST_UPLOADS']:
+            with pipeline_metrics.stage('upload.save'):
+                filename = upload_store.put(image_bytes, secure_filename(photo.filename))
         
-        # Process the measurement using RCNN
-        result = rcnn_measurement.process_measurement(filepath, container_type, ingredient_type)
+        # Process the measurement using RCNN; multi mode measures every container
+        with inference_gate.admit():
+            if parse_flag(request.form.get('multi')):
+                result = get_rcnn_measurement().process_measurements(image_bytes, container_type, ingredient_type)
+            else:
+                result = get_rcnn_measurement().process_measurement(image_bytes, container_type, ingredient_type,
+                                                                    debug_name=filename,
+                                                                    debug=parse_flag(request.form.get('debug')))
         
         if not result['success']:
+            # Keeps retake/reason when the quality gate rejected the photo
             return jsonify({
-                'success': False,
+                **result,
                 'message': result.get('message', 'Failed to process measurement')
             })
         
-        # Get ingredient density for weight calculation
-        ingredient_data = get_ingredient_by_name(ingredient_type)
-        if ingredient_data and 'base_density' in ingredient_data:
-            density = float(ingredient_data['base_density'])
-            volume_ml = float(result['volume'].replace('ml', ''))
-            weight = volume_ml * density
-            result['weight_g'] = f"{weight:.1f}g"
+        add_weight(result, ingredient_type)
         
         # Add debug image path
-        result['debug_image'] = f'/static/uploads/{filename}'
+        if filename:
+            result['debug_image'] = upload_store.url(filename)
         result['success'] = True
         
         return jsonify(result)
         
+    except Saturated as e:
+        logger.warning(f"Rejected photo upload: {e}")
+        return busy_response(e)
     except Exception as e:
         logger.error(f"Error processing photo upload: {e}")
         return jsonify({
@@ -281,64 +487,54 @@ def upload_photo():
         })
 
 @app.route('/api/process_image', methods=['POST'])
+@timed_endpoint('process_image')
 def process_image():
     try:
-        # Get data from request
-        data = request.get_json()
-        if not data or 'image' not in data:
+        # Encoded image buffer from a raw, multipart or base64 JSON body; the
+        # measurement system decodes it in memory so no temporary file is needed
+        try:
+            img_bytes, data = request_image()
+        except ValueError as e:
             return jsonify({
                 "success": False,
-                "message": "No image data provided"
+                "message": str(e)
             })
-            
-        # Extract base64 image data
-        try:
-            img_data = data.get('image').split(',')[1]
-        except (IndexError, AttributeError):
+        if img_bytes is None:
             return jsonify({
                 "success": False,
-                "message": "Invalid image data format"
+                "message": "No image data provided"
             })
             
         container_type = data.get('container_type', 'teaspoon')
         ingredient_type = data.get('ingredient_type', 'flour')
         
-        # Convert base64 to image
-        try:
-            img_bytes = base64.b64decode(img_data)
-            img = Image.open(io.BytesIO(img_bytes))
-            img = np.array(img)
-            img = cv2.cvtColor(img, cv2.COLOR_RGB2BGR)
-        except Exception as e:
-            logger.error(f"Error decoding image: {str(e)}")
-            return jsonify({
-                "success": False,
-                "message": "Invalid image data"
-            })
+        temp_filename = None
+        if app.config['PERSIST_UPLOADS']:
+            # Keep the original encoded bytes, no re-encode needed
+            with pipeline_metrics.stage('upload.save'):
+                temp_filename = upload_store.put(img_bytes)
         
-        # Save temporary image
-        timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
-        temp_filename = f"temp_{timestamp}.jpg"
-        temp_filepath = os.path.join(app.config['UPLOAD_FOLDER'], temp_filename)
-        cv2.imwrite(temp_filepath, img)
-        
-        # Process measurement using RCNN
-        result = rcnn_measurement.process_measurement(temp_filepath, container_type, ingredient_type)
+        # Process measurement using RCNN; multi mode measures every container
+        with inference_gate.admit():
+            if parse_flag(data.get('multi')):
+                result = get_rcnn_measurement().process_measurements(img_bytes, container_type, ingredient_type)
+            else:
+                result = get_rcnn_measurement().process_measurement(img_bytes, container_type, ingredient_type,
+                                                                    debug_name=temp_filename,
+                                                                    debug=parse_flag(data.get('debug')))
         
         if result['success']:
-            # Get ingredient density for weight calculation
-            ingredient_data = get_ingredient_by_name(ingredient_type)
-            if ingredient_data and 'base_density' in ingredient_data:
-                density = float(ingredient_data['base_density'])
-                volume_ml = float(result['volume'].replace('ml', ''))
-                weight = volume_ml * density
-                result['weight_g'] = f"{weight:.1f}g"
+            add_weight(result, ingredient_type)
             
             # Add debug image path
-            result['debug_image'] = f'/static/uploads/{temp_filename}'
+            if temp_filename:
+                result['debug_image'] = upload_store.url(temp_filename)
         
         return jsonify(result)
         
+    except Saturated as e:
+        logger.warning(f"Rejected image: {e}")
+        return busy_response(e)
     except Exception as e:
         logger.error(f"Error processing image: {e}")
         return jsonify({
@@ -346,6 +542,117 @@ def process_image():
             "message": str(e)
         })
 
+@app.route('/api/metrics')
+def metrics():
+    """Measurement pipeline metrics"""
+    try:
+        # Don't trigger a model load just to report metrics
+        pipeline = _rcnn_measurement.metrics() if _rcnn_measurement is not None else {}
+        return jsonify({
+            **pipeline,
+            'stages': pipeline_metrics.stage_metrics.snapshot(),
+            'streams': stream_manager.stats(),
+            'admission': inference_gate.stats(),
+            'uploads': upload_store.stats(),
+            'timestamp': datetime.now().isoformat()
+        })
+    except Exception as e:
+        logger.error(f"Error collecting metrics: {e}")
+        return jsonify({
+            'success': False,
+            'message': str(e)
+        }), 500
+
+@app.route('/api/stream', methods=['POST'])
+def start_stream():
+    """Start a live measurement session for a webcam stream"""
+    try:
+        data = request.get_json(silent=True) or {}
+        requested = data.get('container_type') or data.get('tool_type') or 'small_cup'
+        container_type = container_key(requested)
+        if container_type is None:
+            # Without dimensions every frame would silently measure 0 ml
+            return jsonify({
+                'success': False,
+                'message': f'Unknown container type: {requested}'
+            }), 400
+        
+        def measure_frame(frame, container_type, box):
+            with inference_gate.admit():
+                return get_rcnn_measurement().measure_frame(frame, container_type, box=box)
+        
+        session = stream_manager.create(
+            measure_frame, container_type,
+            detect_every=int(data.get('detect_every', os.getenv('STREAM_DETECT_EVERY', '10'))),
+            smoothing=float(data.get('smoothing', os.getenv('STREAM_SMOOTHING', '0.3'))))
+        if session is None:
+            return jsonify({
+                'success': False,
+                'message': 'Too many live sessions, try again later'
+            }), 503
+        
+        return jsonify({
+            'success': True,
+            'session_id': session.id,
+            'frame_url': url_for('stream_frame', session_id=session.id),
+            'events_url': url_for('stream_events', session_id=session.id)
+        })
+    except Exception as e:
+        logger.error(f"Error starting stream: {e}")
+        return jsonify({
+            'success': False,
+            'message': str(e)
+        }), 500
+
+@app.route('/api/stream/<session_id>/frame', methods=['POST'])
+def stream_frame(session_id):
+    """Accept one encoded frame (raw image/jpeg body or a 'frame' file field).
+
+    Frames that arrive while the previous one is still being measured
+    replace it, so a slow model never builds up a backlog.
+    """
+    session = stream_manager.get(session_id)
+    if session is None:
+        return jsonify({'success': False, 'message': 'Unknown or expired stream'}), 404
+    
+    frame = request.files['frame'].read() if 'frame' in request.files else request.get_data()
+    if not frame:
+        return jsonify({'success': False, 'message': 'No frame data'}), 400
+    
+    session.offer(frame)
+    return jsonify({
+        'success': True,
+        'reading': session.latest()
+    }), 202
+
+@app.route('/api/stream/<session_id>/events')
+def stream_events(session_id):
+    """Server-sent events carrying the smoothed readings of a session"""
+    session = stream_manager.get(session_id)
+    if session is None:
+        return jsonify({'success': False, 'message': 'Unknown or expired stream'}), 404
+    
+    def generate():
+        seq = 0
+        while not session.closed:
+            reading = session.wait_for_reading(seq, timeout=15.0)
+            if reading is None:
+                # Comment line keeps proxies from closing an idle connection
+                yield ': keep-alive\n\n'
+                continue
+            seq = reading['seq']
+            yield f"data: {json.dumps(reading)}\n\n"
+    
+    return Response(generate(), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+@app.route('/api/stream/<session_id>', methods=['DELETE'])
+def stop_stream(session_id):
+    """Stop a live measurement session"""
+    if not stream_manager.close(session_id):
+        return jsonify({'success': False, 'message': 'Unknown or expired stream'}), 404
+    return jsonify({'success': True})
+
 @app.route('/api/chat_recipe_suggestions', methods=['POST'])
 def chat_recipe_suggestions():
     try:
@@ -396,7 +703,7 @@ def chat_recipe_suggestions():
         4. Do not include any text before or after the JSON object"""
 
         # Generate response using Gemini
-        response = model.generate_content(prompt)
+        response = get_gemini_model().generate_content(prompt)
         response_text = response.text.strip()
 
         # Log the raw response for debugging
@@ -535,7 +842,7 @@ def chat():
                 return jsonify({"response": "❓ Please mention some ingredients you have."})
         
         # For non-recipe queries, use Gemini
-        response = model.generate_content(user_message)
+        response = get_gemini_model().generate_content(user_message)
         return jsonify({"response": response.text})
         
     except Exception as e:
@@ -691,11 +998,19 @@ def calibrate_page():
 @app.route('/api/calibrate', methods=['POST'])
 def calibrate():
     try:
-        data = request.json
-        image_data = data['image'].split(',')[1]  # Remove data URL prefix
-        image_bytes = base64.b64decode(image_data)
-        nparr = np.frombuffer(image_bytes, np.uint8)
-        image = cv2.imdecode(nparr, cv2.IMREAD_COLOR)
+        # Raw image/jpeg, multipart or base64 JSON body
+        image_bytes, _ = request_image()
+        if image_bytes is None:
+            return jsonify({
+                'success': False,
+                'message': 'No image data provided'
+            })
+        image = cv2.imdecode(np.frombuffer(image_bytes, np.uint8), cv2.IMREAD_COLOR)
+        if image is None:
+            return jsonify({
+                'success': False,
+                'message': 'Could not decode image'
+            })
         
         # Process image to get pixel height
         result = measurement_detector.process_measurement(image)
@@ -708,7 +1023,7 @@ def calibrate():
         
         return jsonify({
             'success': True,
-            'pixel_height': result['pixel_height']
+            'pixel_height': int(result['pixel_height'])
         })
         
     except Exception as e:
@@ -724,19 +1039,8 @@ def save_calibration():
         tool_type = data['tool_type']
         measurements = data['measurements']
         
-        # Sort measurements by fill level
-        measurements.sort(key=lambda x: x['fill_level'])
-        
-        # Extract pixel heights and volumes
-        pixel_heights = [m['pixel_height'] for m in measurements]
-        volumes = [m['volume'] for m in measurements]
-        
-        # Calibrate the tool
-        success = calibrator.calibrate_container(
-            tool_type=tool_type,
-            pixel_heights=pixel_heights,
-            volumes=volumes
-        )
+        # Calibrate the tool; the store is shared with the other workers
+        success = calibrator.calibrate_container(tool_type, measurements)
         
         if success:
             return jsonify({
@@ -0,0 +1,118 @@
+"""
+Microbenchmark for the fill-level hot loop.
+
+Compares the original allocating code paths with the reusable per-thread
+workspace (utils/fill_workspace.py) and reports time and transient
+allocations per ROI.
+
+Run with: python -m benchmarks.fill_level_bench --rois 500
+"""
+
+import json
+import time
+import argparse
+import tracemalloc
+import numpy as np
+import cv2
+from utils.fill_workspace import FillWorkspace
+
+
+def synthetic_rois(count, seed=0):
+    """Crops of a synthetic kitchen frame with a partly filled container"""
+    rng = np.random.default_rng(seed)
+    frame = rng.integers(150, 230, size=(1000, 1333, 3), dtype=np.uint8)
+    frame = cv2.GaussianBlur(frame, (9, 9), 0)
+    cv2.ellipse(frame, (660, 500), (260, 180), 0, 0, 360, (210, 210, 215), -1)
+    cv2.ellipse(frame, (660, 560), (230, 110), 0, 0, 360, (120, 90, 60), -1)
+    rois = []
+    for _ in range(count):
+        side = int(rng.integers(96, 480))
+        x = int(rng.integers(0, frame.shape[1] - side))
+        y = int(rng.integers(0, frame.shape[0] - side))
+        rois.append(frame[y:y + side, x:x + side])
+    return frame, rois
+
+
+def baseline_fill(roi):
+    """Fill analysis as it was: a fresh array for every stage"""
+    gray = cv2.cvtColor(roi, cv2.COLOR_RGB2GRAY)
+    blurred = cv2.GaussianBlur(gray, (5, 5), 0)
+    thresh = cv2.adaptiveThreshold(blurred, 255, cv2.ADAPTIVE_THRESH_GAUSSIAN_C,
+                                   cv2.THRESH_BINARY_INV, 11, 2)
+    contours, _ = cv2.findContours(thresh, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+    return max((cv2.contourArea(c) for c in contours), default=0.0)
+
+
+def workspace_fill(roi, workspace):
+    thresh = workspace.threshold(roi)
+    contours, _ = cv2.findContours(thresh, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+    return max((cv2.contourArea(c) for c in contours), default=0.0)
+
+
+def baseline_equalize(image):
+    """ContainerDetector preprocessing as it was: new CLAHE, LAB split and merge"""
+    rgb = cv2.cvtColor(image, cv2.COLOR_BGR2RGB)
+    lab = cv2.cvtColor(rgb, cv2.COLOR_RGB2LAB)
+    l, a, b = cv2.split(lab)
+    clahe = cv2.createCLAHE(clipLimit=3.0, tileGridSize=(8, 8))
+    cl = clahe.apply(l)
+    return cv2.cvtColor(cv2.merge((cl, a, b)), cv2.COLOR_LAB2RGB)
+
+
+def measure(fn, inputs, repeats):
+    """Return (microseconds per call, mean transient bytes per call)"""
+    for item in inputs[:10]:
+        fn(item)
+
+    start = time.perf_counter()
+    for _ in range(repeats):
+        for item in inputs:
+            fn(item)
+    elapsed = time.perf_counter() - start
+
+    tracemalloc.start()
+    transient = 0
+    for item in inputs:
+        tracemalloc.reset_peak()
+        current, _ = tracemalloc.get_traced_memory()
+        fn(item)
+        transient += tracemalloc.get_traced_memory()[1] - current
+    tracemalloc.stop()
+    return elapsed / (repeats * len(inputs)) * 1e6, transient / len(inputs)
+
+
+def run(count=500, repeats=3):
+    frame, rois = synthetic_rois(count)
+    workspace = FillWorkspace()
+    frames = [frame] * 20
+
+    results = {}
+    for name, fn, inputs in (
+            ('fill_baseline', baseline_fill, rois),
+            ('fill_workspace', lambda roi: workspace_fill(roi, workspace), rois),
+            ('equalize_baseline', baseline_equalize, frames),
+            ('equalize_workspace', workspace.equalize_lightness, frames)):
+        per_call_us, bytes_per_call = measure(fn, inputs, repeats)
+        results[name] = {
+            'us_per_call': round(per_call_us, 1),
+            'transient_bytes_per_call': int(bytes_per_call)
+        }
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark allocations and time of the fill-level hot loop')
+    parser.add_argument('--rois', type=int, default=500, help='Number of synthetic ROIs')
+    parser.add_argument('--repeats', type=int, default=3, help='Timing passes over the ROIs')
+    parser.add_argument('--output', help='Write the JSON report to this file')
+    args = parser.parse_args()
+
+    report = run(args.rois, args.repeats)
+    print(json.dumps(report, indent=2))
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,72 @@
+"""
+Synthetic container photos for benchmarks.
+
+Images are generated from a seed, so every run measures the same pixels
+without shipping photos or needing network access.
+"""
+
+import numpy as np
+import cv2
+from utils.container_geometry import CONTAINERS
+
+RESOLUTIONS = {
+    'vga': (640, 480),
+    'hd': (1280, 720),
+    'fhd': (1920, 1080),
+    'phone': (4032, 3024),
+}
+
+# Counter colour, container colour, ingredient colour (RGB)
+_COUNTER = (196, 170, 140)
+_CONTAINER = (225, 225, 230)
+_INGREDIENT = (240, 232, 210)
+
+
+def container_image(container_type, width, height, fill=0.6, seed=0):
+    """RGB photo of one container, drawn to its shape and filled to ``fill``"""
+    rng = np.random.default_rng(seed)
+    image = np.empty((height, width, 3), dtype=np.uint8)
+    image[:] = _COUNTER
+    # Sensor noise so thresholding and JPEG behave like on real photos
+    noise = rng.normal(0, 6, size=(height // 4, width // 4, 3)).astype(np.float32)
+    image = np.clip(image + cv2.resize(noise, (width, height)), 0, 255).astype(np.uint8)
+
+    cx, cy = width // 2, height // 2
+    size = min(width, height) // 3
+    if CONTAINERS[container_type]['shape'] == 'cylinder':
+        x1, y1, x2, y2 = cx - size // 2, cy - size, cx + size // 2, cy + size
+        cv2.rectangle(image, (x1, y1), (x2, y2), _CONTAINER, -1)
+        cv2.rectangle(image, (x1 + 6, int(y2 - (y2 - y1) * fill)), (x2 - 6, y2 - 6), _INGREDIENT, -1)
+        cv2.rectangle(image, (x1, y1), (x2, y2), (90, 90, 95), 4)
+    else:
+        axes = (size, size // 2)
+        cv2.ellipse(image, (cx, cy), axes, 0, 0, 360, _CONTAINER, -1)
+        cv2.ellipse(image, (cx, cy), (int(axes[0] * fill), int(axes[1] * fill)), 0, 0, 360, _INGREDIENT, -1)
+        cv2.ellipse(image, (cx, cy), axes, 0, 0, 360, (90, 90, 95), 4)
+    return image
+
+
+def container_roi(image):
+    """Centre crop around the drawn container, as a detector box would give"""
+    height, width = image.shape[:2]
+    size = min(width, height) // 3
+    cx, cy = width // 2, height // 2
+    return image[max(0, cy - size):cy + size, max(0, cx - size):cx + size]
+
+
+def encode_jpeg(image, quality=90):
+    """Encode an RGB array the way a browser upload would arrive"""
+    ok, buffer = cv2.imencode('.jpg', cv2.cvtColor(image, cv2.COLOR_RGB2BGR),
+                              [cv2.IMWRITE_JPEG_QUALITY, quality])
+    if not ok:
+        raise ValueError("Could not encode fixture image")
+    return buffer.tobytes()
+
+
+def fixtures(resolutions=None, container_types=None):
+    """Yield (resolution name, container type, RGB array, JPEG bytes)"""
+    for name in resolutions or RESOLUTIONS:
+        width, height = RESOLUTIONS[name]
+        for seed, container_type in enumerate(container_types or CONTAINERS):
+            image = container_image(container_type, width, height, seed=seed)
+            yield name, container_type, image, encode_jpeg(image)
@@ -0,0 +1,207 @@
+"""
+Benchmark suite for the measurement pipeline.
+
+Times decode, preprocessing, the FasterRCNN forward pass, fill-level
+analysis, volume conversion and the full /api/process_image round trip on
+synthetic container photos at several resolutions. Uses a seeded,
+untrained model so it runs offline; latencies are representative even
+though the measurements themselves are meaningless.
+
+Run with: python -m benchmarks.pipeline_bench --output bench.json
+Compare:  python -m benchmarks.pipeline_bench --compare baseline.json
+"""
+
+import os
+import sys
+import json
+import time
+import base64
+import argparse
+import logging
+import platform
+import resource
+import numpy as np
+from benchmarks.fixtures import RESOLUTIONS, fixtures, container_roi
+from utils.container_geometry import CONTAINERS
+
+STAGES = ('decode_full', 'decode_reduced', 'preprocess', 'forward', 'fill_level', 'volume',
+          'volume_batch', 'api_process_image')
+
+
+def summarize(samples_ms):
+    samples = np.asarray(samples_ms)
+    return {
+        'n': int(samples.size),
+        'p50_ms': round(float(np.percentile(samples, 50)), 3),
+        'p95_ms': round(float(np.percentile(samples, 95)), 3),
+        'mean_ms': round(float(samples.mean()), 3),
+    }
+
+
+def peak_rss_mb():
+    """Peak resident set size of this process so far"""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in kilobytes on Linux and bytes on macOS
+    return round(peak / (1024 * 1024 if sys.platform == 'darwin' else 1024), 1)
+
+
+def timed(fn, iterations, warmup=1):
+    """Call ``fn`` and return the latency of each timed call in milliseconds"""
+    for _ in range(warmup):
+        fn()
+    samples = []
+    for _ in range(iterations):
+        start = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - start) * 1000)
+    return samples
+
+
+def build_system():
+    """Seeded, untrained RCNN system that needs no checkpoint or network"""
+    import torch
+    from utils.rcnn_measurement_system import RCNNMeasurementSystem
+
+    torch.manual_seed(0)
+    # Threshold 0 so the untrained detector still yields a box and the whole
+    # path (detection, fill analysis, volume) is exercised; no caching so
+    # repeated frames are not answered from memory
+    return RCNNMeasurementSystem(None, pretrained_backbone=False, cache_size=0, confidence_threshold=0.0)
+
+
+def build_client(system):
+    """Flask test client whose measurement engine is ``system``"""
+    os.environ.setdefault('GOOGLE_API_KEY', 'benchmark')
+    os.environ.setdefault('WARMUP_ON_START', 'false')
+    os.environ.setdefault('PERSIST_UPLOADS', 'false')
+    import app as app_module
+    app_module._rcnn_measurement = system
+    return app_module.app.test_client()
+
+
+def run(resolutions, container_types, stages, iterations):
+    from utils.image_io import ImageSource, load_image
+    from utils.measurement_engine import to_model_tensor
+
+    system = build_system()
+    client = build_client(system) if 'api_process_image' in stages else None
+    results = {stage: {} for stage in stages}
+    seen = set()
+
+    for resolution, container_type, image, jpeg in fixtures(resolutions, container_types):
+        small, _ = ImageSource(jpeg).reduced(system.detect_max_side)
+        tensor = to_model_tensor(small)
+        roi = container_roi(small)
+
+        # Per resolution: stages that don't depend on the container
+        cases = []
+        if resolution not in seen:
+            seen.add(resolution)
+            cases += [
+                ('decode_full', resolution, lambda: load_image(jpeg)),
+                ('decode_reduced', resolution, lambda: ImageSource(jpeg).reduced(system.detect_max_side)),
+                ('preprocess', resolution, lambda: to_model_tensor(small)),
+                ('forward', resolution, lambda: system.predict(tensor)),
+            ]
+
+        # Per resolution and container
+        key = f'{resolution}/{container_type}'
+        fill_levels = np.linspace(0, 100, 1000)
+        payload = {
+            'image': 'data:image/jpeg;base64,' + base64.b64encode(jpeg).decode(),
+            'container_type': container_type,
+            'ingredient_type': 'flour'
+        }
+        cases += [
+            ('fill_level', key, lambda: system.calculate_fill_level(roi, container_type)),
+            ('volume', key, lambda: system.calculate_volume(container_type, 42.0)),
+            ('volume_batch', key, lambda: system.calculate_volume(container_type, fill_levels)),
+            ('api_process_image', key, lambda: client.post('/api/process_image', json=payload)),
+        ]
+
+        for stage, case, fn in cases:
+            if stage in stages:
+                results[stage][case] = summarize(timed(fn, iterations))
+        logging.getLogger(__name__).info(f"Finished {key}")
+
+    return results
+
+
+def environment():
+    import torch
+    import cv2
+    return {
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cpu_count': os.cpu_count(),
+        'torch': torch.__version__,
+        'torch_threads': torch.get_num_threads(),
+        'opencv': cv2.__version__,
+        'numpy': np.__version__,
+    }
+
+
+def compare(report, baseline, max_regression):
+    """Print p50 changes against a baseline report; return the regressed cases"""
+    regressions = []
+    for stage, cases in report['results'].items():
+        for case, stats in cases.items():
+            before = baseline.get('results', {}).get(stage, {}).get(case)
+            if not before or not before['p50_ms']:
+                continue
+            ratio = stats['p50_ms'] / before['p50_ms']
+            flag = ''
+            if ratio > max_regression:
+                regressions.append((stage, case, ratio))
+                flag = '  REGRESSION'
+            print(f"{stage:18s} {case:24s} {before['p50_ms']:10.3f} -> {stats['p50_ms']:10.3f} ms "
+                  f"({ratio:.2f}x){flag}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the measurement pipeline on synthetic images')
+    parser.add_argument('--resolutions', default=','.join(RESOLUTIONS),
+                        help=f"Comma-separated subset of {', '.join(RESOLUTIONS)}")
+    parser.add_argument('--containers', default=','.join(CONTAINERS),
+                        help='Comma-separated container types')
+    parser.add_argument('--stages', default=','.join(STAGES), help='Comma-separated stages to run')
+    parser.add_argument('--iterations', type=int, default=10, help='Timed calls per stage and case')
+    parser.add_argument('--output', help='Write the JSON report to this file')
+    parser.add_argument('--compare', help='Baseline JSON report to compare p50 latencies against')
+    parser.add_argument('--max-regression', type=float, default=1.25,
+                        help='Exit non-zero when a p50 is this many times slower than the baseline')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.WARNING, format='%(asctime)s - %(levelname)s - %(message)s')
+    stages = [stage for stage in args.stages.split(',') if stage]
+    unknown = set(stages) - set(STAGES)
+    if unknown:
+        parser.error(f"Unknown stages: {', '.join(sorted(unknown))}")
+
+    started = time.time()
+    results = run(args.resolutions.split(','), args.containers.split(','), stages, args.iterations)
+    report = {
+        'timestamp': started,
+        'duration_seconds': round(time.time() - started, 1),
+        'iterations': args.iterations,
+        'environment': environment(),
+        'peak_rss_mb': peak_rss_mb(),
+        'results': results,
+    }
+
+    print(json.dumps(report, indent=2))
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        regressions = compare(report, baseline, args.max_regression)
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -12,44 +12,16 @@ from typing import Dict, Tuple, Optional, List
 import json
 import os
 from database.ingredients_db import get_ingredient_by_name, get_measurement_by_name
+from utils.container_geometry import CONTAINERS, ContainerGeometry, container_for_label
+from utils.measurement_engine import MeasurementEngine, measurement_result, to_model_tensor
 
 # Configure logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
-# Container database
-CONTAINER_DATABASE = {
-    'teaspoon': {
-        'height_cm': 2.5,
-        'diameter_cm': 4.0,
-        'volume_ml': 5,
-        'shape': 'hemisphere'
-    },
-    'tablespoon': {
-        'height_cm': 3.0,
-        'diameter_cm': 5.0,
-        'volume_ml': 15,
-        'shape': 'hemisphere'
-    },
-    'small_bowl': {
-        'height_cm': 6.0,
-        'diameter_cm': 12.0,
-        'volume_ml': 500,
-        'shape': 'hemisphere'
-    },
-    'small_cup': {
-        'height_cm': 8.0,
-        'diameter_cm': 7.0,
-        'volume_ml': 250,
-        'shape': 'cylinder'
-    },
-    'large_cup': {
-        'height_cm': 10.0,
-        'diameter_cm': 8.0,
-        'volume_ml': 350,
-        'shape': 'cylinder'
-    }
-}
+# Container database; volumes scale from the nominal capacity
+CONTAINER_DATABASE = CONTAINERS
+VOLUME_MODEL = ContainerGeometry(CONTAINER_DATABASE, model='nominal')
 
 class RCNNMeasurementSystem:
     def __init__(self, model_path: str = 'model_epoch_17_loss_0.1472.pth'):
@@ -112,21 +84,10 @@ class RCNNMeasurementSystem:
         elif image.shape[2] == 4:
             image = cv2.cvtColor(image, cv2.COLOR_RGBA2RGB)
             
-        # Convert to PIL Image
-        image = Image.fromarray(image)
-        
         # Convert to tensor and normalize
-        transform = torchvision.transforms.Compose([
-            torchvision.transforms.ToTensor(),
-            torchvision.transforms.Normalize(
-                mean=[0.485, 0.456, 0.406],
-                std=[0.229, 0.224, 0.225]
-            )
-        ])
-        
-        return transform(image)
+        return to_model_tensor(image, normalize=True)
     
-    def detect_containers(self, image: np.ndarray) -> List[Dict]:
+    def detect_containers(self, image: np.ndarray, confidence_threshold: float = 0.5) -> List[Dict]:
         """Detect containers in the image using FasterRCNN"""
         try:
             # Preprocess image
@@ -143,7 +104,6 @@ class RCNNMeasurementSystem:
             labels = predictions[0]['labels'].cpu().numpy()
             
             # Filter predictions by confidence
-            confidence_threshold = 0.5
             mask = scores > confidence_threshold
             boxes = boxes[mask]
             scores = scores[mask]
@@ -213,33 +173,31 @@ class RCNNMeasurementSystem:
             if container_type not in CONTAINER_DATABASE:
                 raise ValueError(f"Unknown container type: {container_type}")
             
-            container = CONTAINER_DATABASE[container_type]
-            max_volume = container['volume_ml']
-            
-            # Calculate volume based on shape
-            if container['shape'] == 'hemisphere':
-                # For hemisphere, volume is proportional to height^3
-                volume = max_volume * (fill_percentage ** 3)
-            else:  # cylinder
-                # For cylinder, volume is proportional to height
-                volume = max_volume * fill_percentage
-            
-            return volume
+            return VOLUME_MODEL.volume(container_type, fill_percentage)
             
         except Exception as e:
             logger.error(f"Error calculating volume: {e}")
             return 0.0
     
-    def process_measurement(self, image_path: str, container_type: str, ingredient_type: str) -> Dict:
-        """Process measurement and return results"""
+    @staticmethod
+    def read_image(image) -> np.ndarray:
+        """Return a BGR array for an image path, or the array itself"""
+        if isinstance(image, np.ndarray):
+            return image
+        bgr = cv2.imread(image)
+        if bgr is None:
+            raise ValueError(f"Could not read image: {image}")
+        return bgr
+    
+    def process_measurement(self, image, container_type: str, ingredient_type: str = None,
+                            confidence_threshold: float = 0.5) -> Dict:
+        """Process measurement and return results; ``image`` is a path or BGR array"""
         try:
             # Read image
-            image = cv2.imread(image_path)
-            if image is None:
-                raise ValueError(f"Could not read image: {image_path}")
+            image = self.read_image(image)
             
             # Detect containers
-            detections = self.detect_containers(image)
+            detections = self.detect_containers(image, confidence_threshold)
             if not detections:
                 return {
                     'success': False,
@@ -277,4 +235,91 @@ class RCNNMeasurementSystem:
             return {
                 'success': False,
                 'message': str(e)
-            } 
\ No newline at end of file
+            } 
+    
+    def process_measurements(self, image, container_type: Optional[str] = None, ingredient_type: str = None,
+                             confidence_threshold: Optional[float] = None) -> Dict:
+        """Measure every detected container from a single forward pass.
+
+        Each detection's label decides its container type; ``container_type``
+        is used for labels that are not containers.
+        """
+        if confidence_threshold is None:
+            confidence_threshold = 0.5
+        try:
+            # Read image
+            image = self.read_image(image)
+            
+            detections = self.detect_containers(image, confidence_threshold)
+            measured = []
+            for detection in detections:
+                measured_type = container_for_label(detection['label'], container_type)
+                if measured_type not in VOLUME_MODEL:
+                    continue
+                measured.append((detection, measured_type, self.calculate_fill_level(image, detection['box'])))
+            
+            if not measured:
+                return {
+                    'success': False,
+                    'message': 'No containers detected'
+                }
+            
+            # Convert all fill levels to volumes in one call
+            volumes = VOLUME_MODEL.volumes([m[1] for m in measured], [m[2] for m in measured])
+            
+            containers = [
+                {
+                    'container_type': measured_type,
+                    'fill_level': fill_percentage,
+                    'volume_ml': float(volume),
+                    'confidence': detection['score'],
+                    'box': detection['box']
+                }
+                for (detection, measured_type, fill_percentage), volume in zip(measured, volumes)
+            ]
+            return {
+                'success': True,
+                'count': len(containers),
+                'total_volume_ml': float(volumes.sum()),
+                'containers': containers
+            }
+            
+        except Exception as e:
+            logger.error(f"Error processing measurements: {e}")
+            return {
+                'success': False,
+                'message': str(e)
+            }
+
+
+class LegacyRCNNEngine(MeasurementEngine):
+    """Measurement engine interface for the original RCNN pipeline"""
+
+    name = 'legacy_rcnn'
+
+    def __init__(self, checkpoint_path: Optional[str] = None, confidence_threshold: float = 0.5):
+        self.system = RCNNMeasurementSystem(checkpoint_path or 'model_epoch_17_loss_0.1472.pth')
+        self.confidence_threshold = confidence_threshold
+    
+    def process_measurement(self, image, container_type, ingredient_type=None, **options) -> Dict:
+        result = self.system.process_measurement(self.load_bgr(image), container_type, ingredient_type,
+                                                 self.confidence_threshold)
+        if not result['success']:
+            return result
+        # The legacy pipeline reports fill as a fraction
+        return measurement_result(result['fill_level'] * 100, result['volume_ml'], result['confidence'],
+                                  container_type)
+    
+    def process_measurements(self, image, container_type=None, ingredient_type=None, confidence_threshold=None) -> Dict:
+        if confidence_threshold is None:
+            confidence_threshold = self.confidence_threshold
+        result = self.system.process_measurements(self.load_bgr(image), container_type, ingredient_type,
+                                                  confidence_threshold)
+        if not result['success']:
+            return result
+        result['containers'] = [
+            measurement_result(c['fill_level'] * 100, c['volume_ml'], c['confidence'], c['container_type'],
+                               box=c['box'])
+            for c in result['containers']
+        ]
+        return result
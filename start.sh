@@ -1,15 +1,29 @@
 #!/bin/bash
 
-# Check if model exists, if not download it
-if [ ! -f "models/checkpoint.pth" ]; then
-    echo "Model not found. Downloading..."
-    python -c "
-import gdown
-import os
-os.makedirs('models', exist_ok=True)
-gdown.download('https://drive.google.com/uc?id=1VaB9qmln89nWr74fhceatvvaTqUQMgqU', 'models/checkpoint.pth', quiet=False)
-"
+# Download the model if needed, verify its hash and convert it to mmap-able
+# weights once, so the workers only map the shared file. Never start the
+# workers on a checkpoint that failed to download or verify
+python -m utils.model_store fetch || exit 1
+
+# Optionally run the models in a shared inference service so web workers
+# don't each load their own copy
+if [ -n "$INFERENCE_WORKERS" ] && [ "$INFERENCE_WORKERS" -gt 0 ]; then
+    export INFERENCE_SERVICE_ADDRESS="${INFERENCE_SERVICE_ADDRESS:-/tmp/bakegenie-inference.sock}"
+    python -m utils.inference_service --workers "$INFERENCE_WORKERS" --address "$INFERENCE_SERVICE_ADDRESS" &
+fi
+
+# Split the CPUs between the web workers so OpenMP/MKL in every process don't
+# each start one thread per core; the app sizes torch and OpenCV from the same
+# layout when it loads the model (see inference_threads in app.py)
+WEB_CONCURRENCY="${WEB_CONCURRENCY:-1}"
+CPUS=$(nproc)
+THREADS_PER_WORKER=$(( CPUS / WEB_CONCURRENCY ))
+if [ "$THREADS_PER_WORKER" -lt 1 ]; then
+    THREADS_PER_WORKER=1
 fi
+export WEB_CONCURRENCY
+export OMP_NUM_THREADS="${OMP_NUM_THREADS:-$THREADS_PER_WORKER}"
+export MKL_NUM_THREADS="${MKL_NUM_THREADS:-$THREADS_PER_WORKER}"
 
 # Start the application
-exec gunicorn --bind :$PORT --workers 1 --threads 8 --timeout 0 --log-level debug app:app 
\ No newline at end of file
+exec gunicorn --bind :$PORT --workers $WEB_CONCURRENCY --threads ${GUNICORN_THREADS:-8} --timeout 0 --log-level debug app:app
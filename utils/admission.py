@@ -0,0 +1,127 @@
+"""
+Admission control for model inference and CPU thread budgeting
+"""
+
+import os
+import math
+import time
+import threading
+import logging
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+
+class Saturated(Exception):
+    """Raised when an inference slot could not be obtained in time"""
+
+    def __init__(self, message, retry_after=1):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class InferenceGate:
+    def __init__(self, max_concurrent=1, max_queue=4, queue_timeout=5.0):
+        """Limit concurrent inference with a bounded wait queue.
+
+        Up to ``max_concurrent`` callers run at once and up to ``max_queue``
+        more wait at most ``queue_timeout`` seconds for a slot. Anyone else
+        is rejected immediately with Saturated, so overload turns into fast
+        503s instead of every request slowing down.
+        """
+        self.max_concurrent = max_concurrent
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self._condition = threading.Condition()
+        self._active = 0
+        self._waiting = 0
+        self._service_seconds = None
+        self._counters = {'admitted': 0, 'rejected': 0, 'timed_out': 0}
+
+    def retry_after(self):
+        """Seconds until a slot is likely free, from the average service time"""
+        service = self._service_seconds or 1.0
+        backlog = (self._waiting + self._active) / max(1, self.max_concurrent)
+        return max(1, math.ceil(service * backlog))
+
+    def _acquire(self):
+        with self._condition:
+            if self._active < self.max_concurrent:
+                self._active += 1
+                return
+            if self._waiting >= self.max_queue:
+                self._counters['rejected'] += 1
+                raise Saturated("Inference queue is full", self.retry_after())
+            self._waiting += 1
+            try:
+                admitted = self._condition.wait_for(lambda: self._active < self.max_concurrent,
+                                                    timeout=self.queue_timeout)
+            finally:
+                self._waiting -= 1
+            if not admitted:
+                self._counters['timed_out'] += 1
+                raise Saturated("Timed out waiting for an inference slot", self.retry_after())
+            self._active += 1
+
+    def _release(self, seconds):
+        with self._condition:
+            self._active -= 1
+            self._counters['admitted'] += 1
+            # Moving average of how long a slot is held
+            if self._service_seconds is None:
+                self._service_seconds = seconds
+            else:
+                self._service_seconds = 0.8 * self._service_seconds + 0.2 * seconds
+            self._condition.notify()
+
+    @contextmanager
+    def admit(self):
+        """Hold an inference slot for the duration of the block"""
+        self._acquire()
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self._release(time.perf_counter() - start)
+
+    def stats(self):
+        with self._condition:
+            stats = dict(self._counters)
+            stats.update(active=self._active, waiting=self._waiting)
+        stats.update(max_concurrent=self.max_concurrent, max_queue=self.max_queue,
+                     queue_timeout=self.queue_timeout,
+                     mean_service_seconds=round(self._service_seconds or 0.0, 3))
+        return stats
+
+
+def thread_budget(workers=1, parallel_forwards=1, cpus=None):
+    """Intra-op threads per forward pass so all processes together fit the CPUs.
+
+    ``workers`` is the number of processes running models and
+    ``parallel_forwards`` how many forward passes each runs at once.
+    """
+    if cpus is None:
+        # Honour CPU affinity / container limits where the platform exposes them
+        cpus = len(os.sched_getaffinity(0)) if hasattr(os, 'sched_getaffinity') else os.cpu_count()
+    return max(1, (cpus or 1) // max(1, workers * parallel_forwards))
+
+
+def configure_threads(threads):
+    """Apply one thread count to torch and OpenCV in this process.
+
+    Call before the first model is built; torch's inter-op pool can only
+    be sized before it starts.
+    """
+    import cv2
+    cv2.setNumThreads(threads)
+    try:
+        import torch
+        torch.set_num_threads(threads)
+        try:
+            torch.set_num_interop_threads(1)
+        except RuntimeError:
+            # Already started; the intra-op setting above still applies
+            pass
+    except ImportError:
+        pass
+    logger.info(f"Using {threads} torch/OpenCV threads per forward pass")
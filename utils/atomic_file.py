@@ -0,0 +1,67 @@
+"""
+Atomic file replacement and inter-process file locks
+"""
+
+import os
+import uuid
+import threading
+import logging
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:
+    # Not available on Windows; file_lock then only serializes threads
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+# Fallback locks by path when flock is unavailable
+_thread_locks = {}
+_thread_locks_guard = threading.Lock()
+
+
+@contextmanager
+def file_lock(path):
+    """Hold an exclusive lock on ``path`` (created if missing) across processes.
+
+    Uses flock where available. Elsewhere it falls back to a lock that only
+    serializes the threads of this process.
+    """
+    if fcntl is None:
+        with _thread_locks_guard:
+            lock = _thread_locks.setdefault(os.path.abspath(path), threading.Lock())
+        with lock:
+            yield
+        return
+
+    with open(path, 'a') as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        yield
+
+
+@contextmanager
+def atomic_write(path, mode='w', fsync=False):
+    """Yield a file whose contents replace ``path`` in one step once the block succeeds.
+
+    The temporary file lives next to ``path`` and is created with mode 0666,
+    so the kernel applies the umask exactly as a plain open() would. It is
+    removed if the block fails.
+    """
+    directory = os.path.dirname(path) or '.'
+    tmp = os.path.join(directory, f'.{os.path.basename(path)}.{uuid.uuid4().hex[:8]}.tmp')
+    flags = os.O_CREAT | os.O_EXCL | os.O_WRONLY | getattr(os, 'O_BINARY', 0)
+    fd = os.open(tmp, flags, 0o666)
+    try:
+        with os.fdopen(fd, mode) as f:
+            yield f
+            if fsync:
+                f.flush()
+                os.fsync(f.fileno())
+        os.replace(tmp, path)
+    except BaseException:
+        try:
+            os.remove(tmp)
+        except FileNotFoundError:
+            pass
+        raise
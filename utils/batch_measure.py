@@ -0,0 +1,290 @@
+"""
+Offline bulk measurement of archived photos.
+
+Measures a directory of images (one container type for all) or a CSV
+manifest with ``path,container_type[,ingredient_type]`` columns on a pool
+of worker processes, each loading the model once. Results are streamed to
+CSV, or to a Parquet dataset directory (one part file per flushed batch,
+needs pyarrow). Every row records the SHA-256 of the checkpoint and the
+calibration version it was measured with. Re-running with the same output
+skips images already measured successfully with the same checkpoint and
+calibration, so an interrupted run continues where it stopped, while a
+new model or calibration measures everything again.
+
+Run with:
+    python -m utils.batch_measure --images archive/ --container-type small_cup --output results.csv
+    python -m utils.batch_measure --manifest photos.csv --output results.parquet --workers 4
+"""
+
+import os
+import csv
+import time
+import uuid
+import argparse
+import logging
+import multiprocessing
+
+logger = logging.getLogger(__name__)
+
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.bmp', '.webp')
+
+COLUMNS = ('path', 'container_type', 'ingredient_type', 'success', 'fill_level', 'volume_ml',
+           'confidence', 'detected_type', 'message', 'elapsed_ms', 'checkpoint', 'calibration_version')
+
+# Engine loaded once per worker process
+_worker_system = None
+_worker_model = None
+
+
+def model_version(checkpoint_path):
+    """(checkpoint SHA-256, calibration version) that results are measured with"""
+    from .calibration import calibrator
+    from .model_store import ModelStore
+
+    checkpoint = ''
+    if checkpoint_path and os.path.exists(checkpoint_path):
+        store = ModelStore(os.path.dirname(checkpoint_path) or '.')
+        checkpoint = store.verified_hash(checkpoint_path, os.getenv('MODEL_SHA256'))
+    calibrator.refresh()
+    return checkpoint, calibrator.version
+
+
+def _result_key(row):
+    return (row['path'], row['container_type'], row['checkpoint'] or '', int(row['calibration_version']))
+
+
+def _init_worker(engine, checkpoint_path, threads, options, version):
+    global _worker_system, _worker_model
+    from .admission import configure_threads
+    from .measurement_engine import create_engine
+
+    configure_threads(threads)
+    _worker_system = create_engine(engine, checkpoint_path, **options)
+    _worker_model = version
+    logger.info(f"Batch worker {os.getpid()} ready")
+
+
+def _measure(task):
+    """Measure one (path, container_type, ingredient_type) task into a result row"""
+    path, container_type, ingredient_type = task
+    start = time.perf_counter()
+    try:
+        result = _worker_system.process_measurement(path, container_type, ingredient_type)
+    except Exception as e:
+        result = {'success': False, 'message': str(e)}
+    success = bool(result.get('success'))
+    return {
+        'path': path,
+        'container_type': container_type,
+        'ingredient_type': ingredient_type or '',
+        'success': success,
+        'fill_level': round(float(result['fill_level']), 3) if success else None,
+        'volume_ml': round(float(result['volume_ml']), 3) if success else None,
+        'confidence': float(result['confidence']) if success else None,
+        'detected_type': result.get('container_type', '') if success else '',
+        'message': '' if success else result.get('message', ''),
+        'elapsed_ms': round((time.perf_counter() - start) * 1000, 1),
+        'checkpoint': _worker_model[0],
+        'calibration_version': _worker_model[1],
+    }
+
+
+def directory_tasks(directory, container_type, ingredient_type=None):
+    """Every image below ``directory``, all measured as ``container_type``"""
+    for root, _, names in os.walk(directory):
+        for name in sorted(names):
+            if name.lower().endswith(IMAGE_EXTENSIONS):
+                yield os.path.join(root, name), container_type, ingredient_type
+
+
+def manifest_tasks(manifest, default_container_type=None):
+    """Tasks from a CSV manifest; relative paths are resolved against its directory"""
+    base = os.path.dirname(os.path.abspath(manifest))
+    with open(manifest, newline='') as f:
+        for row in csv.DictReader(f):
+            container_type = row.get('container_type') or default_container_type
+            if not row.get('path') or not container_type:
+                logger.warning(f"Skipping manifest row without path or container type: {row}")
+                continue
+            yield os.path.join(base, row['path']), container_type, row.get('ingredient_type') or None
+
+
+class CSVResultWriter:
+    def __init__(self, path):
+        """Append result rows to a CSV file, flushed after every row"""
+        self.path = path
+        exists = os.path.exists(path) and os.path.getsize(path) > 0
+        if exists:
+            self._drop_partial_line()
+            with open(path, newline='') as f:
+                if tuple(next(csv.reader(f), ())) != COLUMNS:
+                    raise ValueError(f"{path} has different columns; write the results to a new file")
+        self._file = open(path, 'a', newline='')
+        self._writer = csv.DictWriter(self._file, fieldnames=COLUMNS)
+        if not exists:
+            self._writer.writeheader()
+
+    def _drop_partial_line(self):
+        """Cut a row left half-written by an interrupted run"""
+        with open(self.path, 'rb+') as f:
+            data = f.read()
+            if not data.endswith(b'\n'):
+                f.truncate(data.rfind(b'\n') + 1)
+
+    def done(self):
+        """Keys of the rows measured successfully"""
+        if not os.path.exists(self.path):
+            return set()
+        with open(self.path, newline='') as f:
+            return {_result_key(row) for row in csv.DictReader(f) if row['success'] == 'True'}
+
+    def write(self, row):
+        self._writer.writerow(row)
+        self._file.flush()
+
+    def close(self):
+        self._file.close()
+
+
+class ParquetResultWriter:
+    def __init__(self, path, flush_every=500):
+        """Write result rows as a Parquet dataset: one part file per ``flush_every`` rows.
+
+        Part files are renamed into place once complete, so an interrupted
+        run loses at most the rows of the unfinished part.
+        """
+        try:
+            import pyarrow
+            import pyarrow.parquet
+        except ImportError:
+            raise RuntimeError("Parquet output needs pyarrow; install it or write CSV instead")
+        self._pa, self._pq = pyarrow, pyarrow.parquet
+        self.path = path
+        self.flush_every = flush_every
+        self._rows = []
+        self._schema = pyarrow.schema([
+            ('path', pyarrow.string()), ('container_type', pyarrow.string()),
+            ('ingredient_type', pyarrow.string()), ('success', pyarrow.bool_()),
+            ('fill_level', pyarrow.float64()), ('volume_ml', pyarrow.float64()),
+            ('confidence', pyarrow.float64()), ('detected_type', pyarrow.string()),
+            ('message', pyarrow.string()), ('elapsed_ms', pyarrow.float64()),
+            ('checkpoint', pyarrow.string()), ('calibration_version', pyarrow.int64()),
+        ])
+        os.makedirs(path, exist_ok=True)
+
+    def _parts(self):
+        return [os.path.join(self.path, name) for name in sorted(os.listdir(self.path))
+                if name.endswith('.parquet')]
+
+    def done(self):
+        """Keys of the rows measured successfully"""
+        done = set()
+        for part in self._parts():
+            table = self._pq.read_table(part, columns=['path', 'container_type', 'checkpoint',
+                                                       'calibration_version', 'success'])
+            done.update(_result_key(row) for row in table.to_pylist() if row['success'])
+        return done
+
+    def write(self, row):
+        self._rows.append(row)
+        if len(self._rows) >= self.flush_every:
+            self.flush()
+
+    def flush(self):
+        if not self._rows:
+            return
+        table = self._pa.Table.from_pylist(self._rows, schema=self._schema)
+        name = f'part-{int(time.time() * 1000):013d}-{uuid.uuid4().hex[:8]}.parquet'
+        tmp = os.path.join(self.path, f'.{name}.tmp')
+        self._pq.write_table(table, tmp)
+        os.replace(tmp, os.path.join(self.path, name))
+        self._rows = []
+
+    def close(self):
+        self.flush()
+
+
+def result_writer(path, output_format=None, flush_every=500):
+    output_format = output_format or ('parquet' if path.endswith('.parquet') else 'csv')
+    if output_format == 'parquet':
+        return ParquetResultWriter(path, flush_every)
+    return CSVResultWriter(path)
+
+
+def run(tasks, writer, engine='rcnn', checkpoint_path=None, workers=1, options=None, chunksize=4):
+    """Measure ``tasks`` on ``workers`` processes, skipping those ``writer`` already has.
+
+    A task counts as done when it was measured successfully with the same
+    checkpoint and calibration version. Returns counts of measured, failed
+    and skipped images.
+    """
+    from .admission import thread_budget
+
+    tasks = list(tasks)
+    version = model_version(checkpoint_path)
+    done = writer.done()
+    pending = [task for task in tasks if (task[0], task[1]) + version not in done]
+    counts = {'measured': 0, 'failed': 0, 'skipped': len(tasks) - len(pending)}
+    logger.info(f"{len(pending)} images to measure, {counts['skipped']} already done")
+    if not pending:
+        return counts
+
+    # spawn avoids forking a process that may already hold torch threads
+    context = multiprocessing.get_context('spawn')
+    started = time.monotonic()
+    with context.Pool(workers, initializer=_init_worker,
+                      initargs=(engine, checkpoint_path, thread_budget(workers), options or {}, version)) as pool:
+        for row in pool.imap_unordered(_measure, pending, chunksize=chunksize):
+            writer.write(row)
+            counts['measured' if row['success'] else 'failed'] += 1
+            finished = counts['measured'] + counts['failed']
+            if finished % 100 == 0 or finished == len(pending):
+                rate = finished / max(time.monotonic() - started, 1e-9)
+                logger.info(f"{finished}/{len(pending)} images ({rate:.1f}/s)")
+    return counts
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Measure archived photos in bulk')
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument('--images', help='Directory of photos (searched recursively)')
+    source.add_argument('--manifest', help='CSV with path,container_type[,ingredient_type] columns')
+    parser.add_argument('--container-type', help='Container type for --images, or the manifest default')
+    parser.add_argument('--ingredient-type', help='Ingredient type for --images')
+    parser.add_argument('--output', required=True, help='Results .csv file or .parquet dataset directory')
+    parser.add_argument('--format', choices=('csv', 'parquet'), help='Output format (default: from --output)')
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1, help='Worker processes')
+    parser.add_argument('--checkpoint', default=os.path.join('models', 'checkpoint.pth'),
+                        help='Path to the RCNN checkpoint')
+    parser.add_argument('--engine', default=os.getenv('MEASUREMENT_ENGINE', 'rcnn'), help='Measurement engine')
+    parser.add_argument('--flush-every', type=int, default=500, help='Rows per Parquet part file')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    if args.images:
+        if not args.container_type:
+            parser.error('--images needs --container-type')
+        tasks = directory_tasks(args.images, args.container_type, args.ingredient_type)
+    else:
+        tasks = manifest_tasks(args.manifest, args.container_type)
+
+    from .measurement_engine import engine_options_from_env, override_rcnn_options
+    # One image at a time per process: nothing to batch, no repeated frames
+    # to cache and no debug renderings. Archived photos can't be retaken, so
+    # the live-camera quality gate would only turn them into failures that
+    # every resume measures again
+    options = override_rcnn_options(args.engine, engine_options_from_env(args.engine),
+                                    max_batch_size=1, cache_size=0, debug_sample_rate=0.0,
+                                    quality_gate=False)
+
+    writer = result_writer(args.output, args.format, args.flush_every)
+    try:
+        counts = run(tasks, writer, args.engine, args.checkpoint, args.workers, options)
+    finally:
+        writer.close()
+    print(f"Measured {counts['measured']}, failed {counts['failed']}, "
+          f"skipped {counts['skipped']} already in {args.output}")
+
+
+if __name__ == '__main__':
+    main()
@@ -1,103 +1,188 @@
 import numpy as np
-import cv2
 import json
 import os
+import time
+import threading
 import logging
-from typing import Dict, List, Tuple
+from typing import Dict, List, Optional, Tuple
+from .atomic_file import atomic_write, file_lock
 
 logger = logging.getLogger(__name__)
 
+
+class CalibrationCurve:
+    def __init__(self, entry: Dict):
+        """Compiled pixel-height -> volume curve for one container.
+
+        The polynomial is evaluated with Horner's rule on plain floats, so
+        no arrays are built per call, and works on scalars or numpy arrays
+        of pixel heights alike.
+        """
+        self.coefficients = tuple(float(c) for c in entry['coefficients'])
+        self.min_height = entry['min_height']
+        self.max_height = entry['max_height']
+        self.min_volume = float(entry['min_volume'])
+        self.max_volume = float(entry['max_volume'])
+
+    def __call__(self, pixel_height):
+        if isinstance(pixel_height, (int, float, np.number)):
+            volume = 0.0
+            for c in self.coefficients:
+                volume = volume * pixel_height + c
+            return max(self.min_volume, min(float(volume), self.max_volume))
+
+        heights = np.asarray(pixel_height, dtype=np.float64)
+        volume = np.zeros_like(heights)
+        for c in self.coefficients:
+            volume = volume * heights + c
+        # Clamp to the calibrated range
+        volume = np.clip(volume, self.min_volume, self.max_volume)
+        return float(volume) if volume.ndim == 0 else volume
+
+    def is_valid(self, volume: float) -> bool:
+        return self.min_volume <= volume <= self.max_volume
+
+
 class MeasurementCalibrator:
-    def __init__(self):
+    def __init__(self, calibration_file: str = 'data/calibration.json', check_interval: float = 1.0):
+        """Calibration store shared by all worker processes.
+
+        Writes go to a temporary file that replaces the store atomically,
+        under a file lock, and bump its version. Every process checks the
+        file at most once per ``check_interval`` seconds and reloads it when
+        it changed, so a calibration saved through one gunicorn worker is
+        picked up by the others.
+        """
+        self.calibration_file = calibration_file
+        self.check_interval = check_interval
         self.calibration_data = {}
-        self.calibration_file = 'data/calibration.json'
+        self.version = 0
+        self._curves = {}
+        self._signature = None
+        self._checked_at = 0.0
+        self._lock = threading.Lock()
         self.load_calibration()
-        
+
+    def _file_signature(self):
+        try:
+            stat = os.stat(self.calibration_file)
+        except FileNotFoundError:
+            return None
+        # os.replace gives the store a new inode, so this changes on every save
+        return (stat.st_ino, stat.st_mtime_ns, stat.st_size)
+
+    def _read(self) -> Tuple[int, Dict]:
+        with open(self.calibration_file, 'r') as f:
+            data = json.load(f)
+        if 'containers' not in data:
+            # Unversioned file written before the store existed
+            return 0, data
+        return data.get('version', 0), data['containers']
+
+    def _apply(self, version: int, containers: Dict):
+        self._curves = {name: CalibrationCurve(entry) for name, entry in containers.items()}
+        self.calibration_data = containers
+        self.version = version
+
     def load_calibration(self):
         """Load existing calibration data"""
+        with self._lock:
+            self._checked_at = time.monotonic()
+            signature = self._file_signature()
+            if signature is None or signature == self._signature:
+                return
+            try:
+                version, containers = self._read()
+                self._apply(version, containers)
+                self._signature = signature
+                logger.info(f"Loaded calibration data version {version}")
+            except Exception as e:
+                logger.error(f"Error loading calibration data: {e}")
+
+    def refresh(self):
+        """Reload the store if another process changed it since the last check"""
+        if time.monotonic() - self._checked_at >= self.check_interval:
+            self.load_calibration()
+
+    def _write(self, version: int, containers: Dict):
+        with atomic_write(self.calibration_file, fsync=True) as f:
+            json.dump({'version': version, 'containers': containers}, f, indent=2)
+
+    def save_calibration(self, updates: Optional[Dict] = None):
+        """Merge ``updates`` into the stored calibration and write it atomically"""
         try:
-            if os.path.exists(self.calibration_file):
-                with open(self.calibration_file, 'r') as f:
-                    self.calibration_data = json.load(f)
-                logger.info("Loaded calibration data")
-        except Exception as e:
-            logger.error(f"Error loading calibration data: {e}")
-            self.calibration_data = {}
-    
-    def save_calibration(self):
-        """Save calibration data to file"""
-        try:
-            os.makedirs(os.path.dirname(self.calibration_file), exist_ok=True)
-            with open(self.calibration_file, 'w') as f:
-                json.dump(self.calibration_data, f, indent=2)
-            logger.info("Saved calibration data")
+            os.makedirs(os.path.dirname(self.calibration_file) or '.', exist_ok=True)
+            # The lock file serializes read-modify-write across processes
+            with file_lock(self.calibration_file + '.lock'), self._lock:
+                version, containers = self._read() if os.path.exists(self.calibration_file) \
+                    else (self.version, dict(self.calibration_data))
+                containers = {**containers, **(updates or {})}
+                self._write(version + 1, containers)
+                self._apply(version + 1, containers)
+                self._signature = self._file_signature()
+            logger.info(f"Saved calibration data version {self.version}")
+            return True
         except Exception as e:
             logger.error(f"Error saving calibration data: {e}")
-    
+            return False
+
     def calibrate_container(self, container_type: str, measurements: List[Dict[str, float]]):
         """Calibrate a specific container type with known measurements"""
         try:
             # Sort measurements by volume
             measurements.sort(key=lambda x: x['volume'])
-            
+
             # Extract calibration points
             volumes = [m['volume'] for m in measurements]
             heights = [m['pixel_height'] for m in measurements]
-            
+
             # Generate calibration curve (polynomial fit)
             coeffs = np.polyfit(heights, volumes, 2)
-            
-            # Store calibration data
-            self.calibration_data[container_type] = {
-                'coefficients': coeffs.tolist(),
-                'min_height': min(heights),
-                'max_height': max(heights),
-                'min_volume': min(volumes),
-                'max_volume': max(volumes)
-            }
-            
-            self.save_calibration()
-            return True
+
+            return self.save_calibration({
+                container_type: {
+                    'coefficients': coeffs.tolist(),
+                    'min_height': min(heights),
+                    'max_height': max(heights),
+                    'min_volume': min(volumes),
+                    'max_volume': max(volumes)
+                }
+            })
         except Exception as e:
             logger.error(f"Error calibrating container {container_type}: {e}")
             return False
-    
-    def get_calibrated_volume(self, container_type: str, pixel_height: float) -> float:
-        """Get calibrated volume for a given pixel height"""
+
+    def get_curve(self, container_type: str) -> Optional[CalibrationCurve]:
+        """Compiled curve for a container, or None if it is not calibrated"""
+        self.refresh()
+        return self._curves.get(container_type)
+
+    def get_calibrated_volume(self, container_type: str, pixel_height):
+        """Get calibrated volume for a pixel height or an array of them"""
         try:
-            if container_type not in self.calibration_data:
+            curve = self.get_curve(container_type)
+            if curve is None:
                 logger.warning(f"No calibration data for {container_type}")
                 return None
-            
-            cal_data = self.calibration_data[container_type]
-            coeffs = np.array(cal_data['coefficients'])
-            
-            # Calculate volume using polynomial
-            volume = np.polyval(coeffs, pixel_height)
-            
-            # Clamp to valid range
-            volume = max(cal_data['min_volume'], min(volume, cal_data['max_volume']))
-            
-            return volume
+            return curve(pixel_height)
         except Exception as e:
             logger.error(f"Error getting calibrated volume: {e}")
             return None
-    
+
     def validate_measurement(self, volume: float, container_type: str) -> Tuple[bool, str]:
         """Validate if a measurement is within expected ranges"""
         try:
-            if container_type not in self.calibration_data:
+            curve = self.get_curve(container_type)
+            if curve is None:
                 return False, f"No calibration data for {container_type}"
-            
-            cal_data = self.calibration_data[container_type]
-            
-            if not (cal_data['min_volume'] <= volume <= cal_data['max_volume']):
+
+            if not curve.is_valid(volume):
                 return False, f"Volume {volume} outside calibrated range"
-            
+
             return True, "Valid measurement"
         except Exception as e:
             logger.error(f"Error validating measurement: {e}")
             return False, str(e)
 
 # Global calibrator instance
-calibrator = MeasurementCalibrator() 
\ No newline at end of file
+calibrator = MeasurementCalibrator()
@@ -0,0 +1,222 @@
+"""
+Cascaded measurement: the OpenCV contour detector first, FasterRCNN only
+when the contour result is not confident enough.
+
+Select it with MEASUREMENT_ENGINE=cascade. The acceptance threshold comes
+from CASCADE_ACCEPT_CONFIDENCE; until it is set every request goes to
+FasterRCNN. Pick it with the calibration script, which compares both
+detectors on a folder of photos:
+
+    python -m utils.cascade --images photos/ --container-type small_cup
+"""
+
+import os
+import time
+import json
+import argparse
+import logging
+import threading
+import numpy as np
+from .metrics import stage
+from .image_io import ImageSource
+from .result_cache import dhash
+from .measurement_engine import MeasurementEngine, create_engine
+
+logger = logging.getLogger(__name__)
+
+
+class CascadeEngine(MeasurementEngine):
+    """Cheap engine first, escalating to the expensive one on low confidence.
+
+    Results the cheap engine reports with at least ``accept_confidence``
+    are returned as they are; everything else is measured again by the
+    expensive engine. With ``accept_confidence=None`` (the default, as the
+    contour confidence saturates for any round outline) nothing is
+    accepted and the cheap engine is not run. The expensive engine's quality gate and result cache
+    (when it has them) run before the cheap engine, so accepted results are
+    gated and cached like escalated ones. Multi-object measurement and
+    stream tracking always use the expensive engine.
+    """
+
+    name = 'cascade'
+
+    def __init__(self, checkpoint_path=None, accept_confidence=None, cheap_engine='contour',
+                 expensive_engine='rcnn', cheap_options=None, expensive_options=None, confidence_threshold=None):
+        self.accept_confidence = accept_confidence
+        self.cheap = create_engine(cheap_engine, checkpoint_path, **(cheap_options or {}))
+        expensive_options = dict(expensive_options or {})
+        if confidence_threshold is not None:
+            expensive_options.setdefault('confidence_threshold', confidence_threshold)
+        self.expensive = create_engine(expensive_engine, checkpoint_path, **expensive_options)
+        self.confidence_threshold = self.expensive.confidence_threshold
+
+        self._lock = threading.Lock()
+        self._counters = {'requests': 0, 'accepted': 0, 'escalated': 0, 'cached': 0}
+        self._seconds = {'cheap': 0.0, 'expensive': 0.0, 'accepted_cheap': 0.0}
+
+    def _record(self, accepted, cheap_seconds, expensive_seconds=0.0):
+        with self._lock:
+            self._counters['requests'] += 1
+            self._counters['accepted' if accepted else 'escalated'] += 1
+            self._seconds['cheap'] += cheap_seconds
+            self._seconds['expensive'] += expensive_seconds
+            if accepted:
+                self._seconds['accepted_cheap'] += cheap_seconds
+
+    def _cache_key(self, source, options):
+        """Perceptual hash for the expensive engine's result cache, or None when not cached"""
+        if getattr(self.expensive, 'result_cache', None) is None:
+            return None
+        # Requests for debug output always run, as in the expensive engine
+        if options.get('debug'):
+            return None
+        with stage('decode'):
+            small, _ = source.reduced(self.expensive.detect_max_side)
+        return dhash(small)
+
+    def process_measurement(self, image, container_type, ingredient_type=None, **options):
+        # One lazily decoded source shared by both engines
+        source = self.load(image)
+
+        check_quality = getattr(self.expensive, 'check_quality', None)
+        rejected = check_quality(source) if check_quality is not None else None
+        if rejected is not None:
+            return rejected
+
+        phash = self._cache_key(source, options)
+        if phash is not None:
+            with stage('cache_lookup'):
+                cached = self.expensive.result_cache.get(phash, container_type)
+            if cached is not None:
+                with self._lock:
+                    self._counters['cached'] += 1
+                return dict(cached, cached=True)
+
+        cheap_seconds = 0.0
+        if self.accept_confidence is not None:
+            start = time.perf_counter()
+            with stage('cascade.cheap'):
+                cheap = self.cheap.process_measurement(source, container_type, ingredient_type)
+            cheap_seconds = time.perf_counter() - start
+
+            if cheap.get('success') and float(cheap['confidence']) >= self.accept_confidence:
+                self._record(True, cheap_seconds)
+                result = dict(cheap, engine=self.cheap.name)
+                if phash is not None:
+                    self.expensive.result_cache.put(phash, container_type, result)
+                return result
+
+        start = time.perf_counter()
+        with stage('cascade.escalate'):
+            measure_response = getattr(self.expensive, 'measure_response', None)
+            if measure_response is not None:
+                # The gate and cache lookup above already ran for this frame
+                result = measure_response(source, container_type, debug_name=options.get('debug_name'),
+                                          debug=options.get('debug'))
+            else:
+                result = self.expensive.process_measurement(source, container_type, ingredient_type, **options)
+        self._record(False, cheap_seconds, time.perf_counter() - start)
+        if result.get('success'):
+            result = dict(result, engine=self.expensive.name)
+        if phash is not None and measure_response is not None:
+            self.expensive.result_cache.put(phash, container_type, result)
+        return result
+
+    def process_measurements(self, image, container_type=None, ingredient_type=None, confidence_threshold=None):
+        return self.expensive.process_measurements(image, container_type, ingredient_type, confidence_threshold)
+
+    def measure_frame(self, image, container_type, box=None, confidence_threshold=None):
+        return self.expensive.measure_frame(image, container_type, box=box,
+                                            confidence_threshold=confidence_threshold)
+
+    def warm_up(self):
+        self.cheap.warm_up()
+        self.expensive.warm_up()
+
+    def stats(self):
+        """Escalation rate and the latency saved by not running the expensive engine"""
+        with self._lock:
+            counters, seconds = dict(self._counters), dict(self._seconds)
+        escalated = counters['escalated']
+        mean_expensive = seconds['expensive'] / escalated if escalated else None
+        stats = dict(counters, accept_confidence=self.accept_confidence,
+                     escalation_rate=round(escalated / counters['requests'], 3) if counters['requests'] else 0.0,
+                     mean_cheap_ms=round(seconds['cheap'] / counters['requests'] * 1000, 2)
+                     if counters['requests'] else 0.0,
+                     mean_expensive_ms=round(mean_expensive * 1000, 2) if mean_expensive is not None else None)
+        if mean_expensive is not None:
+            # Accepted requests skipped one expensive run each; escalated ones
+            # paid for the cheap attempt on top
+            saved = (counters['accepted'] * mean_expensive - seconds['accepted_cheap']
+                     - (seconds['cheap'] - seconds['accepted_cheap']))
+            stats['saved_seconds'] = round(saved, 3)
+            stats['saved_ms_per_request'] = round(saved / counters['requests'] * 1000, 2)
+        return stats
+
+    def metrics(self):
+        return dict(self.expensive.metrics(), cascade=self.stats())
+
+
+def calibrate_threshold(pairs, max_error=5.0, quantile=0.95):
+    """Lowest confidence at which cheap results agree with the expensive engine.
+
+    ``pairs`` are (cheap confidence, cheap fill level, expensive fill level)
+    tuples. Returns the smallest threshold for which the ``quantile`` of
+    absolute fill-level differences among accepted results is at most
+    ``max_error`` percentage points, together with the share of results it
+    accepts, or (None, 0.0) when no threshold qualifies.
+    """
+    pairs = sorted(pairs, key=lambda pair: pair[0], reverse=True)
+    best = (None, 0.0)
+    errors = []
+    for i, (confidence, cheap_fill, expensive_fill) in enumerate(pairs):
+        errors.append(abs(cheap_fill - expensive_fill))
+        # A threshold accepts every result with that confidence, so only
+        # evaluate it after the last one
+        if i + 1 < len(pairs) and pairs[i + 1][0] == confidence:
+            continue
+        if np.quantile(errors, quantile) <= max_error:
+            best = (confidence, len(errors) / len(pairs))
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Calibrate the cascade acceptance confidence on sample photos')
+    parser.add_argument('--images', required=True, help='Directory of representative photos')
+    parser.add_argument('--container-type', required=True, help='Container shown in the photos')
+    parser.add_argument('--checkpoint', default=os.path.join('models', 'checkpoint.pth'))
+    parser.add_argument('--max-error', type=float, default=5.0,
+                        help='Allowed fill-level difference in percentage points')
+    parser.add_argument('--quantile', type=float, default=0.95, help='Share of accepted results within max-error')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    cheap = create_engine('contour')
+    expensive = create_engine('rcnn', args.checkpoint, cache_size=0)
+
+    pairs = []
+    for name in sorted(os.listdir(args.images)):
+        path = os.path.join(args.images, name)
+        if not name.lower().endswith(('.jpg', '.jpeg', '.png')):
+            continue
+        source = ImageSource(path)
+        cheap_result = cheap.process_measurement(source, args.container_type)
+        expensive_result = expensive.process_measurement(source, args.container_type)
+        if cheap_result.get('success') and expensive_result.get('success'):
+            pairs.append((float(cheap_result['confidence']), cheap_result['fill_level'],
+                          expensive_result['fill_level']))
+        else:
+            logger.info(f"Skipping {name}: not measured by both engines")
+
+    threshold, accepted = calibrate_threshold(pairs, args.max_error, args.quantile)
+    print(json.dumps({
+        'samples': len(pairs),
+        'accept_confidence': threshold,
+        'accepted_share': round(accepted, 3)
+    }, indent=2))
+    if threshold is not None:
+        print(f"Set CASCADE_ACCEPT_CONFIDENCE={threshold:.2f}")
+
+
+if __name__ == '__main__':
+    main()
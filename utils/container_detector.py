@@ -2,8 +2,11 @@ import torch
 import torchvision
 import numpy as np
 import cv2
-from typing import Dict, Tuple, List
+from typing import Dict, Tuple, List, Optional
 import logging
+from .container_geometry import ContainerGeometry
+from .fill_workspace import get_workspace
+from .measurement_engine import MeasurementEngine, measurement_result, to_model_tensor
 
 logger = logging.getLogger(__name__)
 
@@ -50,6 +53,7 @@ class ContainerDetector:
                 'relative_size_range': (0.20, 0.35)
             }
         }
+        self.volume_model = ContainerGeometry(self.container_db)
         
     def _load_model(self, model_path: str) -> torch.nn.Module:
         """Load the trained model"""
@@ -91,7 +95,7 @@ class ContainerDetector:
             logger.error(f"Error loading model: {e}")
             raise
             
-    def detect_containers(self, image: np.ndarray) -> List[Dict]:
+    def detect_containers(self, image: np.ndarray, confidence_threshold: float = 0.7) -> List[Dict]:
         """Detect containers in the image with improved accuracy"""
         try:
             # Preprocess image
@@ -108,7 +112,7 @@ class ContainerDetector:
             # Filter predictions
             valid_predictions = []
             for box, score in zip(boxes, scores):
-                if score > 0.7:  # High confidence threshold
+                if score > confidence_threshold:
                     # Get container type and view angle
                     container_type = self._classify_container(box, image.shape)
                     view_angle = self._detect_view_angle(box)
@@ -136,25 +140,19 @@ class ContainerDetector:
             
     def _preprocess_image(self, image: np.ndarray) -> torch.Tensor:
         """Preprocess image for better detection"""
-        # Convert to RGB if needed
+        # Convert to BGR if needed
         if len(image.shape) == 2:
-            image = cv2.cvtColor(image, cv2.COLOR_GRAY2RGB)
+            image = cv2.cvtColor(image, cv2.COLOR_GRAY2BGR)
         elif image.shape[2] == 4:
-            image = cv2.cvtColor(image, cv2.COLOR_BGRA2RGB)
-        elif image.shape[2] == 3:
-            image = cv2.cvtColor(image, cv2.COLOR_BGR2RGB)
+            image = cv2.cvtColor(image, cv2.COLOR_BGRA2BGR)
             
-        # Apply adaptive histogram equalization
-        lab = cv2.cvtColor(image, cv2.COLOR_RGB2LAB)
-        l, a, b = cv2.split(lab)
-        clahe = cv2.createCLAHE(clipLimit=3.0, tileGridSize=(8,8))
-        cl = clahe.apply(l)
-        enhanced = cv2.merge((cl,a,b))
-        enhanced = cv2.cvtColor(enhanced, cv2.COLOR_LAB2RGB)
+        # Apply adaptive histogram equalization to the lightness channel,
+        # in the thread's reusable buffers with a cached CLAHE object
+        enhanced = get_workspace().equalize_lightness(image, cv2.COLOR_BGR2LAB, cv2.COLOR_LAB2RGB,
+                                                      clip_limit=3.0, tile_grid_size=(8, 8))
         
-        # Convert to tensor
-        image_tensor = torch.from_numpy(enhanced).permute(2, 0, 1).float() / 255.0
-        return image_tensor
+        # Convert to tensor (copies out of the workspace buffer)
+        return to_model_tensor(enhanced)
         
     def _classify_container(self, box: np.ndarray, image_shape: Tuple[int, int, int]) -> str:
         """Classify container type with improved accuracy"""
@@ -270,27 +268,8 @@ class ContainerDetector:
                 'is_absolute': False
             }
             
-        # Get container dimensions
-        height_cm = container_info['height_cm']
-        diameter_cm = container_info['diameter_cm']
-        shape = container_info['shape']
         max_volume_ml = container_info['volume_ml']
-        
-        # Calculate volume based on shape
-        if shape == 'cylinder':
-            radius_cm = diameter_cm / 2
-            base_area = np.pi * radius_cm * radius_cm
-            volume_ml = base_area * height_cm * (fill_level / 100)
-        else:  # hemisphere
-            radius_cm = diameter_cm / 2
-            if fill_level <= 50:
-                h = height_cm * (fill_level / 100)
-                volume_ml = (np.pi * h * h * (3 * radius_cm - h)) / 3
-            else:
-                h = height_cm * (1 - fill_level / 100)
-                empty_volume = (np.pi * h * h * (3 * radius_cm - h)) / 3
-                total_volume = (2/3) * np.pi * radius_cm * radius_cm * radius_cm
-                volume_ml = total_volume - empty_volume
+        volume_ml = self.volume_model.volume(container_type, fill_level)
                 
         # Calculate confidence
         if view_angle == "top":
@@ -309,4 +288,55 @@ class ContainerDetector:
             'max_volume_ml': max_volume_ml,
             'confidence': confidence,
             'is_absolute': True
-        } 
\ No newline at end of file
+        } 
+
+
+class ContainerDetectorEngine(MeasurementEngine):
+    """Measurement engine interface for the ResNet50 container detector"""
+
+    name = 'resnet'
+
+    def __init__(self, checkpoint_path: str, confidence_threshold: float = 0.7):
+        self.detector = ContainerDetector(checkpoint_path)
+        self.confidence_threshold = confidence_threshold
+
+    def _measure(self, image, confidence_threshold: Optional[float] = None) -> List[Dict]:
+        """Every detection above ``confidence_threshold`` (default: the engine's).
+
+        The model itself drops boxes scoring below 0.7, so lower thresholds
+        have no effect.
+        """
+        if confidence_threshold is None:
+            confidence_threshold = self.confidence_threshold
+        detections = self.detector.detect_containers(self.load_bgr(image), confidence_threshold)
+        return [
+            measurement_result(d['fill_level'], d['volume_info']['volume_ml'], float(d['score']),
+                               d['container_type'], box=[float(v) for v in d['box']])
+            for d in detections
+            if d['volume_info']['volume_ml'] is not None
+        ]
+
+    def process_measurement(self, image, container_type, ingredient_type=None, **options) -> Dict:
+        # Prefer the requested container type, then the most confident detection
+        measurements = self._measure(image)
+        matching = [m for m in measurements if m['container_type'] == container_type] or measurements
+        if not matching:
+            return {
+                'success': False,
+                'message': 'No container detected in image'
+            }
+        return max(matching, key=lambda m: float(m['confidence']))
+
+    def process_measurements(self, image, container_type=None, ingredient_type=None, confidence_threshold=None) -> Dict:
+        measurements = self._measure(image, confidence_threshold)
+        if not measurements:
+            return {
+                'success': False,
+                'message': 'No container detected in image'
+            }
+        return {
+            'success': True,
+            'count': len(measurements),
+            'total_volume_ml': sum(m['volume_ml'] for m in measurements),
+            'containers': measurements
+        }
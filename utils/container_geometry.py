@@ -0,0 +1,157 @@
+"""
+Container dimensions and vectorized fill-level to volume conversion
+"""
+
+import logging
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# Container database with dimensions
+CONTAINERS = {
+    'teaspoon': {
+        'height_cm': 2.5,
+        'diameter_cm': 4.0,
+        'volume_ml': 5,
+        'shape': 'hemisphere'
+    },
+    'tablespoon': {
+        'height_cm': 3.0,
+        'diameter_cm': 5.0,
+        'volume_ml': 15,
+        'shape': 'hemisphere'
+    },
+    'small_bowl': {
+        'height_cm': 6.0,
+        'diameter_cm': 12.0,
+        'volume_ml': 500,
+        'shape': 'hemisphere'
+    },
+    'small_cup': {
+        'height_cm': 8.0,
+        'diameter_cm': 7.0,
+        'volume_ml': 250,
+        'shape': 'cylinder'
+    },
+    'large_cup': {
+        'height_cm': 10.0,
+        'diameter_cm': 8.0,
+        'volume_ml': 350,
+        'shape': 'cylinder'
+    }
+}
+
+# Detector class names -> container database keys
+DETECTION_LABELS = {
+    'big_cup': 'large_cup',
+    'bowl': 'small_bowl',
+    'small cup': 'small_cup',
+    'small_cup': 'small_cup',
+    'smallspoon': 'teaspoon',
+    'tablespoon': 'tablespoon',
+    'teaspoon': 'teaspoon'
+}
+
+
+# Other names the web pages use for containers in the database
+CONTAINER_ALIASES = {
+    'small_spoon': 'teaspoon'
+}
+
+
+def container_key(name):
+    """Container database key for a requested container type, or None when it is unknown"""
+    name = CONTAINER_ALIASES.get(name, name)
+    return name if name in CONTAINERS else None
+
+
+def container_for_label(label, default=None):
+    """Container database key for a detector class, or ``default`` for non-containers"""
+    return DETECTION_LABELS.get(label, default)
+
+
+def _cap_volume(h, radius):
+    """Volume of a spherical cap of height h"""
+    return (np.pi * h * h * (3 * radius - h)) / 3
+
+
+def geometric_volume(container_info, fill_levels):
+    """Volume in ml from the container's dimensions; fill levels are percentages"""
+    fill = np.asarray(fill_levels, dtype=np.float64)
+    radius = container_info['diameter_cm'] / 2
+    height = container_info['height_cm']
+    if container_info['shape'] == 'cylinder':
+        return np.pi * radius * radius * height * (fill / 100)
+
+    # Hemisphere: fill up to half as a cap, above that as the full bowl minus
+    # the empty cap at the top
+    lower = _cap_volume(height * (fill / 100), radius)
+    total_volume = (2/3) * np.pi * radius * radius * radius
+    upper = total_volume - _cap_volume(height * (1 - fill / 100), radius)
+    return np.where(fill <= 50, lower, upper)
+
+
+def nominal_volume(container_info, fill_levels):
+    """Volume in ml scaled from the nominal capacity; fill levels are fractions"""
+    fill = np.asarray(fill_levels, dtype=np.float64)
+    max_volume = container_info['volume_ml']
+    if container_info['shape'] == 'hemisphere':
+        # For hemisphere, volume is proportional to height^3
+        return max_volume * fill ** 3
+    # For cylinder, volume is proportional to height
+    return max_volume * fill
+
+
+# name -> (volume function, fill level of a full container, discontinuities)
+VOLUME_MODELS = {
+    'geometric': (geometric_volume, 100.0, (50.0,)),
+    'nominal': (nominal_volume, 1.0, ()),
+}
+
+
+class ContainerGeometry:
+    def __init__(self, containers=None, model='geometric', resolution=1001):
+        """Precomputed fill -> volume tables for a set of containers.
+
+        Volumes are interpolated from ``resolution`` evenly spaced fill
+        levels per container, so arrays of readings convert in one call.
+        Fill levels outside [0, full] are clipped.
+        """
+        if model not in VOLUME_MODELS:
+            raise ValueError(f"Unknown volume model: {model}")
+        self.containers = containers if containers is not None else CONTAINERS
+        self.model = model
+        volume_fn, self.full_level, breaks = VOLUME_MODELS[model]
+        # Sample both sides of each discontinuity so interpolation keeps the step
+        edges = [np.nextafter(level, np.inf) for level in breaks]
+        self.fill_levels = np.union1d(np.linspace(0.0, self.full_level, resolution),
+                                      np.array(list(breaks) + edges))
+        self.tables = {
+            name: volume_fn(info, self.fill_levels)
+            for name, info in self.containers.items()
+        }
+
+    def __contains__(self, container_type):
+        return container_type in self.tables
+
+    def volume(self, container_type, fill_levels):
+        """Volume for one container type; returns a float for scalar input"""
+        table = self.tables.get(container_type)
+        if table is None:
+            raise KeyError(f"Unknown container type: {container_type}")
+        volumes = np.interp(fill_levels, self.fill_levels, table)
+        return float(volumes) if np.ndim(volumes) == 0 else volumes
+
+    def volumes(self, container_types, fill_levels):
+        """Volumes for parallel arrays of container types and fill levels"""
+        container_types = np.asarray(container_types)
+        fill_levels = np.asarray(fill_levels, dtype=np.float64)
+        volumes = np.empty(fill_levels.shape, dtype=np.float64)
+        for container_type in np.unique(container_types):
+            mask = container_types == container_type
+            volumes[mask] = self.volume(str(container_type), fill_levels[mask])
+        return volumes
+
+    def max_volume(self, container_type):
+        """Volume of a full container"""
+        return float(self.tables[container_type][-1])
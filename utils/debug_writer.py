@@ -0,0 +1,76 @@
+"""
+Background writer for optional debug renderings of measurements
+"""
+
+import os
+import queue
+import random
+import threading
+import logging
+import cv2
+from .metrics import stage
+
+logger = logging.getLogger(__name__)
+
+
+class DebugArtifactWriter:
+    def __init__(self, output_dir=os.path.join('static', 'uploads'), max_queue=32, sample_rate=0.0):
+        """Render and save debug images on a background thread.
+
+        Jobs are callables returning the image to save, so the copy and
+        drawing also happen off the request path. When the queue is full new
+        jobs are dropped rather than blocking the request.
+        """
+        self.output_dir = output_dir
+        self.sample_rate = sample_rate
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._lock = threading.Lock()
+        self._counters = {'queued': 0, 'written': 0, 'dropped': 0, 'errors': 0}
+        self._thread = threading.Thread(target=self._run, name='debug-writer', daemon=True)
+        self._thread.start()
+
+    def should_render(self, requested=None):
+        """True/False from the request wins; otherwise sample at sample_rate"""
+        if requested is not None:
+            return bool(requested)
+        return self.sample_rate > 0 and random.random() < self.sample_rate
+
+    def submit(self, filename, render):
+        """Queue ``render`` to be saved as ``filename``; returns its URL, or None if dropped"""
+        path = os.path.join(self.output_dir, filename)
+        try:
+            self._queue.put_nowait((path, render))
+        except queue.Full:
+            self._count('dropped')
+            logger.warning(f"Debug writer queue full, dropping {filename}")
+            return None
+        self._count('queued')
+        return '/' + path.replace(os.sep, '/')
+
+    def flush(self):
+        """Block until every queued artifact has been written"""
+        self._queue.join()
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._counters)
+        stats['pending'] = self._queue.qsize()
+        stats['sample_rate'] = self.sample_rate
+        return stats
+
+    def _count(self, name):
+        with self._lock:
+            self._counters[name] += 1
+
+    def _run(self):
+        while True:
+            path, render = self._queue.get()
+            try:
+                with stage('debug_write'):
+                    cv2.imwrite(path, render())
+                self._count('written')
+            except Exception as e:
+                self._count('errors')
+                logger.error(f"Error writing debug image {path}: {e}")
+            finally:
+                self._queue.task_done()
@@ -0,0 +1,81 @@
+"""
+Reusable per-thread buffers for the fill-level image processing hot loop
+"""
+
+import threading
+import logging
+import numpy as np
+import cv2
+
+logger = logging.getLogger(__name__)
+
+_local = threading.local()
+
+
+class FillWorkspace:
+    def __init__(self):
+        """Preallocated buffers and cached OpenCV objects for one thread.
+
+        Buffers grow to the largest image seen and are then reused, so
+        steady-state calls write into existing memory instead of allocating
+        new arrays. Arrays returned by a method are only valid until the
+        next call that uses the same buffer names.
+        """
+        self._buffers = {}
+        self._clahe = {}
+
+    def buffer(self, name, shape, dtype=np.uint8):
+        """Contiguous array of ``shape`` backed by the named, reusable buffer"""
+        dtype = np.dtype(dtype)
+        size = int(np.prod(shape))
+        flat = self._buffers.get(name)
+        if flat is None or flat.dtype != dtype or flat.size < size:
+            flat = np.empty(size, dtype=dtype)
+            self._buffers[name] = flat
+        return flat[:size].reshape(shape)
+
+    def clahe(self, clip_limit=2.0, tile_grid_size=(8, 8)):
+        """Cached CLAHE object for the given parameters"""
+        key = (clip_limit, tuple(tile_grid_size))
+        clahe = self._clahe.get(key)
+        if clahe is None:
+            clahe = cv2.createCLAHE(clipLimit=clip_limit, tileGridSize=tuple(tile_grid_size))
+            self._clahe[key] = clahe
+        return clahe
+
+    def gray(self, image, code=cv2.COLOR_RGB2GRAY, name='gray'):
+        """Grayscale copy of a colour image (or ROI view) in a reused buffer"""
+        gray = self.buffer(name, image.shape[:2])
+        return cv2.cvtColor(image, code, dst=gray)
+
+    def threshold(self, image, prefix='roi'):
+        """Grayscale, 5x5 Gaussian blur and inverted adaptive threshold, all in reused buffers"""
+        gray = self.gray(image, name=f'{prefix}_gray')
+        blurred = self.buffer(f'{prefix}_blur', gray.shape)
+        cv2.GaussianBlur(gray, (5, 5), 0, dst=blurred)
+        # The blur is no longer needed after thresholding, so the gray
+        # buffer holds the result
+        return cv2.adaptiveThreshold(blurred, 255, cv2.ADAPTIVE_THRESH_GAUSSIAN_C,
+                                     cv2.THRESH_BINARY_INV, 11, 2, dst=gray)
+
+    def equalize_lightness(self, image, code=cv2.COLOR_BGR2LAB, back=cv2.COLOR_LAB2RGB,
+                           clip_limit=3.0, tile_grid_size=(8, 8)):
+        """CLAHE on the L channel of a colour image without splitting or merging channels"""
+        height, width = image.shape[:2]
+        lab = self.buffer('lab', (height, width, 3))
+        cv2.cvtColor(image, code, dst=lab)
+        lightness = self.buffer('lightness', (height, width))
+        cv2.extractChannel(lab, 0, dst=lightness)
+        self.clahe(clip_limit, tile_grid_size).apply(lightness, dst=lightness)
+        cv2.insertChannel(lightness, lab, 0)
+        out = self.buffer('equalized', (height, width, 3))
+        return cv2.cvtColor(lab, back, dst=out)
+
+
+def get_workspace():
+    """Workspace of the calling thread, created on first use"""
+    workspace = getattr(_local, 'workspace', None)
+    if workspace is None:
+        workspace = FillWorkspace()
+        _local.workspace = workspace
+    return workspace
@@ -0,0 +1,135 @@
+"""
+In-memory image decoding helpers for the measurement pipeline
+"""
+
+import io
+import os
+import logging
+import numpy as np
+import cv2
+from PIL import Image
+
+logger = logging.getLogger(__name__)
+
+# Match PIL's behaviour of not applying EXIF rotation so results are the
+# same whether a frame arrives as a file or as an in-memory buffer
+IMREAD_FLAGS = cv2.IMREAD_COLOR | cv2.IMREAD_IGNORE_ORIENTATION
+
+
+def decode_image_bytes(data) -> np.ndarray:
+    """Decode an encoded image buffer (JPEG, PNG, ...) into an RGB array"""
+    buffer = np.frombuffer(data, dtype=np.uint8)
+    image = cv2.imdecode(buffer, IMREAD_FLAGS)
+    if image is None:
+        raise ValueError("Could not decode image data")
+    return cv2.cvtColor(image, cv2.COLOR_BGR2RGB)
+
+
+def load_image(image) -> np.ndarray:
+    """Load an image from a path, encoded bytes, PIL image or RGB array.
+
+    NumPy arrays are assumed to already be RGB and are returned unchanged.
+    """
+    if isinstance(image, np.ndarray):
+        return image
+    if isinstance(image, (bytes, bytearray, memoryview)):
+        return decode_image_bytes(image)
+    if isinstance(image, Image.Image):
+        return np.asarray(image.convert("RGB"))
+    if isinstance(image, (str, os.PathLike)):
+        bgr = cv2.imread(os.fspath(image), IMREAD_FLAGS)
+        if bgr is None:
+            raise ValueError(f"Could not read image: {image}")
+        return cv2.cvtColor(bgr, cv2.COLOR_BGR2RGB)
+    raise TypeError(f"Unsupported image type: {type(image).__name__}")
+
+
+def image_name(image):
+    """Return the file name of a path-like image source, or None"""
+    if isinstance(image, (str, os.PathLike)):
+        return os.path.basename(os.fspath(image))
+    return None
+
+
+def _reduced_decode_flag(width, height, max_side):
+    """Largest IMREAD_REDUCED_* factor that keeps the long side at or above max_side"""
+    for factor, flag in ((8, cv2.IMREAD_REDUCED_COLOR_8), (4, cv2.IMREAD_REDUCED_COLOR_4),
+                         (2, cv2.IMREAD_REDUCED_COLOR_2)):
+        if max(width, height) / factor >= max_side:
+            return flag
+    return cv2.IMREAD_COLOR
+
+
+def fit_to_side(image, max_side):
+    """Downscale an array so its long side is at most max_side"""
+    height, width = image.shape[:2]
+    if max(height, width) <= max_side:
+        return image
+    ratio = max_side / max(height, width)
+    size = (max(1, round(width * ratio)), max(1, round(height * ratio)))
+    return cv2.resize(image, size, interpolation=cv2.INTER_AREA)
+
+
+class ImageSource:
+    """An image that is decoded lazily, at full or reduced resolution.
+
+    Detection runs on a reduced copy while the full-resolution pixels are
+    only decoded if a caller actually asks for them.
+    """
+
+    def __init__(self, image):
+        self.source = image
+        self.name = image_name(image)
+        self._full = None
+        self._reduced = {}
+        if isinstance(image, (np.ndarray, Image.Image)):
+            self._full = load_image(image)
+
+    def full(self) -> np.ndarray:
+        """Full-resolution RGB array, decoded on first use"""
+        if self._full is None:
+            self._full = load_image(self.source)
+        return self._full
+
+    def size(self):
+        """(width, height) of the full image, read from the header when possible"""
+        if self._full is not None:
+            return self._full.shape[1], self._full.shape[0]
+        if isinstance(self.source, (bytes, bytearray, memoryview)):
+            with Image.open(io.BytesIO(self.source)) as header:
+                return header.size
+        with Image.open(self.source) as header:
+            return header.size
+
+    def reduced(self, max_side):
+        """Return (rgb_array, (scale_x, scale_y)) with the long side at most max_side.
+
+        Multiply coordinates in the reduced array by the scales to map them
+        back to the full-resolution image.
+        """
+        if not max_side:
+            return self.full(), (1.0, 1.0)
+        if max_side in self._reduced:
+            return self._reduced[max_side]
+
+        width, height = self.size()
+        if self._full is not None:
+            reduced = fit_to_side(self._full, max_side)
+        else:
+            flags = _reduced_decode_flag(width, height, max_side)
+            if flags == cv2.IMREAD_COLOR:
+                # No reduction possible at decode time; keep the full decode
+                reduced = fit_to_side(self.full(), max_side)
+            else:
+                if isinstance(self.source, (bytes, bytearray, memoryview)):
+                    buffer = np.frombuffer(self.source, dtype=np.uint8)
+                else:
+                    buffer = np.fromfile(os.fspath(self.source), dtype=np.uint8)
+                bgr = cv2.imdecode(buffer, flags | cv2.IMREAD_IGNORE_ORIENTATION)
+                if bgr is None:
+                    raise ValueError("Could not decode image data")
+                reduced = fit_to_side(cv2.cvtColor(bgr, cv2.COLOR_BGR2RGB), max_side)
+
+        scale = (width / reduced.shape[1], height / reduced.shape[0])
+        self._reduced[max_side] = (reduced, scale)
+        return reduced, scale
@@ -0,0 +1,302 @@
+"""
+Pluggable inference runtimes for the RCNN measurement detector.
+
+The eager PyTorch model is always built first (it is the reference). Other
+backends export it once to an optimized format, cache the artifact next to
+the checkpoint and are only used after a parity check against eager output.
+"""
+
+import os
+import json
+import inspect
+import logging
+import numpy as np
+import torch
+
+logger = logging.getLogger(__name__)
+
+# The parity check compares the highest-scoring raw detections (the model
+# keeps up to 100 above its own box_score_thresh of 0.05) instead of only
+# confident ones, so frames with nothing confident still exercise the graph
+PARITY_TOP_K = 100
+
+
+class EagerBackend:
+    name = 'eager'
+    exact = True
+
+    def __init__(self, model, checkpoint_path=None):
+        self.model = model
+
+    def predict(self, image_tensors):
+        """Run the model on a list of CHW float tensors"""
+        with torch.no_grad():
+            return self.model(image_tensors)
+
+
+class _ExportedBackend:
+    """Shared artifact caching for backends that export the eager model"""
+    name = None
+    suffix = None
+    exact = True
+
+    def __init__(self, model, checkpoint_path=None):
+        self.artifact_path = self._artifact_path(checkpoint_path)
+        if self.artifact_path and self._artifact_is_fresh(checkpoint_path):
+            logger.info(f"Loading cached {self.name} artifact from {self.artifact_path}")
+            self._load(self.artifact_path)
+            return
+
+        # Without a checkpoint the weights are random, so the artifact is
+        # built in memory (or in a scratch file) and never cached
+        logger.info(f"Exporting RCNN model to {self.name}")
+        self._export(model, self.artifact_path)
+        if self.artifact_path:
+            self._write_metadata(checkpoint_path)
+
+    def _artifact_path(self, checkpoint_path):
+        if not checkpoint_path or not os.path.exists(checkpoint_path):
+            return None
+        return os.path.splitext(checkpoint_path)[0] + self.suffix
+
+    @staticmethod
+    def _source_signature(checkpoint_path):
+        stat = os.stat(checkpoint_path)
+        return {
+            'checkpoint_size': stat.st_size,
+            'checkpoint_mtime': stat.st_mtime,
+            'torch_version': torch.__version__,
+        }
+
+    def _artifact_is_fresh(self, checkpoint_path):
+        """The artifact is reused only if it was exported from this exact checkpoint"""
+        metadata_path = self.artifact_path + '.json'
+        if not (os.path.exists(self.artifact_path) and os.path.exists(metadata_path)):
+            return False
+        try:
+            with open(metadata_path, 'r') as f:
+                return json.load(f) == self._source_signature(checkpoint_path)
+        except Exception as e:
+            logger.warning(f"Ignoring unreadable {self.name} artifact metadata: {e}")
+            return False
+
+    def _write_metadata(self, checkpoint_path):
+        with open(self.artifact_path + '.json', 'w') as f:
+            json.dump(self._source_signature(checkpoint_path), f, indent=2)
+
+    def _export(self, model, artifact_path):
+        raise NotImplementedError
+
+    def _load(self, artifact_path):
+        raise NotImplementedError
+
+
+class TorchScriptBackend(_ExportedBackend):
+    name = 'torchscript'
+    suffix = '.torchscript.pt'
+
+    def _export(self, model, artifact_path):
+        self.module = torch.jit.script(model)
+        if artifact_path:
+            self.module.save(artifact_path)
+
+    def _load(self, artifact_path):
+        self.module = torch.jit.load(artifact_path, map_location='cpu')
+        self.module.eval()
+
+    def predict(self, image_tensors):
+        with torch.no_grad():
+            # Scripted detection models always return (losses, detections)
+            _, detections = self.module(image_tensors)
+        return detections
+
+
+class OnnxBackend(_ExportedBackend):
+    name = 'onnx'
+    suffix = '.onnx'
+    export_size = (480, 640)
+
+    def __init__(self, model, checkpoint_path=None):
+        try:
+            import onnxruntime
+        except ImportError:
+            raise ImportError("The onnx backend requires the onnxruntime package (pip install onnxruntime)")
+        self._ort = onnxruntime
+        super().__init__(model, checkpoint_path)
+
+    def _export(self, model, artifact_path):
+        path = artifact_path or os.path.join('models', f'.rcnn_export_{os.getpid()}.onnx')
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        dummy = torch.rand(3, *self.export_size)
+
+        kwargs = {}
+        if 'dynamo' in inspect.signature(torch.onnx.export).parameters:
+            # The TorchScript-based exporter handles the detection post-processing
+            kwargs['dynamo'] = False
+        torch.onnx.export(
+            model, ([dummy],), path,
+            opset_version=11,
+            input_names=['image'],
+            output_names=['boxes', 'labels', 'scores'],
+            dynamic_axes={'image': [1, 2], 'boxes': [0], 'labels': [0], 'scores': [0]},
+            **kwargs
+        )
+        self._load(path)
+        if not artifact_path:
+            os.remove(path)
+
+    def _load(self, artifact_path):
+        options = self._ort.SessionOptions()
+        options.graph_optimization_level = self._ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        self.session = self._ort.InferenceSession(artifact_path, options, providers=['CPUExecutionProvider'])
+
+    def predict(self, image_tensors):
+        # The exported graph takes a single image, so batches run one at a time
+        predictions = []
+        for tensor in image_tensors:
+            boxes, labels, scores = self.session.run(None, {'image': tensor.cpu().numpy()})
+            predictions.append({
+                'boxes': torch.from_numpy(boxes),
+                'labels': torch.from_numpy(labels),
+                'scores': torch.from_numpy(scores)
+            })
+        return predictions
+
+
+class QuantizedBackend(EagerBackend):
+    """INT8 model built in memory at startup; see utils/quantization.py"""
+    name = 'int8'
+    # Quantized outputs are expected to drift from float32, so create_backend
+    # reports the drift instead of enforcing exact parity
+    exact = False
+
+    def __init__(self, model, checkpoint_path=None, mode='dynamic', calibration_dir=None):
+        from .quantization import quantize_model, load_calibration_images
+        calibration_images = load_calibration_images(calibration_dir) if calibration_dir else None
+        super().__init__(quantize_model(model, mode, calibration_images))
+        self.mode = mode
+
+
+BACKENDS = {
+    EagerBackend.name: EagerBackend,
+    TorchScriptBackend.name: TorchScriptBackend,
+    OnnxBackend.name: OnnxBackend,
+    QuantizedBackend.name: QuantizedBackend,
+}
+
+
+def parity_images(directory=None):
+    """Frames used to compare backends when none are given.
+
+    Real images are loaded from ``directory`` (default RCNN_PARITY_IMAGE_DIR)
+    when it is set; otherwise two synthetic frames are used.
+    """
+    directory = directory or os.getenv('RCNN_PARITY_IMAGE_DIR')
+    if directory:
+        from .quantization import load_calibration_images
+        images = load_calibration_images(directory)
+        if images:
+            return images
+        logger.warning(f"No parity images found in {directory}, using synthetic frames")
+
+    images = []
+    for height, width in ((480, 640), (720, 1280)):
+        frame = np.full((height, width, 3), 200, dtype=np.uint8)
+        yy, xx = np.ogrid[:height, :width]
+        disc = (yy - height // 2) ** 2 + (xx - width // 2) ** 2 < (min(height, width) // 4) ** 2
+        frame[disc] = (120, 90, 60)
+        images.append(torch.from_numpy(frame).permute(2, 0, 1).float() / 255.0)
+    return images
+
+
+def _match_detections(ref, out, top_k):
+    """Match ref's top_k detections to the closest same-label box among all of out's.
+
+    Random or weakly trained weights give many boxes the same score, so the
+    match is by box rather than by rank. Returns (count, box diff, score diff).
+    """
+    order = torch.argsort(ref['scores'], descending=True)[:top_k]
+    if len(order) == 0:
+        return 0, 0.0, 0.0
+    if len(out['scores']) == 0:
+        return len(order), float('inf'), float('inf')
+    ref_boxes = ref['boxes'][order].float()
+    distance = (ref_boxes[:, None, :] - out['boxes'][None, :, :].float()).abs().amax(dim=2)
+    same_label = ref['labels'][order].long()[:, None] == out['labels'].long()[None, :]
+    distance = torch.where(same_label, distance, torch.full_like(distance, float('inf')))
+    box_diff, nearest = distance.min(dim=1)
+    score_diff = (ref['scores'][order].float() - out['scores'][nearest].float()).abs()
+    return len(order), float(box_diff.max()), float(score_diff.max())
+
+
+def check_parity(reference, candidate, image_tensors=None, box_atol=1.0, score_atol=1e-3, top_k=PARITY_TOP_K):
+    """Compare a candidate backend's raw detections with the eager reference.
+
+    Returns a report dict; ``passed`` is True when each image's top_k boxes
+    from either backend have a same-label counterpart in the other within
+    tolerance, and at least one detection was compared.
+    """
+    image_tensors = image_tensors if image_tensors is not None else parity_images()
+    report = {
+        'passed': True,
+        'backend': candidate.name,
+        'images': len(image_tensors),
+        'detections_compared': 0,
+        'max_box_diff': 0.0,
+        'max_score_diff': 0.0,
+        'mismatches': []
+    }
+    expected = reference.predict(image_tensors)
+    actual = candidate.predict(image_tensors)
+    for index, (ref, out) in enumerate(zip(expected, actual)):
+        # Both directions, so neither side can drop or invent boxes
+        ref_count, ref_box_diff, ref_score_diff = _match_detections(ref, out, top_k)
+        out_count, out_box_diff, out_score_diff = _match_detections(out, ref, top_k)
+        box_diff = max(ref_box_diff, out_box_diff)
+        score_diff = max(ref_score_diff, out_score_diff)
+        report['detections_compared'] += ref_count + out_count
+        report['max_box_diff'] = max(report['max_box_diff'], box_diff)
+        report['max_score_diff'] = max(report['max_score_diff'], score_diff)
+        if box_diff > box_atol or score_diff > score_atol:
+            report['passed'] = False
+            report['mismatches'].append(
+                f"image {index}: {ref_count} eager vs {out_count} {candidate.name} detections, "
+                f"box diff {box_diff:.3f}, score diff {score_diff:.4f}")
+    if report['detections_compared'] == 0:
+        report['passed'] = False
+        report['mismatches'].append("no detections to compare; set RCNN_PARITY_IMAGE_DIR to real images")
+    return report
+
+
+def create_backend(name, model, checkpoint_path=None, verify=True, verify_images=None, **backend_options):
+    """Build the named backend, falling back to eager if it fails to build or verify.
+
+    ``backend_options`` are passed to the backend constructor (for example
+    the quantization mode of the int8 backend).
+    """
+    eager = EagerBackend(model)
+    if name in (None, '', EagerBackend.name):
+        return eager
+    if name not in BACKENDS:
+        raise ValueError(f"Unknown inference backend: {name}. Choose from {', '.join(BACKENDS)}")
+
+    try:
+        backend = BACKENDS[name](model, checkpoint_path, **backend_options)
+    except Exception as e:
+        logger.error(f"Error building {name} backend, using eager PyTorch: {e}")
+        return eager
+
+    if verify and not backend.exact:
+        report = check_parity(eager, backend, verify_images, box_atol=float('inf'), score_atol=float('inf'))
+        if not report['detections_compared']:
+            logger.warning(f"{name} backend drift could not be measured: {report['mismatches']}")
+        logger.info(f"{name} backend drift vs eager over {report['detections_compared']} detections: "
+                    f"max box diff {report['max_box_diff']:.2f}px, max score diff {report['max_score_diff']:.4f}")
+    elif verify:
+        report = check_parity(eager, backend, verify_images)
+        if not report['passed']:
+            logger.error(f"{name} backend failed parity check, using eager PyTorch: {report['mismatches']}")
+            return eager
+        logger.info(f"{name} backend passed parity check on {report['detections_compared']} detections "
+                    f"(max box diff {report['max_box_diff']:.4f}, max score diff {report['max_score_diff']:.5f})")
+    return backend
@@ -0,0 +1,122 @@
+"""
+Micro-batching scheduler that merges concurrent detector calls into one forward pass
+"""
+
+import queue
+import threading
+import time
+import logging
+from concurrent.futures import Future
+from .metrics import add_timings, collect_timings
+
+logger = logging.getLogger(__name__)
+
+_STOP = object()
+
+
+class InferenceBatcher:
+    def __init__(self, predict_fn, max_batch_size=4, max_wait_ms=5.0, name='inference-batcher'):
+        """Start a scheduler thread around ``predict_fn``.
+
+        ``predict_fn`` takes a list of image tensors and returns one
+        prediction per tensor, in order (the FasterRCNN calling convention).
+        Requests are collected until ``max_batch_size`` are waiting or
+        ``max_wait_ms`` has passed since the first one arrived.
+        """
+        if max_batch_size < 1:
+            raise ValueError("max_batch_size must be at least 1")
+        self.predict_fn = predict_fn
+        self.max_batch_size = max_batch_size
+        self.max_wait = max(0.0, max_wait_ms) / 1000.0
+        self._queue = queue.Queue()
+        self._closed = False
+        self._stats_lock = threading.Lock()
+        self.stats = {'batches': 0, 'requests': 0, 'max_batch_seen': 0}
+        self._thread = threading.Thread(target=self._run, name=name, daemon=True)
+        self._thread.start()
+        logger.info(f"Inference batcher started (max_batch_size={max_batch_size}, max_wait_ms={max_wait_ms})")
+
+    def submit(self, image_tensor) -> Future:
+        """Queue a single image tensor and return a future for its prediction"""
+        if self._closed:
+            raise RuntimeError("Inference batcher is closed")
+        future = Future()
+        self._queue.put((image_tensor, future))
+        return future
+
+    def predict(self, image_tensor, timeout=None):
+        """Run one image through the batched model and wait for its prediction.
+
+        Stages timed during the shared forward pass (the model.* hooks) are
+        added to the caller's request timings; they cover the whole batch.
+        """
+        future = self.submit(image_tensor)
+        prediction = future.result(timeout=timeout)
+        add_timings(getattr(future, 'timings', None))
+        return prediction
+
+    def close(self, timeout=None):
+        """Stop accepting work, finish queued requests and stop the thread"""
+        if self._closed:
+            return
+        self._closed = True
+        self._queue.put(_STOP)
+        self._thread.join(timeout)
+
+    def _collect_batch(self, first):
+        """Gather more requests behind ``first`` until the batch is full or the wait expires"""
+        batch = [first]
+        stop = False
+        deadline = time.monotonic() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            try:
+                item = self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if item is _STOP:
+                stop = True
+                break
+            batch.append(item)
+        return batch, stop
+
+    def _run(self):
+        while True:
+            item = self._queue.get()
+            if item is _STOP:
+                break
+            batch, stop = self._collect_batch(item)
+            self._run_batch(batch)
+            if stop:
+                break
+
+        # Fail anything that slipped in after close() so callers do not hang
+        while True:
+            try:
+                item = self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if item is not _STOP:
+                item[1].set_exception(RuntimeError("Inference batcher is closed"))
+
+    def _run_batch(self, batch):
+        # Skip requests whose callers cancelled while waiting in the queue
+        live = [(tensor, future) for tensor, future in batch if future.set_running_or_notify_cancel()]
+        if not live:
+            return
+        tensors = [tensor for tensor, _ in live]
+        futures = [future for _, future in live]
+        try:
+            with collect_timings() as timings:
+                predictions = self.predict_fn(tensors)
+            for future, prediction in zip(futures, predictions):
+                future.timings = timings
+                future.set_result(prediction)
+        except Exception as e:
+            logger.error(f"Error running inference batch of {len(tensors)}: {e}")
+            for future in futures:
+                future.set_exception(e)
+        with self._stats_lock:
+            self.stats['batches'] += 1
+            self.stats['requests'] += len(tensors)
+            self.stats['max_batch_seen'] = max(self.stats['max_batch_seen'], len(tensors))
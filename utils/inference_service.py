@@ -0,0 +1,294 @@
+"""
+Out-of-process inference service shared by all web workers.
+
+A pool of worker processes each loads the RCNN measurement model once. Web
+workers talk to the pool through InferenceClient over a local socket, so the
+number of gunicorn workers no longer multiplies model memory.
+
+Connections are authenticated with a shared secret, because requests and
+results are pickled. It comes from INFERENCE_SERVICE_AUTHKEY; without it
+the service generates a random key and writes it next to its Unix socket
+(readable only by its user), where clients pick it up. TCP addresses are
+refused unless INFERENCE_SERVICE_AUTHKEY is set.
+
+Run with: python -m utils.inference_service --workers 2
+"""
+
+import os
+import argparse
+import logging
+import threading
+import time
+import secrets
+import multiprocessing
+from multiprocessing.connection import Listener, Client
+from .metrics import stage
+from .admission import configure_threads, thread_budget
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_ADDRESS = '/tmp/bakegenie-inference.sock'
+AUTHKEY_ENV = 'INFERENCE_SERVICE_AUTHKEY'
+
+# Measurement engine methods that clients are allowed to call
+ALLOWED_OPS = ('process_measurement', 'get_measurement', 'process_image', 'warm_up', 'cache_stats', 'metrics',
+               'measure_frame', 'process_measurements')
+
+# Per-process model instance, created by the pool initializer
+_worker_system = None
+
+
+def parse_address(address):
+    """Turn 'host:port' into a TCP address; anything else is a Unix socket path"""
+    if ':' in address and not address.startswith('/'):
+        host, port = address.rsplit(':', 1)
+        return (host, int(port))
+    return address
+
+
+def authkey_path(address):
+    """File holding the generated key of a Unix socket service"""
+    return f'{address}.key'
+
+
+def resolve_authkey(address, create=False):
+    """Shared secret for ``address`` (as returned by parse_address).
+
+    INFERENCE_SERVICE_AUTHKEY wins. Otherwise Unix socket services use a
+    random key stored in authkey_path(address): the service creates it
+    (``create=True``) and clients read it. TCP addresses have no key file
+    and need the environment variable.
+    """
+    key = os.getenv(AUTHKEY_ENV)
+    if key:
+        return key.encode()
+    if not isinstance(address, str):
+        raise ValueError(f"TCP inference service addresses need {AUTHKEY_ENV} to be set")
+
+    path = authkey_path(address)
+    if not create:
+        with open(path, 'r') as f:
+            return f.read().strip().encode()
+    key = secrets.token_hex(32)
+    if os.path.exists(path):
+        os.remove(path)
+    fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+    with os.fdopen(fd, 'w') as f:
+        f.write(key)
+    return key.encode()
+
+
+def _init_worker(checkpoint_path, torch_threads, options):
+    """Load the model once per worker process"""
+    global _worker_system
+    from utils.measurement_engine import create_engine
+
+    # Give each process its share of the cores instead of letting every
+    # process spawn one intra-op thread per core
+    configure_threads(torch_threads)
+    options = dict(options)
+    _worker_system = create_engine(options.pop('engine', None), checkpoint_path, **options)
+    logger.info(f"Inference worker {os.getpid()} ready ({torch_threads} torch threads)")
+
+
+def _run_op(op, args, kwargs):
+    """Execute a measurement call inside a worker process"""
+    return getattr(_worker_system, op)(*args, **kwargs)
+
+
+class InferenceService:
+    def __init__(self, address=DEFAULT_ADDRESS, authkey=None, workers=1,
+                 checkpoint_path=os.path.join('models', 'checkpoint.pth'), options=None):
+        """Create the worker pool and the socket listener.
+
+        ``options`` are passed to RCNNMeasurementSystem in every worker.
+        ``authkey`` defaults to resolve_authkey(address, create=True).
+        """
+        self.address = parse_address(address)
+        # Resolved first: a TCP address without a configured secret is refused
+        # before any model is loaded
+        self.authkey = authkey or resolve_authkey(self.address, create=True)
+        self.workers = workers
+        torch_threads = thread_budget(workers)
+
+        # spawn avoids forking a process that may already hold torch threads
+        context = multiprocessing.get_context('spawn')
+        self.pool = context.Pool(workers, initializer=_init_worker,
+                                 initargs=(checkpoint_path, torch_threads, options or {}))
+
+        if isinstance(self.address, str) and os.path.exists(self.address):
+            os.remove(self.address)
+        self.listener = Listener(self.address, authkey=self.authkey)
+        if isinstance(self.address, str):
+            os.chmod(self.address, 0o600)
+        logger.info(f"Inference service listening on {address} with {workers} workers")
+
+    def serve_forever(self):
+        """Accept client connections, one handler thread per connection"""
+        try:
+            while True:
+                try:
+                    conn = self.listener.accept()
+                except Exception as e:
+                    logger.error(f"Error accepting inference client: {e}")
+                    continue
+                threading.Thread(target=self._handle_connection, args=(conn,), daemon=True).start()
+        finally:
+            self.close()
+
+    def _handle_connection(self, conn):
+        with conn:
+            while True:
+                try:
+                    op, args, kwargs = conn.recv()
+                except (EOFError, OSError):
+                    return
+                try:
+                    if op not in ALLOWED_OPS:
+                        raise ValueError(f"Unsupported inference operation: {op}")
+                    result = self.pool.apply(_run_op, (op, args, kwargs))
+                    conn.send(('ok', result))
+                except Exception as e:
+                    logger.error(f"Error running {op} in inference pool: {e}")
+                    conn.send(('error', str(e)))
+
+    def close(self):
+        self.listener.close()
+        self.pool.terminate()
+        self.pool.join()
+        if isinstance(self.address, str):
+            for path in (self.address, authkey_path(self.address)):
+                if os.path.exists(path):
+                    os.remove(path)
+
+
+class InferenceClient:
+    def __init__(self, address=DEFAULT_ADDRESS, authkey=None, connect_timeout=60.0):
+        """Client exposing the RCNNMeasurementSystem measurement API over IPC.
+
+        ``authkey`` defaults to resolve_authkey(address), read on first
+        connect since the service writes its key file once it starts.
+        """
+        self.address = parse_address(address)
+        self.authkey = authkey
+        self.connect_timeout = connect_timeout
+        # One connection per web thread so requests never interleave
+        self._local = threading.local()
+
+    def _connect(self):
+        deadline = time.monotonic() + self.connect_timeout
+        while True:
+            try:
+                authkey = self.authkey or resolve_authkey(self.address)
+                return Client(self.address, authkey=authkey)
+            except (FileNotFoundError, ConnectionRefusedError):
+                # The service may still be loading its models
+                if time.monotonic() >= deadline:
+                    raise
+                time.sleep(0.5)
+
+    def _call(self, op, *args, **kwargs):
+        with stage(f'inference_service.{op}'):
+            return self._send(op, *args, **kwargs)
+
+    def _send(self, op, *args, **kwargs):
+        for attempt in range(2):
+            conn = getattr(self._local, 'conn', None)
+            if conn is None:
+                conn = self._local.conn = self._connect()
+            try:
+                conn.send((op, args, kwargs))
+                status, payload = conn.recv()
+                break
+            except (EOFError, OSError):
+                # Service restarted; reconnect once
+                self._local.conn = None
+                if attempt:
+                    raise
+        if status == 'error':
+            raise RuntimeError(payload)
+        return payload
+
+    def warm_up(self):
+        """Wait for the service to accept connections and run one warm-up pass"""
+        self._call('warm_up')
+
+    def cache_stats(self):
+        """Result cache metrics of whichever service worker answers"""
+        return self._call('cache_stats')
+
+    def metrics(self):
+        """Pipeline metrics of whichever service worker answers"""
+        return self._call('metrics')
+
+    def process_measurement(self, image, container_type, ingredient_type=None, debug_name=None, debug=None):
+        """Process measurement in the shared inference service"""
+        try:
+            return self._call('process_measurement', image, container_type, ingredient_type,
+                              debug_name=debug_name, debug=debug)
+        except Exception as e:
+            logger.error(f"Error in remote process_measurement: {str(e)}")
+            return {
+                'success': False,
+                'message': f'Error processing measurement: {str(e)}'
+            }
+
+    def get_measurement(self, image, container_type, debug_name=None, debug=None):
+        """Get measurement for a specific container type from the shared service"""
+        try:
+            return self._call('get_measurement', image, container_type, debug_name=debug_name, debug=debug)
+        except Exception as e:
+            logger.error(f"Error in remote get_measurement: {str(e)}")
+            return {
+                'error': f'Error processing measurement: {str(e)}'
+            }
+
+    def process_measurements(self, image, container_type=None, ingredient_type=None, confidence_threshold=None):
+        """Measure every detected container in the shared inference service"""
+        try:
+            return self._call('process_measurements', image, container_type, ingredient_type,
+                              confidence_threshold=confidence_threshold)
+        except Exception as e:
+            logger.error(f"Error in remote process_measurements: {str(e)}")
+            return {
+                'success': False,
+                'message': f'Error processing measurements: {str(e)}'
+            }
+
+    def measure_frame(self, image, container_type, box=None, confidence_threshold=None):
+        """Measure one streamed frame in the shared inference service"""
+        try:
+            return self._call('measure_frame', image, container_type, box=box,
+                              confidence_threshold=confidence_threshold)
+        except Exception as e:
+            logger.error(f"Error in remote measure_frame: {str(e)}")
+            return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description='BakeGenie shared inference service')
+    parser.add_argument('--address', default=os.getenv('INFERENCE_SERVICE_ADDRESS', DEFAULT_ADDRESS),
+                        help='Unix socket path or host:port to listen on')
+    parser.add_argument('--workers', type=int, default=int(os.getenv('INFERENCE_WORKERS', '1')),
+                        help='Number of model-holding worker processes')
+    parser.add_argument('--checkpoint', default=os.path.join('models', 'checkpoint.pth'),
+                        help='Path to the RCNN checkpoint')
+    parser.add_argument('--backend', default=os.getenv('RCNN_BACKEND', 'eager'),
+                        help='Inference runtime: eager, torchscript, onnx or int8')
+    parser.add_argument('--engine', default=os.getenv('MEASUREMENT_ENGINE', 'rcnn'),
+                        help='Measurement engine: rcnn, legacy_rcnn, resnet, contour or cascade')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    from utils.measurement_engine import engine_options_from_env, override_rcnn_options
+    # Each worker serves one request at a time, so there is nothing to batch
+    options = override_rcnn_options(args.engine, engine_options_from_env(args.engine),
+                                    backend=args.backend, max_batch_size=1)
+    options['engine'] = args.engine
+    service = InferenceService(args.address, workers=args.workers, checkpoint_path=args.checkpoint,
+                               options=options)
+    service.serve_forever()
+
+
+if __name__ == '__main__':
+    main()
@@ -3,6 +3,9 @@ import numpy as np
 import logging
 from typing import Dict, Tuple, Optional
 from .calibration import calibrator
+from .fill_workspace import get_workspace
+from .container_geometry import ContainerGeometry
+from .measurement_engine import MeasurementEngine, measurement_result
 
 logger = logging.getLogger(__name__)
 
@@ -16,17 +19,17 @@ class MeasurementDetector:
         
     def preprocess_image(self, image: np.ndarray) -> np.ndarray:
         """Enhance image quality for better detection"""
+        workspace = get_workspace()
+        
         # Convert to grayscale
-        gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+        gray = workspace.gray(image, cv2.COLOR_BGR2GRAY, name='detector_gray')
         
-        # Apply adaptive histogram equalization
-        clahe = cv2.createCLAHE(clipLimit=2.0, tileGridSize=(8,8))
-        enhanced = clahe.apply(gray)
+        # Apply adaptive histogram equalization with a cached CLAHE object
+        workspace.clahe(2.0, (8, 8)).apply(gray, dst=gray)
         
         # Apply Gaussian blur to reduce noise
-        blurred = cv2.GaussianBlur(enhanced, (5, 5), 0)
-        
-        return blurred
+        blurred = workspace.buffer('detector_blur', gray.shape)
+        return cv2.GaussianBlur(gray, (5, 5), 0, dst=blurred)
     
     def detect_container(self, image: np.ndarray) -> Tuple[Optional[np.ndarray], float]:
         """Detect measuring container in the image"""
@@ -125,8 +128,8 @@ class MeasurementDetector:
                 volume = calibrator.get_calibrated_volume(tool_type, pixel_height)
                 
             # Validate measurement if volume is available
-            if volume:
-                is_valid = calibrator.validate_measurement(tool_type, volume)
+            if volume is not None:
+                is_valid, _ = calibrator.validate_measurement(volume, tool_type)
                 if not is_valid:
                     return {
                         'success': False,
@@ -146,4 +149,41 @@ class MeasurementDetector:
             return {
                 'success': False,
                 'message': str(e)
-            } 
\ No newline at end of file
+            } 
+
+
+class ContourEngine(MeasurementEngine):
+    """Measurement engine interface for the contour-only detector.
+
+    Uses the calibrated volume when the tool has been calibrated and the
+    geometric container model otherwise.
+    """
+
+    name = 'contour'
+
+    def __init__(self, checkpoint_path: Optional[str] = None, confidence_threshold: float = 0.0):
+        self.detector = MeasurementDetector()
+        self.volume_model = ContainerGeometry()
+        self.confidence_threshold = confidence_threshold
+
+    def process_measurement(self, image, container_type, ingredient_type=None, **options) -> Dict:
+        result = self.detector.process_measurement(self.load_bgr(image), container_type)
+        if not result['success']:
+            return result
+        if result['confidence'] < self.confidence_threshold:
+            return {
+                'success': False,
+                'message': 'No measuring container detected'
+            }
+
+        fill_level = float(result['fill_percentage']) * 100
+        volume_ml = result['volume']
+        if volume_ml is None:
+            if container_type not in self.volume_model:
+                return {
+                    'success': False,
+                    'message': f'Unknown container type: {container_type}'
+                }
+            volume_ml = self.volume_model.volume(container_type, fill_level)
+        return measurement_result(fill_level, float(volume_ml), result['confidence'], container_type,
+                                  pixel_height=int(result['pixel_height']))
@@ -0,0 +1,169 @@
+"""
+Common interface and registry for the measurement implementations.
+
+Every engine takes the same inputs (path, encoded bytes, PIL image or RGB
+array) and returns the same result dictionaries, so the app can switch
+implementations with the MEASUREMENT_ENGINE environment variable.
+"""
+
+import os
+import logging
+import importlib
+import numpy as np
+from .image_io import ImageSource
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_ENGINE = 'rcnn'
+
+# Engine name -> "module:factory"; factories are imported only when selected
+ENGINES = {
+    'rcnn': 'utils.rcnn_measurement_system:create_measurement_system',
+    'legacy_rcnn': 'rcnn_measurement:LegacyRCNNEngine',
+    'resnet': 'utils.container_detector:ContainerDetectorEngine',
+    'contour': 'utils.measurement_detector:ContourEngine',
+    'cascade': 'utils.cascade:CascadeEngine',
+}
+
+IMAGENET_MEAN = (0.485, 0.456, 0.406)
+IMAGENET_STD = (0.229, 0.224, 0.225)
+
+
+def register_engine(name, target):
+    """Register an engine factory given as "module:callable" """
+    ENGINES[name] = target
+
+
+def engine_factory(name):
+    """Import and return the factory of a registered engine"""
+    if name not in ENGINES:
+        raise ValueError(f"Unknown measurement engine: {name} (available: {', '.join(sorted(ENGINES))})")
+    module_name, attr = ENGINES[name].split(':')
+    return getattr(importlib.import_module(module_name), attr)
+
+
+def engine_options_from_env(name):
+    """Read engine options from the deployment environment"""
+    if name == 'rcnn':
+        from .rcnn_measurement_system import rcnn_options_from_env
+        options = rcnn_options_from_env()
+    elif name == 'cascade':
+        from .rcnn_measurement_system import rcnn_options_from_env
+        # Unset: nothing is accepted from the contour engine until a threshold
+        # has been calibrated (python -m utils.cascade)
+        accept_confidence = os.getenv('CASCADE_ACCEPT_CONFIDENCE')
+        options = {
+            'accept_confidence': float(accept_confidence) if accept_confidence else None,
+            'expensive_options': rcnn_options_from_env()
+        }
+    else:
+        options = {}
+    if os.getenv('MEASUREMENT_CONFIDENCE'):
+        options['confidence_threshold'] = float(os.getenv('MEASUREMENT_CONFIDENCE'))
+    return options
+
+
+def override_rcnn_options(name, options, **overrides):
+    """Apply RCNN-specific options to the RCNN engine of ``name``.
+
+    For rcnn they are engine options; the cascade engine passes them to its
+    expensive engine. Other engines don't take them.
+    """
+    if name == 'rcnn':
+        options.update(overrides)
+    elif name == 'cascade':
+        options['expensive_options'] = dict(options.get('expensive_options') or {}, **overrides)
+    return options
+
+
+def create_engine(name=None, checkpoint_path=None, **options):
+    """Build the engine selected by ``name`` or MEASUREMENT_ENGINE"""
+    name = name or os.getenv('MEASUREMENT_ENGINE', DEFAULT_ENGINE)
+    logger.info(f"Creating measurement engine: {name}")
+    return engine_factory(name)(checkpoint_path, **options)
+
+
+def to_model_tensor(rgb, normalize=False):
+    """Shared normalization: HWC uint8 RGB array -> CHW float tensor in [0, 1].
+
+    With ``normalize`` the ImageNet mean and std are applied as well.
+    """
+    import torch
+    tensor = torch.from_numpy(np.ascontiguousarray(rgb)).permute(2, 0, 1).float().div_(255.0)
+    if normalize:
+        mean = torch.tensor(IMAGENET_MEAN).view(3, 1, 1)
+        std = torch.tensor(IMAGENET_STD).view(3, 1, 1)
+        tensor = (tensor - mean) / std
+    return tensor
+
+
+def measurement_result(fill_level, volume_ml, confidence, container_type, **extra):
+    """Result dictionary in the format returned by every engine"""
+    return {
+        'success': True,
+        'fill_level': fill_level,
+        'volume': f"{volume_ml:.1f}ml",
+        'volume_ml': volume_ml,
+        'confidence': f"{confidence:.2f}",
+        'container_type': container_type,
+        **extra
+    }
+
+
+class MeasurementEngine:
+    """Interface shared by all measurement implementations.
+
+    Subclasses implement process_measurement; the other methods have
+    generic fallbacks built on it.
+    """
+
+    name = None
+    confidence_threshold = 0.5
+
+    @staticmethod
+    def load(image):
+        """Shared decode: wrap any supported image input in a lazily decoded ImageSource"""
+        return image if isinstance(image, ImageSource) else ImageSource(image)
+
+    @classmethod
+    def load_bgr(cls, image):
+        """Full-resolution BGR array for implementations written against cv2.imread"""
+        import cv2
+        return cv2.cvtColor(cls.load(image).full(), cv2.COLOR_RGB2BGR)
+
+    def process_measurement(self, image, container_type, ingredient_type=None, **options):
+        raise NotImplementedError
+
+    def process_measurements(self, image, container_type=None, ingredient_type=None, confidence_threshold=None):
+        """Multi-object measurement; engines that find a single container return one entry"""
+        result = self.process_measurement(image, container_type, ingredient_type)
+        if not result.get('success'):
+            return result
+        container = {key: value for key, value in result.items() if key != 'success'}
+        return {
+            'success': True,
+            'count': 1,
+            'total_volume_ml': result['volume_ml'],
+            'containers': [container]
+        }
+
+    def measure_frame(self, image, container_type, box=None, confidence_threshold=None):
+        """Measure a streamed frame; engines without box tracking measure it from scratch"""
+        result = self.process_measurement(image, container_type)
+        if not result.get('success'):
+            return None
+        return {
+            'fill_level': result['fill_level'],
+            'volume_ml': result['volume_ml'],
+            'confidence': float(result['confidence']),
+            'container_type': result['container_type'],
+            'box': result.get('box'),
+            'detected': True
+        }
+
+    def warm_up(self):
+        """Run a dummy measurement so the first request doesn't pay for lazy initialization"""
+        return None
+
+    def metrics(self):
+        return {}
@@ -0,0 +1,141 @@
+"""
+Per-stage latency timers and histograms for measurement requests
+"""
+
+import time
+import bisect
+import threading
+import logging
+import contextvars
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+# Upper bounds of the histogram buckets in milliseconds
+BUCKETS_MS = (1, 2.5, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000, float('inf'))
+
+# Timings of the request being handled in this context, or None
+_timings = contextvars.ContextVar('stage_timings', default=None)
+
+
+class LatencyHistogram:
+    def __init__(self, buckets_ms=BUCKETS_MS):
+        """Fixed-bucket latency histogram"""
+        self.buckets_ms = buckets_ms
+        self.counts = [0] * len(buckets_ms)
+        self.count = 0
+        self.total_ms = 0.0
+        self.max_ms = 0.0
+
+    def observe(self, ms):
+        self.counts[bisect.bisect_left(self.buckets_ms, ms)] += 1
+        self.count += 1
+        self.total_ms += ms
+        self.max_ms = max(self.max_ms, ms)
+
+    def quantile(self, q):
+        """Upper bound of the bucket holding the q-th quantile"""
+        if not self.count:
+            return 0.0
+        rank, seen = q * self.count, 0
+        for bound, count in zip(self.buckets_ms, self.counts):
+            seen += count
+            if seen >= rank:
+                return min(bound, self.max_ms)
+        return self.max_ms
+
+    def snapshot(self):
+        return {
+            'count': self.count,
+            'mean_ms': round(self.total_ms / self.count, 3) if self.count else 0.0,
+            'p50_ms': round(self.quantile(0.5), 3),
+            'p95_ms': round(self.quantile(0.95), 3),
+            'max_ms': round(self.max_ms, 3),
+            'buckets': {
+                ('+Inf' if bound == float('inf') else str(bound)): count
+                for bound, count in zip(self.buckets_ms, self.counts)
+            },
+        }
+
+
+class StageMetrics:
+    def __init__(self):
+        """Latency histograms keyed by stage name"""
+        self._histograms = {}
+        self._lock = threading.Lock()
+
+    def observe(self, name, ms):
+        with self._lock:
+            histogram = self._histograms.get(name)
+            if histogram is None:
+                histogram = self._histograms[name] = LatencyHistogram()
+            histogram.observe(ms)
+
+    def snapshot(self):
+        with self._lock:
+            return {name: histogram.snapshot() for name, histogram in sorted(self._histograms.items())}
+
+    def reset(self):
+        with self._lock:
+            self._histograms.clear()
+
+
+# Process-wide histograms, exposed by /api/metrics
+stage_metrics = StageMetrics()
+
+
+def observe(name, seconds):
+    """Record a stage duration in the histograms and the current request's timings"""
+    ms = seconds * 1000
+    stage_metrics.observe(name, ms)
+    timings = _timings.get()
+    if timings is not None:
+        timings[name] = round(timings.get(name, 0.0) + ms, 3)
+
+
+def add_timings(timings):
+    """Add stages timed in another context (e.g. a shared batch) to the current request's timings"""
+    current = _timings.get()
+    if current is not None and timings:
+        for name, ms in timings.items():
+            current[name] = round(current.get(name, 0.0) + ms, 3)
+
+
+@contextmanager
+def stage(name):
+    """Time a block of pipeline work as stage ``name``"""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe(name, time.perf_counter() - start)
+
+
+@contextmanager
+def collect_timings():
+    """Collect the stages timed inside the block into the yielded dict (in ms)"""
+    timings = {}
+    token = _timings.set(timings)
+    try:
+        yield timings
+    finally:
+        _timings.reset(token)
+
+
+def instrument_module(module, name):
+    """Time every forward call of a torch module as stage ``name``.
+
+    Uses forward hooks, so it works for submodules (backbone, RPN, ROI
+    heads) that the pipeline never calls directly.
+    """
+    local = threading.local()
+
+    def before(_module, _inputs):
+        local.start = time.perf_counter()
+
+    def after(_module, _inputs, _outputs):
+        start = getattr(local, 'start', None)
+        if start is not None:
+            observe(name, time.perf_counter() - start)
+
+    return module.register_forward_pre_hook(before), module.register_forward_hook(after)
@@ -0,0 +1,199 @@
+"""
+Local cache of model checkpoints with integrity hashes and mmap-able weights.
+
+A checkpoint is downloaded once, checked against its SHA-256 and converted
+to a weights-only file that torch can memory-map. Worker processes then
+map the same file instead of unpickling their own copy, so the weights
+live once in the OS page cache. Hashes are recorded in a manifest next to
+the models together with each file's size and mtime; later startups only
+stat the files and re-hash when they changed. A changed checkpoint must
+still match MODEL_SHA256 (or the recorded hash) before it is loaded.
+
+Run once before starting the workers (start.sh does):
+    python -m utils.model_store fetch
+"""
+
+import os
+import json
+import hashlib
+import argparse
+import logging
+from contextlib import contextmanager
+from .atomic_file import atomic_write, file_lock
+
+logger = logging.getLogger(__name__)
+
+MODEL_PATH = os.path.join('models', 'checkpoint.pth')
+MODEL_URL = 'https://drive.google.com/uc?id=1VaB9qmln89nWr74fhceatvvaTqUQMgqU'
+
+WEIGHTS_SUFFIX = '.weights.pt'
+
+
+class IntegrityError(ValueError):
+    """A checkpoint does not match its expected SHA-256"""
+
+
+def file_sha256(path, chunk_size=1024 * 1024):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class ModelStore:
+    def __init__(self, root='models'):
+        """Checkpoints and their converted weights under ``root``, tracked in manifest.json"""
+        self.root = root
+        self.manifest_path = os.path.join(root, 'manifest.json')
+
+    @contextmanager
+    def _locked(self):
+        """Serialize downloads and conversions across processes"""
+        os.makedirs(self.root, exist_ok=True)
+        with file_lock(os.path.join(self.root, '.lock')):
+            yield
+
+    def _read_manifest(self):
+        try:
+            with open(self.manifest_path, 'r') as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return {}
+        except Exception as e:
+            logger.warning(f"Ignoring unreadable model manifest: {e}")
+            return {}
+
+    def _write_manifest(self, manifest):
+        with atomic_write(self.manifest_path) as f:
+            json.dump(manifest, f, indent=2)
+
+    @staticmethod
+    def _stat(path):
+        stat = os.stat(path)
+        return {'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns}
+
+    def verified_hash(self, path, sha256=None):
+        """SHA-256 of ``path``, checked against ``sha256`` or else the hash recorded for it.
+
+        The file is only hashed when its size or mtime changed since it was
+        recorded. Raises IntegrityError, without recording anything, when the
+        hash differs from the expected one.
+        """
+        with self._locked():
+            return self._verified_hash(path, sha256)
+
+    def _verified_hash(self, path, sha256=None):
+        key = os.path.relpath(path, self.root)
+        manifest = self._read_manifest()
+        entry = manifest.get(key) or {}
+        stat = self._stat(path)
+        unchanged = bool(entry) and all(entry.get(field) == value for field, value in stat.items())
+        actual = entry['sha256'] if unchanged else file_sha256(path)
+
+        expected = sha256 or entry.get('sha256')
+        if expected and actual != expected:
+            raise IntegrityError(f"{path} has SHA-256 {actual}, expected {expected}")
+        if not unchanged:
+            manifest[key] = dict(sha256=actual, **stat)
+            self._write_manifest(manifest)
+        return actual
+
+    def _forget(self, path):
+        manifest = self._read_manifest()
+        if manifest.pop(os.path.relpath(path, self.root), None) is not None:
+            self._write_manifest(manifest)
+
+    def fetch(self, path=MODEL_PATH, url=MODEL_URL, sha256=None):
+        """Make sure the checkpoint exists and matches ``sha256`` (when given); returns its path"""
+        with self._locked():
+            if not os.path.exists(path):
+                import gdown
+                logger.info(f"Model not found. Downloading {url}")
+                partial = path + '.partial'
+                gdown.download(url, partial, quiet=False)
+                if sha256 and file_sha256(partial) != sha256:
+                    os.remove(partial)
+                    raise IntegrityError(f"Downloaded model does not match the expected SHA-256 {sha256}")
+                os.replace(partial, path)
+                # A fresh download replaces whatever was recorded for the old file
+                self._forget(path)
+                logger.info("Model downloaded successfully")
+
+            actual = self._verified_hash(path, sha256)
+            self._convert(path, actual)
+        return path
+
+    def weights_path(self, checkpoint_path, sha256):
+        """Converted weights are named after the checkpoint hash, so a new checkpoint never reuses stale ones"""
+        base = os.path.splitext(checkpoint_path)[0]
+        return f'{base}.{sha256[:16]}{WEIGHTS_SUFFIX}'
+
+    def _convert(self, checkpoint_path, sha256):
+        """Write the model_state_dict alone in torch's mmap-able zip format.
+
+        Existing weights are reused only while they match the hash recorded
+        when they were written; anything else is converted again.
+        """
+        weights_path = self.weights_path(checkpoint_path, sha256)
+        if os.path.exists(weights_path):
+            try:
+                if os.path.relpath(weights_path, self.root) in self._read_manifest():
+                    self._verified_hash(weights_path)
+                    return weights_path
+            except IntegrityError as e:
+                logger.warning(f"Converting again: {e}")
+        import torch
+        logger.info(f"Converting {checkpoint_path} to mmap-able weights")
+        checkpoint = torch.load(checkpoint_path, map_location='cpu', weights_only=False)
+        state_dict = checkpoint.get('model_state_dict', checkpoint)
+        with atomic_write(weights_path, 'wb') as f:
+            torch.save(state_dict, f)
+        self._forget(weights_path)
+        self._verified_hash(weights_path)
+        return weights_path
+
+    def load_state_dict(self, checkpoint_path, sha256=None):
+        """Memory-mapped state dict of a verified checkpoint, converting it on first use.
+
+        The checkpoint must match ``sha256`` (or its recorded hash) and the
+        weights file the hash recorded at conversion; IntegrityError
+        otherwise. Pass the result to
+        ``module.load_state_dict(state_dict, assign=True)`` so the parameters
+        keep pointing at the shared mapping instead of being copied into
+        private memory.
+        """
+        import torch
+        with self._locked():
+            actual = self._verified_hash(checkpoint_path, sha256)
+            weights_path = self._convert(checkpoint_path, actual)
+        return torch.load(weights_path, map_location='cpu', mmap=True, weights_only=True)
+
+
+def load_state_dict(checkpoint_path):
+    """Memory-mapped state dict of ``checkpoint_path``, verified against MODEL_SHA256 when set"""
+    store = ModelStore(os.path.dirname(checkpoint_path) or '.')
+    return store.load_state_dict(checkpoint_path, sha256=os.getenv('MODEL_SHA256'))
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Download, verify and convert model checkpoints')
+    parser.add_argument('command', choices=('fetch', 'verify'))
+    parser.add_argument('--path', default=MODEL_PATH, help='Checkpoint path')
+    parser.add_argument('--url', default=os.getenv('MODEL_URL', MODEL_URL), help='Download URL')
+    parser.add_argument('--sha256', default=os.getenv('MODEL_SHA256'), help='Expected SHA-256 of the checkpoint')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    store = ModelStore(os.path.dirname(args.path) or '.')
+    try:
+        if args.command == 'fetch':
+            store.fetch(args.path, args.url, args.sha256)
+        sha256 = store.verified_hash(args.path, args.sha256)
+    except IntegrityError as e:
+        raise SystemExit(f"{e}; pass --sha256 (or set MODEL_SHA256) to accept a new checkpoint")
+    print(f"{args.path} sha256={sha256}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,99 @@
+"""
+Fast image quality checks run before detection
+"""
+
+import math
+import logging
+import cv2
+
+logger = logging.getLogger(__name__)
+
+# Reason -> message asking the user for a better photo
+RETAKE_MESSAGES = {
+    'blurry': 'Image is too blurry, hold the camera steady and retake the photo',
+    'dark': 'Image is too dark, add light and retake the photo',
+    'overexposed': 'Image is overexposed, reduce glare and retake the photo',
+    'empty': 'No object visible, point the camera at the container',
+    'tiny': 'Container is too small in the frame, move closer and retake the photo',
+}
+
+
+class QualityGate:
+    def __init__(self, side=256, min_sharpness=15.0, min_brightness=35.0, max_brightness=230.0,
+                 max_clipped=0.6, min_contrast=8.0, min_object_fraction=0.01):
+        """Reject frames that cannot produce a measurement.
+
+        All checks run on a grayscale copy whose long side is at most
+        ``side`` pixels, so a frame is judged in a couple of milliseconds:
+
+        - sharpness: variance of the Laplacian
+        - exposure: mean brightness and the share of clipped pixels
+        - empty: overall contrast
+        - tiny: area of the largest edge-bounded object, or of the tracked
+          box, as a share of the frame
+        """
+        self.side = side
+        self.min_sharpness = min_sharpness
+        self.min_brightness = min_brightness
+        self.max_brightness = max_brightness
+        self.max_clipped = max_clipped
+        self.min_contrast = min_contrast
+        self.min_object_fraction = min_object_fraction
+
+    def measure(self, image, box=None):
+        """Quality statistics of an RGB frame; ``box`` is in the frame's coordinates"""
+        # Grayscale first, then an integer-factor area resize: several times
+        # faster than resizing the colour frame to an arbitrary size
+        gray = cv2.cvtColor(image, cv2.COLOR_RGB2GRAY)
+        factor = math.ceil(max(gray.shape) / self.side)
+        if factor > 1:
+            gray = cv2.resize(gray, None, fx=1 / factor, fy=1 / factor, interpolation=cv2.INTER_AREA)
+        height, width = gray.shape
+
+        hist = cv2.calcHist([gray], [0], None, [256], [0, 256]).ravel() / gray.size
+        mean, std = cv2.meanStdDev(gray)
+        stats = {
+            'sharpness': float(cv2.Laplacian(gray, cv2.CV_32F).var()),
+            'brightness': float(mean[0, 0]),
+            'contrast': float(std[0, 0]),
+            'dark_fraction': float(hist[:16].sum()),
+            'bright_fraction': float(hist[240:].sum()),
+        }
+
+        if box is not None:
+            scale = width / image.shape[1]
+            x1, y1, x2, y2 = (float(v) * scale for v in box)
+            object_area = max(0.0, x2 - x1) * max(0.0, y2 - y1)
+        else:
+            edges = cv2.dilate(cv2.Canny(gray, 50, 150), None, iterations=2)
+            contours, _ = cv2.findContours(edges, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+            object_area = max((w * h for _, _, w, h in map(cv2.boundingRect, contours)), default=0)
+        stats['object_fraction'] = float(object_area / (width * height))
+        return stats
+
+    def check(self, image, box=None):
+        """Return (ok, reason, stats); reason is a key of RETAKE_MESSAGES"""
+        stats = self.measure(image, box)
+        if stats['brightness'] < self.min_brightness or stats['dark_fraction'] > self.max_clipped:
+            reason = 'dark'
+        elif stats['brightness'] > self.max_brightness or stats['bright_fraction'] > self.max_clipped:
+            reason = 'overexposed'
+        elif stats['contrast'] < self.min_contrast:
+            reason = 'empty'
+        elif stats['sharpness'] < self.min_sharpness:
+            reason = 'blurry'
+        elif stats['object_fraction'] < self.min_object_fraction:
+            reason = 'tiny'
+        else:
+            reason = None
+        return reason is None, reason, stats
+
+    def rejection(self, reason, stats):
+        """Response for a rejected frame"""
+        return {
+            'success': False,
+            'retake': True,
+            'reason': reason,
+            'message': RETAKE_MESSAGES[reason],
+            'quality': {key: round(value, 3) for key, value in stats.items()}
+        }
@@ -0,0 +1,179 @@
+"""
+INT8 quantization of the RCNN measurement detector for CPU-only hosts.
+
+Two modes are supported:
+- dynamic: the box head and predictor Linear layers are quantized with
+  dynamic (per-batch) activation ranges. No calibration data is needed.
+- static: additionally quantizes the MobileNetV2 feature extractor with
+  activation ranges observed on calibration images.
+
+Run as a script to report the accuracy delta against the float32 model:
+python -m utils.quantization --images path/to/photos --container-type teaspoon
+"""
+
+import os
+import copy
+import json
+import time
+import argparse
+import logging
+import numpy as np
+import torch
+import torchvision
+from torch import nn
+from torch.ao import quantization as tq
+from torchvision.transforms import functional as F
+from .image_io import load_image
+
+logger = logging.getLogger(__name__)
+
+QUANT_MODES = ('dynamic', 'static')
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.bmp', '.webp')
+
+
+class QuantizedFeatures(nn.Module):
+    """MobileNetV2 feature extractor running in INT8 between quant/dequant stubs"""
+
+    def __init__(self, features, out_channels):
+        super().__init__()
+        self.quant = tq.QuantStub()
+        self.features = features
+        self.dequant = tq.DeQuantStub()
+        self.out_channels = out_channels
+
+    def forward(self, x):
+        return self.dequant(self.features(self.quant(x)))
+
+
+def select_quantized_engine():
+    """Pick the best quantized kernel library available on this CPU"""
+    engines = torch.backends.quantized.supported_engines
+    for engine in ('x86', 'fbgemm', 'qnnpack'):
+        if engine in engines:
+            torch.backends.quantized.engine = engine
+            return engine
+    raise RuntimeError("No quantized engine is available in this PyTorch build")
+
+
+def load_calibration_images(directory, limit=32):
+    """Load up to ``limit`` images from a directory as CHW float tensors"""
+    tensors = []
+    for name in sorted(os.listdir(directory)):
+        if not name.lower().endswith(IMAGE_EXTENSIONS):
+            continue
+        try:
+            tensors.append(F.to_tensor(load_image(os.path.join(directory, name))))
+        except Exception as e:
+            logger.warning(f"Skipping calibration image {name}: {e}")
+        if len(tensors) >= limit:
+            break
+    return tensors
+
+
+def _quantizable_features(float_features):
+    """Copy float MobileNetV2 features into torchvision's quantizable variant, fused"""
+    qmodel = torchvision.models.quantization.mobilenet_v2(weights=None, quantize=False)
+    qmodel.features.load_state_dict(float_features.state_dict())
+    qmodel.eval()
+    qmodel.fuse_model()
+    return qmodel.features
+
+
+def quantize_model(model, mode='dynamic', calibration_images=None):
+    """Return an INT8 copy of the FasterRCNN model; the float model is left untouched"""
+    if mode not in QUANT_MODES:
+        raise ValueError(f"Unknown quantization mode: {mode}. Choose from {', '.join(QUANT_MODES)}")
+    engine = select_quantized_engine()
+    qmodel = copy.deepcopy(model).eval()
+
+    if mode == 'static':
+        if not calibration_images:
+            from .inference_backends import parity_images
+            logger.warning("No calibration images given; calibrating on synthetic frames")
+            calibration_images = parity_images()
+
+        features = QuantizedFeatures(_quantizable_features(qmodel.backbone), qmodel.backbone.out_channels)
+        features.qconfig = tq.get_default_qconfig(engine)
+        tq.prepare(features, inplace=True)
+        qmodel.backbone = features
+
+        # Observe activation ranges on real inputs, passed through the
+        # model's own resize and normalization
+        with torch.no_grad():
+            for image in calibration_images:
+                qmodel([image])
+        tq.convert(features, inplace=True)
+
+    # Box head (TwoMLPHead) and predictor are Linear layers, which dynamic
+    # quantization handles without calibration data
+    qmodel.roi_heads = tq.quantize_dynamic(qmodel.roi_heads, {nn.Linear}, dtype=torch.qint8)
+    logger.info(f"Quantized RCNN model ({mode} mode, {engine} engine)")
+    return qmodel
+
+
+def compare_measurements(reference, candidate, images, container_type, confidence_threshold=0.5):
+    """Measure the same images with two systems and report fill level and volume deltas"""
+    fill_deltas, volume_deltas = [], []
+    latencies = {'reference': [], 'candidate': []}
+    agreement = 0
+    for image in images:
+        results = {}
+        for key, system in (('reference', reference), ('candidate', candidate)):
+            start = time.perf_counter()
+            results[key] = system.process_image(image, container_type, confidence_threshold)
+            latencies[key].append(time.perf_counter() - start)
+
+        ref, out = results['reference'], results['candidate']
+        if (ref is None) == (out is None):
+            agreement += 1
+        if ref is not None and out is not None:
+            fill_deltas.append(abs(ref['fill_level'] - out['fill_level']))
+            volume_deltas.append(abs(ref['volume_ml'] - out['volume_ml']))
+
+    def summary(values):
+        if not values:
+            return {'mean': None, 'max': None}
+        return {'mean': float(np.mean(values)), 'max': float(np.max(values))}
+
+    return {
+        'images': len(images),
+        'container_type': container_type,
+        'detection_agreement': agreement / len(images) if images else None,
+        'compared': len(fill_deltas),
+        'fill_level_abs_delta_pct': summary(fill_deltas),
+        'volume_abs_delta_ml': summary(volume_deltas),
+        'mean_latency_ms': {key: float(np.mean(values) * 1000) if values else None
+                            for key, values in latencies.items()},
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Report INT8 accuracy delta for the RCNN measurement model')
+    parser.add_argument('--images', required=True, help='Directory of evaluation photos')
+    parser.add_argument('--container-type', default='teaspoon', help='Container type to measure')
+    parser.add_argument('--checkpoint', default=os.path.join('models', 'checkpoint.pth'))
+    parser.add_argument('--mode', choices=QUANT_MODES, default='dynamic')
+    parser.add_argument('--calibration-images', help='Directory of calibration photos for static mode')
+    parser.add_argument('--output', help='Write the JSON report to this file')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    from .rcnn_measurement_system import RCNNMeasurementSystem
+
+    options = {'mode': args.mode, 'calibration_dir': args.calibration_images}
+    reference = RCNNMeasurementSystem(args.checkpoint)
+    candidate = RCNNMeasurementSystem(args.checkpoint, backend='int8', backend_options=options)
+    # Decoded up front so both systems see identical arrays and no debug files are written
+    images = [load_image(os.path.join(args.images, name)) for name in sorted(os.listdir(args.images))
+              if name.lower().endswith(IMAGE_EXTENSIONS)]
+
+    report = compare_measurements(reference, candidate, images, args.container_type)
+    report['mode'] = args.mode
+    print(json.dumps(report, indent=2))
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -3,17 +3,70 @@ import torchvision
 from torchvision.models.detection import FasterRCNN
 from torchvision.models.detection.rpn import AnchorGenerator
 from torchvision.transforms import functional as F
-from PIL import Image
 import numpy as np
 import cv2
 import os
+import uuid
 import logging
+from collections import Counter
+from .image_io import ImageSource
+from .inference_batcher import InferenceBatcher
+from .inference_backends import create_backend
+from .result_cache import MeasurementCache, dhash
+from .debug_writer import DebugArtifactWriter
+from .model_store import IntegrityError, load_state_dict
+from .quality_gate import QualityGate
+from .fill_workspace import get_workspace
+from .metrics import stage, instrument_module
+from .container_geometry import CONTAINERS, ContainerGeometry, container_for_label
+from .measurement_engine import MeasurementEngine, to_model_tensor
 
 logger = logging.getLogger(__name__)
 
-class RCNNMeasurementSystem:
-    def __init__(self, checkpoint_path=None):
-        self.model = self._load_model(checkpoint_path)
+class RCNNMeasurementSystem(MeasurementEngine):
+    name = 'rcnn'
+
+    def __init__(self, checkpoint_path=None, max_batch_size=1, max_batch_wait_ms=5.0, backend='eager',
+                 backend_options=None, detect_max_side=1333, fill_min_roi_side=128,
+                 cache_size=0, cache_ttl_seconds=30.0, cache_max_distance=0,
+                 debug_sample_rate=0.0, debug_queue_size=32, confidence_threshold=0.5,
+                 pretrained_backbone=True, quality_gate=False, quality_options=None):
+        # pretrained_backbone=False builds an untrained model fully offline
+        self.model = self._load_model(checkpoint_path, pretrained_backbone)
+        self.confidence_threshold = confidence_threshold
+        
+        # Detection runs on frames whose long side is at most detect_max_side
+        # (FasterRCNN resizes to max 1333 internally anyway); fill analysis
+        # falls back to full resolution for ROIs smaller than fill_min_roi_side
+        self.detect_max_side = detect_max_side
+        self.fill_min_roi_side = fill_min_roi_side
+        
+        # Runtime used for the forward pass; non-eager backends are built
+        # from self.model once and verified against it
+        self.backend = create_backend(backend, self.model, checkpoint_path, **(backend_options or {}))
+        if self.backend.name == 'eager':
+            # Per-stage forward timings; exported backends run as one opaque graph
+            for name in ('transform', 'backbone', 'rpn', 'roi_heads'):
+                instrument_module(getattr(self.model, name), f'model.{name}')
+        
+        # With max_batch_size > 1 concurrent requests share FasterRCNN forward passes
+        self.batcher = None
+        if max_batch_size > 1:
+            self.batcher = InferenceBatcher(self._forward, max_batch_size=max_batch_size,
+                                            max_wait_ms=max_batch_wait_ms, name='rcnn-batcher')
+        
+        # Results for near-identical frames are reused when cache_size > 0
+        self.result_cache = None
+        if cache_size > 0:
+            self.result_cache = MeasurementCache(cache_size, cache_ttl_seconds, cache_max_distance)
+        
+        # Debug renderings are optional and written off the request path
+        self.debug_writer = DebugArtifactWriter(max_queue=debug_queue_size, sample_rate=debug_sample_rate)
+        
+        # Blurry, badly exposed or empty frames are turned away before detection
+        self.quality_gate = QualityGate(**(quality_options or {})) if quality_gate else None
+        self.quality_rejections = Counter()
+        
         self.category_mapping = {
             1: 'objects',
             2: 'big_cup',
@@ -25,45 +78,18 @@ class RCNNMeasurementSystem:
             8: 'teaspoon'
         }
         
-        # Container database with dimensions
-        self.container_database = {
-            'teaspoon': {
-                'height_cm': 2.5,
-                'diameter_cm': 4.0,
-                'volume_ml': 5,
-                'shape': 'hemisphere'
-            },
-            'tablespoon': {
-                'height_cm': 3.0,
-                'diameter_cm': 5.0,
-                'volume_ml': 15,
-                'shape': 'hemisphere'
-            },
-            'small_bowl': {
-                'height_cm': 6.0,
-                'diameter_cm': 12.0,
-                'volume_ml': 500,
-                'shape': 'hemisphere'
-            },
-            'small_cup': {
-                'height_cm': 8.0,
-                'diameter_cm': 7.0,
-                'volume_ml': 250,
-                'shape': 'cylinder'
-            },
-            'large_cup': {
-                'height_cm': 10.0,
-                'diameter_cm': 8.0,
-                'volume_ml': 350,
-                'shape': 'cylinder'
-            }
-        }
+        # Container database with dimensions and precomputed volume tables
+        self.container_database = CONTAINERS
+        self.volume_model = ContainerGeometry(self.container_database)
 
-    def _load_model(self, checkpoint_path):
+    def _load_model(self, checkpoint_path, pretrained_backbone=True):
         """Load the trained RCNN model or create a new one if checkpoint not found"""
         try:
-            # Create model with MobileNetV2 backbone
-            backbone = torchvision.models.mobilenet_v2(weights='DEFAULT').features
+            # Create model with MobileNetV2 backbone. ImageNet weights are only
+            # fetched when there is no checkpoint to overwrite them
+            has_checkpoint = bool(checkpoint_path and os.path.exists(checkpoint_path))
+            weights = 'DEFAULT' if pretrained_backbone and not has_checkpoint else None
+            backbone = torchvision.models.mobilenet_v2(weights=weights).features
             backbone.out_channels = 1280
 
             # Create anchor generator
@@ -88,10 +114,11 @@ class RCNNMeasurementSystem:
             )
 
             # Try to load checkpoint if provided
-            if checkpoint_path and os.path.exists(checkpoint_path):
+            if has_checkpoint:
                 logger.info(f"Loading checkpoint from {checkpoint_path}")
-                checkpoint = torch.load(checkpoint_path, map_location=torch.device('cpu'))
-                model.load_state_dict(checkpoint['model_state_dict'])
+                # Memory-mapped weights, assigned rather than copied, so every
+                # worker process shares one copy through the page cache
+                model.load_state_dict(load_state_dict(checkpoint_path), assign=True)
             else:
                 logger.warning(f"No checkpoint found at {checkpoint_path}. Using untrained model.")
             
@@ -102,18 +129,96 @@ class RCNNMeasurementSystem:
             logger.error(f"Error loading model: {str(e)}")
             raise
 
-    def calculate_fill_level(self, roi, container_type, image_path):
-        """Calculate fill level using basic thresholding"""
+    def _forward(self, image_tensors):
+        """Run the detector on a list of image tensors"""
+        return self.backend.predict(image_tensors)
+
+    def predict(self, image_tensor):
+        """Return the raw detector prediction for a single image tensor"""
+        if self.batcher is not None:
+            return self.batcher.predict(image_tensor)
+        return self._forward([image_tensor])[0]
+
+    def cache_stats(self):
+        """Hit-rate metrics of the result cache, or None when caching is disabled"""
+        return self.result_cache.stats() if self.result_cache is not None else None
+
+    def metrics(self):
+        """Runtime metrics of the measurement pipeline"""
+        return {
+            'result_cache': self.cache_stats(),
+            'debug_writer': self.debug_writer.stats(),
+            'batcher': dict(self.batcher.stats) if self.batcher is not None else None,
+            'quality_rejections': dict(self.quality_rejections) if self.quality_gate is not None else None,
+        }
+
+    def check_quality(self, source, box=None):
+        """Retake response when the quality gate rejects the frame, otherwise None.
+
+        ``box`` is an optional full-resolution box (e.g. a tracked one) whose
+        size is checked instead of looking for an object in the frame.
+        """
+        if self.quality_gate is None:
+            return None
+        with stage('decode'):
+            small, (scale_x, scale_y) = source.reduced(self.detect_max_side)
+        with stage('quality_gate'):
+            if box is not None:
+                box = np.asarray(box, dtype=np.float64) / (scale_x, scale_y, scale_x, scale_y)
+            ok, reason, stats = self.quality_gate.check(small, box)
+        if ok:
+            return None
+        self.quality_rejections[reason] += 1
+        logger.info(f"Quality gate rejected frame: {reason}")
+        return self.quality_gate.rejection(reason, stats)
+
+    def warm_up(self, sizes=((480, 640), (720, 1280), (1080, 1920))):
+        """Run dummy inference at typical frame sizes.
+
+        The first forward passes at a new size are much slower than later
+        ones (lazy initialization, allocator growth), so pay that cost before
+        real requests arrive.
+        """
+        for height, width in sizes:
+            frame = np.zeros((height, width, 3), dtype=np.uint8)
+            small, _ = ImageSource(frame).reduced(self.detect_max_side)
+            self.predict(to_model_tensor(small))
+        logger.info(f"Warmed up RCNN at sizes {list(sizes)}")
+
+    @staticmethod
+    def _render_fill_debug(roi, contour, rect, fill_percentage):
+        """Draw the fill analysis on a copy of the ROI"""
+        x, y, w, h = rect
+        debug_img = roi.copy()
+        # Draw the contour in green
+        cv2.drawContours(debug_img, [contour], -1, (0, 255, 0), 2)
+        # Draw the bounding box in blue
+        cv2.rectangle(debug_img, (x, y), (x + w, y + h), (255, 0, 0), 2)
+        
+        # Add text showing fill percentage and dimensions
+        cv2.putText(debug_img, f"Fill: {fill_percentage:.1f}%", 
+                   (10, 30), cv2.FONT_HERSHEY_SIMPLEX, 1, (0, 255, 0), 2)
+        cv2.putText(debug_img, f"Size: {w}x{h}", 
+                   (10, 60), cv2.FONT_HERSHEY_SIMPLEX, 1, (0, 255, 0), 2)
+        return debug_img
+
+    @staticmethod
+    def _render_box_debug(image, box):
+        """Draw the detection box on a BGR copy of the frame"""
+        x1, y1, x2, y2 = map(int, box)
+        debug_image = cv2.cvtColor(image, cv2.COLOR_RGB2BGR)
+        cv2.rectangle(debug_image, (x1, y1), (x2, y2), (0, 255, 0), 2)
+        return debug_image
+
+    def calculate_fill_level(self, roi, container_type, debug_name=None):
+        """Calculate fill level using basic thresholding.
+
+        Grayscale, blur and threshold run in the calling thread's reusable
+        workspace buffers. A debug visualization is queued for the debug
+        writer only when ``debug_name`` is given.
+        """
         try:
-            # Convert to grayscale
-            gray = cv2.cvtColor(roi, cv2.COLOR_RGB2GRAY)
-            
-            # Apply Gaussian blur
-            blurred = cv2.GaussianBlur(gray, (5, 5), 0)
-            
-            # Apply adaptive thresholding
-            thresh = cv2.adaptiveThreshold(blurred, 255, cv2.ADAPTIVE_THRESH_GAUSSIAN_C, 
-                                         cv2.THRESH_BINARY_INV, 11, 2)
+            thresh = get_workspace().threshold(roi)
             
             # Find contours
             contours, _ = cv2.findContours(thresh, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
@@ -146,22 +251,11 @@ class RCNNMeasurementSystem:
             # Ensure fill percentage is between 0 and 100
             fill_percentage = max(0.0, min(100.0, fill_percentage))
             
-            # Save debug visualization
-            debug_img = roi.copy()
-            # Draw the contour in green
-            cv2.drawContours(debug_img, [largest_contour], -1, (0, 255, 0), 2)
-            # Draw the bounding box in blue
-            cv2.rectangle(debug_img, (x, y), (x + w, y + h), (255, 0, 0), 2)
-            
-            # Add text showing fill percentage and dimensions
-            cv2.putText(debug_img, f"Fill: {fill_percentage:.1f}%", 
-                       (10, 30), cv2.FONT_HERSHEY_SIMPLEX, 1, (0, 255, 0), 2)
-            cv2.putText(debug_img, f"Size: {w}x{h}", 
-                       (10, 60), cv2.FONT_HERSHEY_SIMPLEX, 1, (0, 255, 0), 2)
-            
-            # Save the debug image
-            debug_path = os.path.join('static', 'uploads', f'fill_debug_{os.path.basename(image_path)}')
-            cv2.imwrite(debug_path, debug_img)
+            if debug_name:
+                # Rendered and saved by the background debug writer
+                self.debug_writer.submit(
+                    f'fill_debug_{os.path.basename(debug_name)}',
+                    lambda: self._render_fill_debug(roi, largest_contour, (x, y, w, h), fill_percentage))
             
             logger.info(f"Fill level calculated: {fill_percentage:.1f}% for {container_type}")
             logger.info(f"Container dimensions: {w}x{h}, ROI size: {roi.shape}")
@@ -172,104 +266,253 @@ class RCNNMeasurementSystem:
             return 0.0
 
     def calculate_volume(self, container_type, fill_level):
-        """Calculate volume based on container type and fill level"""
+        """Calculate volume based on container type and fill level.
+
+        ``fill_level`` may be a single percentage or an array of them.
+        """
         try:
-            container_info = self.container_database[container_type]
-            
-            if container_info['shape'] == 'cylinder':
-                radius = container_info['diameter_cm'] / 2
-                height = container_info['height_cm']
-                volume = np.pi * radius * radius * height * (fill_level / 100)
-            else:  # hemisphere
-                radius = container_info['diameter_cm'] / 2
-                height = container_info['height_cm']
-                if fill_level <= 50:
-                    h = height * (fill_level / 100)
-                    volume = (np.pi * h * h * (3 * radius - h)) / 3
-                else:
-                    h = height * (1 - fill_level / 100)
-                    empty_volume = (np.pi * h * h * (3 * radius - h)) / 3
-                    total_volume = (2/3) * np.pi * radius * radius * radius
-                    volume = total_volume - empty_volume
-            
-            return volume
+            return self.volume_model.volume(container_type, fill_level)
         except Exception as e:
             logger.error(f"Error in calculate_volume: {str(e)}")
             return 0.0
 
-    def process_image(self, image_path, container_type, confidence_threshold=0.5):
-        """Process an image and return measurements"""
+    def _fill_roi(self, source, small, small_box, box, scale):
+        """Crop the container for fill analysis.
+
+        The reduced frame is used when the crop is large enough for the
+        thresholding to work; small containers are cut from the full image.
+        """
+        x1, y1, x2, y2 = map(int, small_box)
+        roi = small[y1:y2, x1:x2]
+        if min(roi.shape[:2]) >= self.fill_min_roi_side or scale == (1.0, 1.0):
+            return roi
+        x1, y1, x2, y2 = map(int, box)
+        return source.full()[y1:y2, x1:x2]
+
+    def _debug_name(self, source, debug_name, debug):
+        """Name for this frame's debug artifacts, or None when debug rendering is off.
+
+        An explicit ``debug`` flag wins; otherwise frames are sampled at the
+        writer's sample rate. ``debug_name`` (e.g. a stored upload) only
+        names the artifacts and never turns rendering on by itself.
+        """
+        if not self.debug_writer.should_render(debug):
+            return None
+        return os.path.basename(debug_name or source.name or f'{uuid.uuid4().hex}.jpg')
+
+    def detect(self, image, confidence_threshold=None):
+        """Run the detector on the reduced frame and return the best detection.
+
+        The returned ``box`` is in full-resolution coordinates and
+        ``small_box`` in the reduced frame; None when nothing scores above
+        ``confidence_threshold``.
+        """
+        detections = self.detect_all(image, confidence_threshold, max_detections=1)
+        if not detections:
+            logger.warning("No containers detected in image")
+            return None
+        return detections[0]
+
+    def detect_all(self, image, confidence_threshold=None, max_detections=None):
+        """Every detection above ``confidence_threshold`` from one forward pass, best first.
+
+        The threshold defaults to the engine's ``confidence_threshold``.
+        """
+        if confidence_threshold is None:
+            confidence_threshold = self.confidence_threshold
+        source = image if isinstance(image, ImageSource) else ImageSource(image)
+        
+        # Detect on a reduced copy; boxes are mapped back to full resolution
+        with stage('decode'):
+            small, (scale_x, scale_y) = source.reduced(self.detect_max_side)
+        with stage('to_tensor'):
+            image_tensor = to_model_tensor(small)
+        
+        # Make prediction, batched with concurrent requests when enabled
+        with stage('predict'):
+            prediction = self.predict(image_tensor)
+        
+        # Get predictions above threshold
+        boxes = prediction['boxes'].cpu().numpy()
+        scores = prediction['scores'].cpu().numpy()
+        labels = prediction['labels'].cpu().numpy()
+        
+        # Filter by confidence
+        mask = scores > confidence_threshold
+        boxes = boxes[mask]
+        scores = scores[mask]
+        labels = labels[mask]
+        
+        # Best first; map every box back to full resolution at once
+        order = np.argsort(-scores, kind='stable')[:max_detections]
+        full_boxes = boxes[order] * np.array([scale_x, scale_y, scale_x, scale_y], dtype=boxes.dtype)
+        return [
+            {
+                'box': full_box,
+                'small_box': boxes[idx],
+                'confidence': scores[idx],
+                'label': labels[idx],
+                'container_type': self.category_mapping[labels[idx]]
+            }
+            for idx, full_box in zip(order, full_boxes)
+        ]
+
+    def measure_box(self, image, container_type, box, debug_name=None):
+        """Fill level and volume of the container inside a full-resolution box.
+
+        Returns None when the box does not overlap the frame.
+        """
+        source = image if isinstance(image, ImageSource) else ImageSource(image)
+        small, (scale_x, scale_y) = source.reduced(self.detect_max_side)
+        
+        # Boxes carried over from an earlier frame may reach past this one
+        height, width = small.shape[:2]
+        scale = np.array([scale_x, scale_y, scale_x, scale_y], dtype=np.float32)
+        small_box = np.clip(np.asarray(box, dtype=np.float32) / scale, 0, [width, height, width, height])
+        box = small_box * scale
+        
+        # Calculate fill level
+        roi = self._fill_roi(source, small, small_box, box, (scale_x, scale_y))
+        
+        # Ensure ROI is not empty
+        if roi.size == 0:
+            logger.error("Empty ROI detected")
+            return None
+        
+        with stage('fill_level'):
+            fill_level = self.calculate_fill_level(roi, container_type, debug_name)
+        
+        # Calculate volume
+        with stage('volume'):
+            volume = self.calculate_volume(container_type, fill_level)
+        return {
+            'fill_level': fill_level,
+            'volume_ml': volume,
+            'box': box
+        }
+
+    def process_image(self, image, container_type, confidence_threshold=None, debug_name=None, debug=None):
+        """Process an image and return measurements.
+
+        ``image`` may be a file path, encoded image bytes, a PIL image or an
+        RGB NumPy array, so callers never need to round-trip through disk.
+        Debug images are rendered in the background when ``debug`` is True
+        or for a sampled share of frames, named after ``debug_name`` if given.
+        """
         try:
-            # Load and transform image
-            image = Image.open(image_path).convert("RGB")
-            image_tensor = F.to_tensor(image)
-            
-            # Make prediction
-            with torch.no_grad():
-                prediction = self.model([image_tensor])
-            
-            # Get predictions above threshold
-            boxes = prediction[0]['boxes'].cpu().numpy()
-            scores = prediction[0]['scores'].cpu().numpy()
-            labels = prediction[0]['labels'].cpu().numpy()
+            source = image if isinstance(image, ImageSource) else ImageSource(image)
+            debug_name = self._debug_name(source, debug_name, debug)
             
-            # Filter by confidence
-            mask = scores > confidence_threshold
-            boxes = boxes[mask]
-            scores = scores[mask]
-            labels = labels[mask]
-            
-            if len(boxes) == 0:
-                logger.warning("No containers detected in image")
+            detection = self.detect(source, confidence_threshold)
+            if detection is None:
                 return None
             
-            # Get the best prediction
-            best_idx = np.argmax(scores)
-            box = boxes[best_idx]
-            score = scores[best_idx]
-            label = labels[best_idx]
-            
-            # Convert PIL image to numpy array for OpenCV processing
-            image_np = np.array(image)
-            
-            # Calculate fill level
-            x1, y1, x2, y2 = map(int, box)
-            roi = image_np[y1:y2, x1:x2]
-            
-            # Ensure ROI is not empty
-            if roi.size == 0:
-                logger.error("Empty ROI detected")
+            measurement = self.measure_box(source, container_type, detection['box'], debug_name)
+            if measurement is None:
                 return None
-                
-            fill_level = self.calculate_fill_level(roi, container_type, image_path)
+            fill_level, volume = measurement['fill_level'], measurement['volume_ml']
             
-            # Calculate volume
-            volume = self.calculate_volume(container_type, fill_level)
-            
-            # Save debug image with bounding box
-            debug_image = image_np.copy()
-            cv2.rectangle(debug_image, (x1, y1), (x2, y2), (0, 255, 0), 2)
-            debug_path = os.path.join('static', 'uploads', f'debug_{os.path.basename(image_path)}')
-            cv2.imwrite(debug_path, cv2.cvtColor(debug_image, cv2.COLOR_RGB2BGR))
+            debug_url = None
+            if debug_name:
+                # Debug image with bounding box, drawn on the reduced frame
+                small, _ = source.reduced(self.detect_max_side)
+                debug_url = self.debug_writer.submit(
+                    f'debug_{os.path.basename(debug_name)}',
+                    lambda: self._render_box_debug(small, detection['small_box']))
             
             logger.info(f"Processed image: fill_level={fill_level:.1f}%, volume={volume:.1f}ml")
             
             return {
                 'fill_level': fill_level,
                 'volume_ml': volume,
-                'confidence': score,
-                'container_type': self.category_mapping[label],
-                'box': box,
-                'debug_image': f'/static/uploads/debug_{os.path.basename(image_path)}'
+                'confidence': detection['confidence'],
+                'container_type': detection['container_type'],
+                'box': detection['box'],
+                'debug_image': debug_url
             }
         except Exception as e:
             logger.error(f"Error in process_image: {str(e)}")
             return None
 
-    def get_measurement(self, image_path, container_type):
+    def measure_all(self, image, container_type=None, confidence_threshold=None, max_detections=10):
+        """Measure every detected container from a single forward pass.
+
+        Each detection's class decides its container type; ``container_type``
+        is used for classes that are not containers. Every ROI is
+        thresholded on its own, exactly as in single-object measurement, and
+        volumes are converted in one vectorized call.
+        """
+        source = image if isinstance(image, ImageSource) else ImageSource(image)
+        detections = self.detect_all(source, confidence_threshold, max_detections)
+        if not detections:
+            return []
+        
+        measurements = []
+        for detection in detections:
+            measured_type = container_for_label(detection['container_type'], container_type)
+            if measured_type not in self.volume_model:
+                continue
+            measurement = self.measure_box(source, measured_type, detection['box'])
+            if measurement is None:
+                continue
+            measurements.append({
+                'fill_level': measurement['fill_level'],
+                'confidence': float(detection['confidence']),
+                'label': detection['container_type'],
+                'container_type': measured_type,
+                'box': measurement['box']
+            })
+        
+        if measurements:
+            volumes = self.volume_model.volumes([m['container_type'] for m in measurements],
+                                                [m['fill_level'] for m in measurements])
+            for measurement, volume in zip(measurements, volumes):
+                measurement['volume_ml'] = float(volume)
+        
+        logger.info(f"Measured {len(measurements)} of {len(detections)} detections")
+        return measurements
+
+    def measure_frame(self, image, container_type, box=None, confidence_threshold=None):
+        """Measure one video frame, running the detector only when no box is given.
+
+        Streaming callers pass the box tracked from an earlier frame to skip
+        detection; ``detected`` in the result says whether the detector ran.
+        """
+        try:
+            source = image if isinstance(image, ImageSource) else ImageSource(image)
+            rejected = self.check_quality(source, box)
+            if rejected is not None:
+                return rejected
+            detection = None
+            if box is None:
+                detection = self.detect(source, confidence_threshold)
+                if detection is None:
+                    return None
+                box = detection['box']
+            
+            result = self.measure_box(source, container_type, box)
+            if result is None:
+                return None
+            result['detected'] = detection is not None
+            if detection is not None:
+                result['confidence'] = float(detection['confidence'])
+                result['container_type'] = detection['container_type']
+            return result
+        except Exception as e:
+            logger.error(f"Error in measure_frame: {str(e)}")
+            return None
+
+    def get_measurement(self, image, container_type, debug_name=None, debug=None):
         """Get measurement for a specific container type"""
         try:
-            result = self.process_image(image_path, container_type)
+            source = image if isinstance(image, ImageSource) else ImageSource(image)
+            rejected = self.check_quality(source)
+            if rejected is not None:
+                return {
+                    'error': rejected['message']
+                }
+            
+            result = self.process_image(source, container_type, debug_name=debug_name, debug=debug)
             
             if result is None:
                 return {
@@ -288,33 +531,157 @@ class RCNNMeasurementSystem:
                 'error': f'Error processing measurement: {str(e)}'
             }
 
-    def process_measurement(self, image_path, container_type, ingredient_type=None):
+    def process_measurement(self, image, container_type, ingredient_type=None, debug_name=None, debug=None):
         """Process measurement for real-time detection"""
         try:
+            source = image if isinstance(image, ImageSource) else ImageSource(image)
+            
+            # Ask for a retake instead of running the model on a hopeless frame
+            rejected = self.check_quality(source)
+            if rejected is not None:
+                return rejected
+            
+            # Decide on debug output once: a frame that is rendered (asked for
+            # or sampled) always runs so it gets its renderings
+            debug_name = self._debug_name(source, debug_name, debug)
+            
+            # Reuse the result of a recent, perceptually identical frame
+            phash = None
+            if self.result_cache is not None and debug_name is None:
+                with stage('decode'):
+                    small, _ = source.reduced(self.detect_max_side)
+                with stage('cache_lookup'):
+                    phash = dhash(small)
+                    cached = self.result_cache.get(phash, container_type)
+                if cached is not None:
+                    return dict(cached, cached=True)
+            
             # Process the image
-            result = self.process_image(image_path, container_type)
+            response = self.measure_response(source, container_type, debug_name=debug_name,
+                                             debug=debug_name is not None)
+            if phash is not None:
+                self.result_cache.put(phash, container_type, response)
+            return response
             
-            if result is None:
+        except Exception as e:
+            logger.error(f"Error in process_measurement: {str(e)}")
+            return {
+                'success': False,
+                'message': f'Error processing measurement: {str(e)}'
+            }
+
+    def measure_response(self, source, container_type, debug_name=None, debug=None):
+        """Measurement response for a frame, without the quality gate or the result cache.
+
+        For callers that already ran both, such as the cascade engine.
+        """
+        result = self.process_image(source, container_type, debug_name=debug_name, debug=debug)
+        if result is None:
+            return {
+                'success': False,
+                'message': 'No container detected in image'
+            }
+        
+        # Format the result
+        return {
+            'success': True,
+            'fill_level': result['fill_level'],  # Remove formatting here
+            'volume': f"{result['volume_ml']:.1f}ml",
+            'volume_ml': float(result['volume_ml']),
+            'confidence': f"{result['confidence']:.2f}",
+            'container_type': result['container_type'],
+            'debug_image': result['debug_image']
+        }
+
+    def process_measurements(self, image, container_type=None, ingredient_type=None, confidence_threshold=None):
+        """Process every container in the image for multi-object measurement"""
+        try:
+            source = image if isinstance(image, ImageSource) else ImageSource(image)
+            rejected = self.check_quality(source)
+            if rejected is not None:
+                return rejected
+            
+            measurements = self.measure_all(source, container_type, confidence_threshold)
+            
+            if not measurements:
                 return {
                     'success': False,
                     'message': 'No container detected in image'
                 }
             
-            # Format the result
-            response = {
+            return {
                 'success': True,
-                'fill_level': result['fill_level'],  # Remove formatting here
-                'volume': f"{result['volume_ml']:.1f}ml",
-                'confidence': f"{result['confidence']:.2f}",
-                'container_type': result['container_type'],
-                'debug_image': result['debug_image']
+                'count': len(measurements),
+                'total_volume_ml': sum(m['volume_ml'] for m in measurements),
+                'containers': [
+                    {
+                        'fill_level': m['fill_level'],
+                        'volume': f"{m['volume_ml']:.1f}ml",
+                        'volume_ml': m['volume_ml'],
+                        'confidence': f"{m['confidence']:.2f}",
+                        'container_type': m['container_type'],
+                        'label': m['label'],
+                        'box': [round(float(v), 1) for v in m['box']]
+                    }
+                    for m in measurements
+                ]
             }
             
-            return response
-            
         except Exception as e:
-            logger.error(f"Error in process_measurement: {str(e)}")
+            logger.error(f"Error in process_measurements: {str(e)}")
             return {
                 'success': False,
-                'message': f'Error processing measurement: {str(e)}'
-            } 
\ No newline at end of file
+                'message': f'Error processing measurements: {str(e)}'
+            }
+
+
+def rcnn_options_from_env():
+    """Read RCNNMeasurementSystem options from the deployment environment"""
+    options = {
+        # Concurrent requests are micro-batched into shared forward passes
+        'max_batch_size': int(os.getenv('RCNN_MAX_BATCH_SIZE', '4')),
+        'max_batch_wait_ms': float(os.getenv('RCNN_MAX_BATCH_WAIT_MS', '5')),
+        # Runtime: eager, torchscript, onnx or int8; non-eager runtimes are
+        # checked against eager on the images in RCNN_PARITY_IMAGE_DIR if set
+        'backend': os.getenv('RCNN_BACKEND', 'eager'),
+        # Resolution used for detection (0 disables reduced decoding)
+        'detect_max_side': int(os.getenv('RCNN_DETECT_MAX_SIDE', '1333')),
+        'fill_min_roi_side': int(os.getenv('RCNN_FILL_MIN_ROI_SIDE', '128')),
+        # Perceptual-hash result cache for repeated frames; opt-in (0 disables
+        # it) until its false-hit rate has been measured on real captures
+        'cache_size': int(os.getenv('RCNN_CACHE_SIZE', '0')),
+        'cache_ttl_seconds': float(os.getenv('RCNN_CACHE_TTL_SECONDS', '30')),
+        'cache_max_distance': int(os.getenv('RCNN_CACHE_MAX_DISTANCE', '0')),
+        # Share of frames that get debug renderings unless the request decides
+        'debug_sample_rate': float(os.getenv('RCNN_DEBUG_SAMPLE_RATE', '0')),
+        'debug_queue_size': int(os.getenv('RCNN_DEBUG_QUEUE_SIZE', '32')),
+        # Reject blurry, dark, overexposed or empty frames before detection;
+        # opt-in until the thresholds have been calibrated on real captures
+        'quality_gate': os.getenv('RCNN_QUALITY_GATE', 'false').lower() in ('1', 'true', 'yes'),
+    }
+    if options['backend'] == 'int8':
+        options['backend_options'] = {
+            'mode': os.getenv('RCNN_QUANT_MODE', 'dynamic'),
+            'calibration_dir': os.getenv('RCNN_QUANT_CALIBRATION_DIR'),
+        }
+    return options
+
+
+def create_measurement_system(checkpoint_path, **options):
+    """Build an RCNNMeasurementSystem, falling back to the default model if the checkpoint is unusable.
+
+    A checkpoint that fails its integrity check raises IntegrityError instead.
+    """
+    try:
+        if not checkpoint_path or not os.path.exists(checkpoint_path):
+            logger.warning(f"No checkpoint found at {checkpoint_path}. Using default model.")
+            return RCNNMeasurementSystem(**options)
+        logger.info(f"Loading checkpoint from {checkpoint_path}")
+        return RCNNMeasurementSystem(checkpoint_path, **options)
+    except IntegrityError:
+        # Never swap a tampered or corrupt checkpoint for an untrained model
+        raise
+    except Exception as e:
+        logger.error(f"Error initializing RCNN: {e}")
+        logger.info("Initializing RCNN with default model")
+        return RCNNMeasurementSystem(**options)
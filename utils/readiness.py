@@ -0,0 +1,78 @@
+"""
+Readiness state machine for model loading and warm-up
+"""
+
+import time
+import threading
+import logging
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+PENDING = 'pending'
+DOWNLOADING = 'downloading'
+LOADING = 'loading'
+WARMING_UP = 'warming_up'
+READY = 'ready'
+FAILED = 'failed'
+
+# Allowed transitions; FAILED can go back to DOWNLOADING when loading is retried
+TRANSITIONS = {
+    PENDING: (DOWNLOADING, LOADING, FAILED),
+    DOWNLOADING: (LOADING, FAILED),
+    LOADING: (WARMING_UP, READY, FAILED),
+    WARMING_UP: (READY, FAILED),
+    READY: (),
+    FAILED: (DOWNLOADING, LOADING),
+}
+
+
+class ModelReadiness:
+    def __init__(self):
+        """Track where the model is in its download -> load -> warm-up lifecycle"""
+        self.state = PENDING
+        self.error = None
+        self.started = time.time()
+        self.history = [(PENDING, self.started)]
+        self._lock = threading.Lock()
+
+    def transition(self, state, error=None):
+        with self._lock:
+            if state not in TRANSITIONS[self.state]:
+                raise ValueError(f"Invalid readiness transition: {self.state} -> {state}")
+            self.state = state
+            self.error = error
+            self.history.append((state, time.time()))
+        if state == FAILED:
+            logger.error(f"Model readiness failed: {error}")
+        else:
+            logger.info(f"Model readiness: {state}")
+
+    @contextmanager
+    def stage(self, state):
+        """Enter ``state`` for the duration of a block; errors move to FAILED"""
+        self.transition(state)
+        try:
+            yield
+        except Exception as e:
+            self.transition(FAILED, error=str(e))
+            raise
+
+    @property
+    def is_ready(self):
+        return self.state == READY
+
+    def snapshot(self):
+        """JSON-friendly view of the current state and time spent in each stage"""
+        with self._lock:
+            history = list(self.history)
+            state, error = self.state, self.error
+        durations = {}
+        for (name, entered), (_, left) in zip(history, history[1:] + [(None, time.time())]):
+            durations[name] = round(durations.get(name, 0.0) + left - entered, 3)
+        return {
+            'state': state,
+            'ready': state == READY,
+            'error': error,
+            'seconds_in_state': durations,
+        }
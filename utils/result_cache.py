@@ -0,0 +1,108 @@
+"""
+Perceptual-hash cache for measurement results of near-identical frames
+"""
+
+import time
+import threading
+import logging
+from collections import OrderedDict
+import numpy as np
+import cv2
+
+logger = logging.getLogger(__name__)
+
+
+def dhash(image: np.ndarray, hash_size: int = 8) -> int:
+    """Difference hash of an RGB (or grayscale) image as a hash_size**2-bit integer.
+
+    Small changes in lighting, JPEG noise or resolution leave most bits
+    unchanged, so similar frames have a small Hamming distance.
+    """
+    gray = image if image.ndim == 2 else cv2.cvtColor(image, cv2.COLOR_RGB2GRAY)
+    resized = cv2.resize(gray, (hash_size + 1, hash_size), interpolation=cv2.INTER_AREA)
+    bits = resized[:, 1:] > resized[:, :-1]
+    return int.from_bytes(np.packbits(bits).tobytes(), 'big')
+
+
+class MeasurementCache:
+    def __init__(self, max_entries=256, ttl_seconds=30.0, max_distance=0):
+        """Bounded LRU cache with expiry, keyed on (container_type, perceptual hash).
+
+        A lookup matches any entry for the same container whose hash is
+        within ``max_distance`` bits of the query. The hash covers the whole
+        frame, so a different fill level in a small container can move it
+        by only a bit or two; keep ``max_distance`` at 0 (exact matches)
+        unless near matches were checked on real captures.
+        """
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.max_distance = max_distance
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._counters = {'hits': 0, 'near_hits': 0, 'misses': 0, 'evictions': 0, 'expirations': 0}
+
+    def _expired(self, stored_at, now):
+        return self.ttl_seconds is not None and now - stored_at > self.ttl_seconds
+
+    def get(self, phash, container_type):
+        """Return the cached result for a matching frame, or None"""
+        now = time.monotonic()
+        with self._lock:
+            key = (container_type, phash)
+            entry = self._entries.get(key)
+            if entry is not None and self._expired(entry[1], now):
+                del self._entries[key]
+                self._counters['expirations'] += 1
+                entry = None
+            if entry is not None:
+                self._entries.move_to_end(key)
+                self._counters['hits'] += 1
+                return entry[0]
+
+            # No exact match; look for a near-duplicate frame
+            if self.max_distance <= 0:
+                self._counters['misses'] += 1
+                return None
+            best_key, best_distance = None, self.max_distance + 1
+            for (cached_container, cached_hash), (_, stored_at) in list(self._entries.items()):
+                if cached_container != container_type:
+                    continue
+                if self._expired(stored_at, now):
+                    del self._entries[(cached_container, cached_hash)]
+                    self._counters['expirations'] += 1
+                    continue
+                distance = (cached_hash ^ phash).bit_count()
+                if distance < best_distance:
+                    best_key, best_distance = (cached_container, cached_hash), distance
+            if best_key is None:
+                self._counters['misses'] += 1
+                return None
+            self._entries.move_to_end(best_key)
+            self._counters['near_hits'] += 1
+            return self._entries[best_key][0]
+
+    def put(self, phash, container_type, result):
+        if result.get('debug_image'):
+            # Debug renderings belong to the request that asked for them
+            result = dict(result, debug_image=None)
+        with self._lock:
+            self._entries[(container_type, phash)] = (result, time.monotonic())
+            self._entries.move_to_end((container_type, phash))
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self._counters['evictions'] += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        """Hit-rate metrics; near_hits are matches within max_distance bits"""
+        with self._lock:
+            stats = dict(self._counters)
+            stats['size'] = len(self._entries)
+        lookups = stats['hits'] + stats['near_hits'] + stats['misses']
+        stats['hit_rate'] = (stats['hits'] + stats['near_hits']) / lookups if lookups else 0.0
+        stats['max_entries'] = self.max_entries
+        stats['ttl_seconds'] = self.ttl_seconds
+        return stats
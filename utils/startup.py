@@ -0,0 +1,57 @@
+"""
+Startup time accounting for the web app
+"""
+
+import time
+import threading
+import logging
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+
+class StartupProfiler:
+    def __init__(self, budget_seconds=5.0, started=None):
+        """Track how long each startup phase takes against an overall budget.
+
+        ``started`` is a time.perf_counter() value taken as early as possible
+        in the importing module, so import time is included in the total.
+        """
+        self.budget_seconds = budget_seconds
+        self.started = started if started is not None else time.perf_counter()
+        self.phases = {}
+        self._lock = threading.Lock()
+
+    def record(self, name, seconds):
+        with self._lock:
+            self.phases[name] = self.phases.get(name, 0.0) + seconds
+
+    @contextmanager
+    def phase(self, name):
+        """Time a block of startup work"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(name, time.perf_counter() - start)
+
+    def summary(self):
+        with self._lock:
+            phases = {name: round(seconds, 3) for name, seconds in self.phases.items()}
+        return {
+            'budget_seconds': self.budget_seconds,
+            'phases': phases,
+        }
+
+    def report(self, label='Startup'):
+        """Log time spent per phase and warn when the budget is exceeded"""
+        elapsed = time.perf_counter() - self.started
+        with self._lock:
+            phases = sorted(self.phases.items(), key=lambda item: item[1], reverse=True)
+        breakdown = ', '.join(f"{name}={seconds:.2f}s" for name, seconds in phases)
+        message = f"{label} took {elapsed:.2f}s of {self.budget_seconds:.1f}s budget ({breakdown})"
+        if elapsed > self.budget_seconds:
+            logger.warning(message)
+        else:
+            logger.info(message)
+        return elapsed
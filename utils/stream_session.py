@@ -0,0 +1,252 @@
+"""
+Live measurement sessions for streamed webcam frames
+"""
+
+import time
+import uuid
+import threading
+import logging
+from .admission import Saturated
+
+logger = logging.getLogger(__name__)
+
+
+class StreamSession:
+    def __init__(self, measure_frame, container_type, detect_every=10, smoothing=0.3, idle_timeout=60.0):
+        """Measure a stream of encoded frames on a background thread.
+
+        Only the newest frame is kept: frames that arrive while the previous
+        one is still being measured replace it and are counted as dropped.
+        The detector runs on the first frame and then every ``detect_every``
+        frames; in between the tracked box is reused. Fill level and volume
+        are smoothed with an exponential moving average (``smoothing`` is
+        the weight of the newest reading).
+
+        ``measure_frame(frame, container_type, box)`` is typically
+        RCNNMeasurementSystem.measure_frame. It returns None when nothing
+        was found, or a result with ``retake`` set when the frame was
+        rejected as unusable (blurry, dark, ...); such frames are skipped
+        without losing the tracked box, except when the tracked box itself
+        is rejected as too small, which triggers a fresh detection.
+        """
+        self.id = uuid.uuid4().hex
+        self.container_type = container_type
+        self.detect_every = max(1, detect_every)
+        self.smoothing = smoothing
+        self.idle_timeout = idle_timeout
+        self._measure_frame = measure_frame
+        self._condition = threading.Condition()
+        self._frame = None
+        self._reading = None
+        self._seq = 0
+        self._track = None
+        self._since_detect = 0
+        self._smoothed = None
+        self._counters = {'received': 0, 'processed': 0, 'dropped': 0, 'detections': 0, 'busy': 0, 'rejected': 0}
+        self.closed = False
+        self.last_active = time.monotonic()
+        self._thread = threading.Thread(target=self._run, name=f'stream-{self.id[:8]}', daemon=True)
+        self._thread.start()
+
+    def offer(self, frame):
+        """Queue an encoded frame, replacing any frame not yet measured"""
+        with self._condition:
+            if self.closed:
+                return False
+            if self._frame is not None:
+                self._counters['dropped'] += 1
+            self._frame = (frame, time.monotonic())
+            self._counters['received'] += 1
+            self.last_active = time.monotonic()
+            self._condition.notify_all()
+        return True
+
+    def latest(self):
+        with self._condition:
+            return self._reading
+
+    def wait_for_reading(self, after_seq=0, timeout=15.0):
+        """Block until a reading newer than ``after_seq`` exists; None on timeout or close"""
+        with self._condition:
+            self._condition.wait_for(
+                lambda: self.closed or (self._reading is not None and self._reading['seq'] > after_seq),
+                timeout=timeout)
+            if self._reading is not None and self._reading['seq'] > after_seq:
+                return self._reading
+            return None
+
+    def stats(self):
+        with self._condition:
+            stats = dict(self._counters)
+        stats['detect_every'] = self.detect_every
+        return stats
+
+    def close(self):
+        with self._condition:
+            self.closed = True
+            self._frame = None
+            self._condition.notify_all()
+
+    def is_idle(self, now=None):
+        now = time.monotonic() if now is None else now
+        return now - self.last_active > self.idle_timeout
+
+    def _smooth(self, result):
+        """Exponential moving average of fill level and volume"""
+        current = {'fill_level': float(result['fill_level']), 'volume_ml': float(result['volume_ml'])}
+        if self._smoothed is None:
+            self._smoothed = current
+        else:
+            alpha = self.smoothing
+            self._smoothed = {
+                key: alpha * value + (1 - alpha) * self._smoothed[key]
+                for key, value in current.items()
+            }
+        return self._smoothed
+
+    def _measure(self, frame):
+        """Measure a frame with the tracked box, falling back to detection"""
+        box = None
+        if self._track is not None and self._since_detect < self.detect_every:
+            box = self._track['box']
+        result = self._measure_frame(frame, self.container_type, box)
+        if box is not None and (result is None or result.get('reason') == 'tiny'):
+            # Lost the container, or the tracked box is too small to measure
+            # (it may be stale once the user moves closer); drop the track
+            # and detect again on this frame
+            self._track = None
+            result = self._measure_frame(frame, self.container_type, None)
+        return result
+
+    def _run(self):
+        while True:
+            with self._condition:
+                self._condition.wait_for(lambda: self.closed or self._frame is not None)
+                if self.closed:
+                    return
+                frame, received_at = self._frame
+                self._frame = None
+
+            busy = False
+            try:
+                result = self._measure(frame)
+            except Saturated:
+                # The server is at capacity; skip this frame but keep tracking
+                busy, result = True, None
+            except Exception as e:
+                logger.error(f"Error measuring stream frame: {e}")
+                result = None
+
+            if busy:
+                counter = 'busy'
+                reading = {
+                    'success': False,
+                    'message': 'Server busy, frame skipped'
+                }
+            elif result is not None and result.get('retake'):
+                counter = 'rejected'
+                reading = {
+                    'success': False,
+                    'retake': True,
+                    'message': result['message']
+                }
+            elif result is None:
+                # Nothing to track; start over with a fresh detection and average
+                counter = None
+                self._track, self._smoothed = None, None
+                reading = {
+                    'success': False,
+                    'message': 'No container detected in frame'
+                }
+            else:
+                counter = None
+                if result.get('detected'):
+                    self._track = {'confidence': result['confidence'], 'container_type': result['container_type']}
+                    self._since_detect = 0
+                    counter = 'detections'
+                self._track['box'] = result['box']
+                self._since_detect += 1
+                smoothed = self._smooth(result)
+                reading = {
+                    'success': True,
+                    'fill_level': round(smoothed['fill_level'], 1),
+                    'volume_ml': round(smoothed['volume_ml'], 1),
+                    'raw_fill_level': round(float(result['fill_level']), 1),
+                    'confidence': round(float(self._track['confidence']), 2),
+                    'container_type': self._track['container_type'],
+                    'box': [round(float(v), 1) for v in result['box']] if result['box'] is not None else None,
+                    'detected': bool(result.get('detected'))
+                }
+
+            # Counters are read by stats() from request threads
+            with self._condition:
+                if counter is not None:
+                    self._counters[counter] += 1
+                self._counters['processed'] += 1
+                self._seq += 1
+                reading.update(
+                    seq=self._seq,
+                    latency_ms=round((time.monotonic() - received_at) * 1000, 1),
+                    dropped=self._counters['dropped'])
+                self._reading = reading
+                self._condition.notify_all()
+
+
+class StreamManager:
+    def __init__(self, max_sessions=4, idle_timeout=60.0, sweep_interval=None):
+        """Registry of live sessions.
+
+        Idle sessions are closed on the next access and by a sweeper thread
+        that runs every ``sweep_interval`` seconds (half the idle timeout by
+        default) once the first session has started.
+        """
+        self.max_sessions = max_sessions
+        self.idle_timeout = idle_timeout
+        self.sweep_interval = sweep_interval or idle_timeout / 2
+        self._sessions = {}
+        self._lock = threading.Lock()
+        self._sweeper = None
+
+    def _sweep(self):
+        now = time.monotonic()
+        for session_id, session in list(self._sessions.items()):
+            if session.closed or session.is_idle(now):
+                session.close()
+                del self._sessions[session_id]
+                logger.info(f"Closed stream session {session_id}")
+
+    def create(self, measure_frame, container_type, **options):
+        """Start a session, or return None when all slots are taken"""
+        with self._lock:
+            self._sweep()
+            if len(self._sessions) >= self.max_sessions:
+                return None
+            session = StreamSession(measure_frame, container_type, idle_timeout=self.idle_timeout, **options)
+            self._sessions[session.id] = session
+            if self._sweeper is None:
+                self._sweeper = threading.Thread(target=self._run_sweeper, name='stream-sweeper', daemon=True)
+                self._sweeper.start()
+        logger.info(f"Started stream session {session.id} for {container_type}")
+        return session
+
+    def _run_sweeper(self):
+        while True:
+            time.sleep(self.sweep_interval)
+            with self._lock:
+                self._sweep()
+
+    def get(self, session_id):
+        with self._lock:
+            self._sweep()
+            return self._sessions.get(session_id)
+
+    def close(self, session_id):
+        with self._lock:
+            session = self._sessions.pop(session_id, None)
+        if session is not None:
+            session.close()
+        return session is not None
+
+    def stats(self):
+        with self._lock:
+            return {session_id: session.stats() for session_id, session in self._sessions.items()}
@@ -0,0 +1,144 @@
+"""
+Content-addressed storage for uploaded photos and their debug renderings
+"""
+
+import os
+import time
+import hashlib
+import argparse
+import threading
+import logging
+from .atomic_file import atomic_write
+
+logger = logging.getLogger(__name__)
+
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.webp', '.bmp')
+
+
+class UploadStore:
+    def __init__(self, root=os.path.join('static', 'uploads'), max_age_seconds=3 * 24 * 3600,
+                 max_bytes=1024 * 1024 * 1024, sweep_interval=600.0):
+        """Uploads named by their content hash, with age and size bounded eviction.
+
+        Identical uploads map to the same file, which is written once and
+        only has its mtime refreshed afterwards. Files are written to a
+        temporary name and renamed into place, so concurrent requests never
+        see half-written or colliding files. The sweeper removes every file
+        in ``root`` (uploads and debug renderings alike) older than
+        ``max_age_seconds``, then the oldest ones until the directory is
+        under ``max_bytes``.
+        """
+        self.root = root
+        self.max_age_seconds = max_age_seconds
+        self.max_bytes = max_bytes
+        self.sweep_interval = sweep_interval
+        self._lock = threading.Lock()
+        self._counters = {'stored': 0, 'deduplicated': 0, 'evicted': 0, 'evicted_bytes': 0}
+        self._sweeper = None
+        os.makedirs(root, exist_ok=True)
+
+    @staticmethod
+    def name_for(data, filename=None):
+        """Collision-free file name derived from the content and the original extension"""
+        ext = os.path.splitext(filename or '')[1].lower()
+        if ext not in IMAGE_EXTENSIONS:
+            # Never serve an upload under an extension the browser would execute
+            ext = '.jpg'
+        return hashlib.sha256(data).hexdigest()[:32] + ext
+
+    def path(self, name):
+        return os.path.join(self.root, name)
+
+    def url(self, name):
+        return '/' + self.path(name).replace(os.sep, '/')
+
+    def put(self, data, filename=None):
+        """Store ``data`` and return its name; an identical upload is stored only once"""
+        name = self.name_for(data, filename)
+        path = self.path(name)
+        try:
+            # Refresh the age of an existing copy so the sweeper keeps it
+            os.utime(path)
+            self._count('deduplicated')
+            return name
+        except FileNotFoundError:
+            pass
+
+        with atomic_write(path, 'wb') as f:
+            f.write(data)
+        self._count('stored')
+        return name
+
+    def sweep(self, now=None):
+        """Evict expired files, then the oldest until the size bound holds; returns files removed"""
+        now = now or time.time()
+        files = []
+        with os.scandir(self.root) as entries:
+            for entry in entries:
+                try:
+                    if entry.is_file():
+                        stat = entry.stat()
+                        files.append((stat.st_mtime, stat.st_size, entry.path))
+                except FileNotFoundError:
+                    continue
+
+        files.sort()
+        total = sum(size for _, size, _ in files)
+        removed = 0
+        for mtime, size, path in files:
+            if now - mtime <= self.max_age_seconds and total <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+                removed += 1
+                with self._lock:
+                    self._counters['evicted'] += 1
+                    self._counters['evicted_bytes'] += size
+            except FileNotFoundError:
+                # Another worker's sweeper got there first
+                pass
+            total -= size
+        if removed:
+            logger.info(f"Evicted {removed} files from {self.root}")
+        return removed
+
+    def start_sweeper(self):
+        """Sweep every ``sweep_interval`` seconds on a daemon thread"""
+        if self._sweeper is None:
+            self._sweeper = threading.Thread(target=self._run_sweeper, name='upload-sweeper', daemon=True)
+            self._sweeper.start()
+
+    def _run_sweeper(self):
+        while True:
+            try:
+                self.sweep()
+            except Exception as e:
+                logger.error(f"Error sweeping uploads: {e}")
+            time.sleep(self.sweep_interval)
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._counters)
+        stats.update(max_age_seconds=self.max_age_seconds, max_bytes=self.max_bytes)
+        return stats
+
+    def _count(self, name):
+        with self._lock:
+            self._counters[name] += 1
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Evict old uploads and debug images')
+    parser.add_argument('--root', default=os.path.join('static', 'uploads'))
+    parser.add_argument('--max-age-hours', type=float, default=72)
+    parser.add_argument('--max-mb', type=float, default=1024)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    store = UploadStore(args.root, max_age_seconds=args.max_age_hours * 3600,
+                        max_bytes=int(args.max_mb * 1024 * 1024))
+    print(f"Removed {store.sweep()} files")
+
+
+if __name__ == '__main__':
+    main()